@@ -12,8 +12,13 @@
     Author: Phil Owen, 10/19/2022
 """
 import sys
+import signal
 import argparse
 from src.archiver.archiver import APSVizArchiver
+from src.archiver.scheduler import ArchiverDaemon
+from src.archiver.event_listener import RunEventListener
+from src.archiver.queue_worker import QueueWorker
+from src.common.slack_notifier import SlackNotifier
 # from src.test.test_geoserver_ops import create_test_dirs
 
 
@@ -35,10 +40,61 @@ def run_rule_file(rule_file: str) -> bool:
     # initiate the archiver. return value of True indicates success
     retval: bool = archiver.run()
 
+    # wait for the queued slack messages to go out
+    SlackNotifier.get().flush()
+
     # return to the caller. invert the return for a proper sys exit code
     return not retval
 
 
+def run_daemon(rule_file: str, listen: bool = False) -> bool:
+    """
+    Runs rule files on their schedules until the process is signaled to stop.
+
+    :param rule_file
+    :param listen: also run the rules on the instances in run events
+    :return:
+    """
+    # create the daemon
+    daemon = ArchiverDaemon(rule_file, listener=RunEventListener() if listen else None)
+
+    # stop after the current run on a termination signal
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: daemon.stop())
+
+    # run the rule files
+    daemon.run_forever()
+
+    # wait for the queued slack messages to go out
+    SlackNotifier.get().flush()
+
+    # return to the caller. a stop is a proper exit
+    return False
+
+
+def run_worker() -> bool:
+    """
+    Runs work queue tasks until the queue is empty or the process is signaled to stop.
+
+    :return:
+    """
+    # create the worker
+    worker = QueueWorker()
+
+    # stop after the current task on a termination signal
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+
+    # run the tasks
+    stats: dict = worker.run()
+
+    # wait for the queued slack messages to go out
+    SlackNotifier.get().flush()
+
+    # return to the caller. a failed task is retried by another worker, but is still reported in the exit code
+    return stats['failed'] > 0
+
+
 if __name__ == '__main__':
     # main entry point for the rule run.
     # input argument can be a singleton or a comma seperated list
@@ -49,6 +105,15 @@ if __name__ == '__main__':
     # assign the expected input arg
     parser.add_argument('-f', '--filename', help='Input can be a singleton or a comma seperated list of file names ')
 
+    # assign the daemon mode arg
+    parser.add_argument('-d', '--daemon', action='store_true', help='Keep running and run each rule file on its schedule')
+
+    # assign the run event arg
+    parser.add_argument('-l', '--listen', action='store_true', help='In daemon mode, also run the rules on the instances in DB run events')
+
+    # assign the work queue worker arg
+    parser.add_argument('-w', '--worker', action='store_true', help='Run the tasks of the work queue instead of rule files')
+
     # parse the command line
     args = parser.parse_args()
 
@@ -58,7 +123,12 @@ if __name__ == '__main__':
     # './src/test/test_files/test_geoserver_remove_rule.json'
 
     # execute the rule file(s)
-    ret_val: bool = run_rule_file(args.filename)
+    if args.worker:
+        ret_val: bool = run_worker()
+    elif args.daemon:
+        ret_val: bool = run_daemon(args.filename, args.listen)
+    else:
+        ret_val: bool = run_rule_file(args.filename)
     # ret_val: bool = run_rule_file('test/test_files/test_criteria.rules2.json')
 
     # exit with pass/fail
@@ -12,14 +12,18 @@
     Author: Phil Owen, 10/19/2022
 """
 
+import os
 import datetime
 import logging
 
 from src.archiver.rule_handler import RuleHandler
+from src.archiver.preflight import PreflightChecker
 from src.common.logger import LoggingUtil
 from src.common.rule_utils import RuleUtils
 from src.common.general_utils import GeneralUtils
-from src.common.geoserver_utils import GeoServerUtils
+from src.common.circuit_breaker import CircuitBreaker
+from src.common.shard import ShardSelector
+from src.common.time_budget import TimeBudget
 
 
 class APSVizArchiver:
@@ -48,15 +52,7 @@ class APSVizArchiver:
         else:
             self.debug = True
 
-        # grab a reference to the GeoServer utils class
-        self.geo_utils = GeoServerUtils(self.logger)
-
-        # grab a reference to the data handlers
-        self.data_handlers = [{'data_name': 'GeoServer', 'data_handler': GeoServerUtils(self.logger)},
-                              # {'data_name': 'TDS', 'data_handler': ThreddsTools(self.logger)}
-                              ]
-
-        # grab a reference to the thredds tools
+        # grab a reference to the rule handler. the geoserver utilities (and their DB connections) are created on first use
         self.rule_handler = RuleHandler(self.logger)
 
         # get a reference to the rule util tools
@@ -65,6 +61,9 @@ class APSVizArchiver:
         # get a reference to the general util tools
         self.general_utils = GeneralUtils(self.logger)
 
+        # get a reference to the dependency checker
+        self.preflight = PreflightChecker(self.logger, self.debug)
+
         # save the file path entered
         self.test_files = test_file.split(',')
 
@@ -77,58 +76,154 @@ class APSVizArchiver:
         # init the return value
         ret_val: bool = False
 
-        # init rule definition details
-        rule_def_name: dict = {}
-        rule_def_version: dict = {}
-
         try:
             # for each rule definition file
             for infile in self.test_files:
-                # get the rule configurations
-                rule_defs: dict = self.general_utils.load_rule_definition_file(infile)
+                # process the rule definition file
+                ret_val = self.run_rule_file(infile) or ret_val
+        except Exception:
+            self.logger.exception('Exception detected in APSViz Archiver.')
+
+        # return to the caller
+        return ret_val
+
+    def run_rule_file(self, infile: str) -> bool:
+        """
+        Processes a rule definition file.
 
-                # get the name/version of the rule definition
-                rule_def_name = rule_defs['rule_definition_name']
-                rule_def_version = rule_defs['rule_definition_version']
+        :param infile:
+        :return: True if a rule set succeeded
+        """
+        # init the return value
+        ret_val: bool = False
 
-                self.logger.info('<---------- New Run: %s ---------->', infile)
+        # get the rule configurations
+        rule_defs: dict = self.general_utils.load_rule_definition_file(infile)
 
-                # create a start message
-                start_msg = f'APSViz Archiver start. Name: {rule_def_name}, Version: {rule_def_version}'
+        # get the name/version of the rule definition
+        rule_def_name = rule_defs['rule_definition_name']
+        rule_def_version = rule_defs['rule_definition_version']
 
-                # send/log the start message
-                self.general_utils.send_slack_msg(start_msg, 'slack_status_channel', self.debug)
+        self.logger.info('<---------- New Run: %s ---------->', infile)
 
-                # process the rule set
-                for rule_set in rule_defs['rule_sets']:
-                    # execute the rule set
-                    run_stats = self.rule_handler.process_rule_set(rule_set)
+        # check the dependencies of the rules before any work starts
+        passed, report = self.preflight.run_checks(rule_defs)
 
-                    # no failures get a short message
-                    if run_stats['failed'] == 0:
-                        # create a success message
-                        final_msg = f"Rule set {rule_set['rule_set_name']} Status: {len(rule_set['rules'])} rule(s) succeeded."
+        # skip this rule definition if a dependency is not available
+        if not passed:
+            # send/log the failures
+            self.general_utils.send_slack_msg(f"Pre-flight checks failed for {rule_def_name}: "
+                                              f"{'; '.join(line for line in report if 'FAILED' in line)}", 'slack_issues_channel', self.debug)
 
-                        # set the success flag
-                        ret_val = True
-                    else:
-                        # show all results on failure
-                        final_msg = f"Rule set {rule_set['rule_set_name']} Status: Failures detected - {len(rule_set['rules'])} rule(s) in set, " \
-                                    f"{run_stats['failed']} failed rule(s)."
+            self.logger.info('<---------- Run aborted: %s ---------->\n', infile)
 
-                        # show all results on failure
-                        status_msg = f"Status: Failures detected - {len(rule_set['rules'])} rule(s) in set, {run_stats['moved']} Move rule(s), " \
-                                     f"{run_stats['copied']} copy rule(s), {run_stats['removed']} remove rule(s), " \
-                                     f"{run_stats['swept']} sweep rule(s), {run_stats['failed']} failed rule(s)."
+            # return to the caller
+            return ret_val
 
-                        self.logger.info("APSVix-Archiver Rule set %s complete. Run %s", rule_set['rule_set_name'], status_msg)
+        self.logger.info('APSViz Archiver start. Name: %s, Version: %s', rule_def_name, rule_def_version)
 
-                    # send out a slack of the details
-                    self.general_utils.send_slack_msg(final_msg, 'slack_status_channel', self.debug)
+        # start the time budget of the run
+        self.rule_handler.budget = TimeBudget(float(os.getenv('RUN_TIME_BUDGET', '0')))
 
-                self.logger.info('<---------- Run complete: %s ---------->\n', infile)
-        except Exception:
-            self.logger.exception('Exception detected in APSViz Archiver.')
+        # init the rule set messages, they are sent as a single summary of the run
+        summary_msgs: list = []
+
+        # init the stats of the rule sets
+        rule_set_stats: list = []
+
+        # process the rule set
+        for rule_set in rule_defs['rule_sets']:
+            # execute the rule set
+            run_stats = self.rule_handler.process_rule_set(rule_set)
+
+            # save the stats
+            rule_set_stats.append(run_stats)
+
+            # no failures get a short message
+            if run_stats['failed'] == 0:
+                # create a success message
+                final_msg = f"Rule set {rule_set['rule_set_name']} Status: {len(rule_set['rules'])} rule(s) succeeded."
+
+                # set the success flag
+                ret_val = True
+            else:
+                # show all results on failure
+                final_msg = f"Rule set {rule_set['rule_set_name']} Status: Failures detected - {len(rule_set['rules'])} rule(s) in set, " \
+                            f"{run_stats['failed']} failed rule(s)."
+
+                # show all results on failure
+                status_msg = f"Status: Failures detected - {len(rule_set['rules'])} rule(s) in set, {run_stats['moved']} Move rule(s), " \
+                             f"{run_stats['copied']} copy rule(s), {run_stats['removed']} remove rule(s), " \
+                             f"{run_stats['swept']} sweep rule(s), {run_stats['failed']} failed rule(s)."
+
+                self.logger.info("APSVix-Archiver Rule set %s complete. Run %s", rule_set['rule_set_name'], status_msg)
+
+            # log the details and save them for the summary
+            self.logger.info(final_msg)
+            summary_msgs.append(final_msg)
+
+        # report the work deferred when the time ran out
+        if self.rule_handler.budget.deferred:
+            summary_msgs.append(self.rule_handler.budget.get_report())
+
+            self.logger.info(summary_msgs[-1])
+
+        # when the work is split across shards, add the merged shard stats to the summary
+        if self.rule_handler.shard.enabled:
+            summary_msgs.append(self.report_shard_stats(infile, rule_set_stats))
+
+        # send out a slack of the run summary
+        self.general_utils.send_slack_msg(f"Run complete. Name: {rule_def_name}, Version: {rule_def_version}\n" + '\n'.join(summary_msgs),
+                                          'slack_status_channel', self.debug)
+
+        # report the dependencies that were down during the run
+        outages: list = CircuitBreaker.get_summary()
+
+        if outages:
+            self.general_utils.send_slack_msg(f"Dependency outages detected: {'; '.join(outages)}.", 'slack_issues_channel', self.debug)
+
+        # log how the DB connection pools held up
+        self.log_pool_metrics()
+
+        # the budget only applies to this run, e.g. not to the run events handled by a daemon between runs
+        self.rule_handler.budget = TimeBudget()
+
+        self.logger.info('<---------- Run complete: %s ---------->\n', infile)
 
         # return to the caller
         return ret_val
+
+    def log_pool_metrics(self):
+        """
+        Logs the wait time and utilization metrics of the DB connection pools used so far.
+
+        :return:
+        """
+        # the DBs are only connected once a rule needs them
+        if 'geoserver_utils' in vars(self.rule_handler):
+            # for the DB connections of the geoserver and TDS utilities
+            for owner, db_info in [('GeoServer', self.rule_handler.geoserver_utils.db_info),
+                                   ('TDS', self.rule_handler.geoserver_utils.tds_utils.db_info)]:
+                # log the metrics of each pool
+                for db_name, metrics in db_info.get_pool_metrics().items():
+                    self.logger.info('%s %s DB connection pool metrics: %s', owner, db_name, metrics)
+
+    def report_shard_stats(self, infile: str, rule_set_stats: list) -> str:
+        """
+        Saves the stats of this shard so they can be merged with the others, then merges the stats of all the shards.
+
+        :param infile:
+        :param rule_set_stats:
+        :return: the merged stats message
+        """
+        # get the shard of this process
+        shard: ShardSelector = self.rule_handler.shard
+
+        # save the stats of this shard
+        shard.save_stats(os.path.basename(infile), ShardSelector.merge_stats(rule_set_stats))
+
+        # get the stats of all the shards saved so far
+        merged_stats, shards_saved = shard.load_merged_stats(os.path.basename(infile))
+
+        # return the message
+        return f'Shard {shard.name}. Stats of the {shards_saved} shard(s) reported: {merged_stats}'
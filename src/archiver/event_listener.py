@@ -0,0 +1,192 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Class RunEventListener - Receives run completion/expiration events from the DB.
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import copy
+import json
+import select
+
+from src.common.logger import LoggingUtil
+from src.common.pg_utils_multi import PGUtilsMultiConnect
+
+
+class RunEventListener:
+    """
+    Class that LISTENs on a DB notification channel for the instance ids of runs that have completed or expired.
+
+    The channel (ARCHIVER_NOTIFY_CHANNEL, default archiver_run_events) is on the ARCHIVER_NOTIFY_DB DB (default apsviz). A
+    notification payload is an instance id, or a json object with an "instance_id" (and optionally an "event") element, e.g.:
+
+        SELECT pg_notify('archiver_run_events', '{"instance_id": "4358-2023071612-namforecast", "event": "expired"}');
+
+    The GEOSERVER_* and SWEEP_* rules of the rule files are then run on just those instances.
+    """
+
+    def __init__(self, _logger=None, _db_info: PGUtilsMultiConnect = None):
+        """
+        Initializes this class
+
+        :param _logger:
+        :param _db_info:
+        """
+        # if a reference to a logger is passed in, use it
+        if _logger is not None:
+            # get a handle to a logger
+            self.logger = _logger
+        else:
+            # get the log level and directory from the environment.
+            log_level, log_path = LoggingUtil.prep_for_logging()
+
+            # create a logger
+            self.logger = LoggingUtil.init_logging("APSVIZ.Archiver.RunEventListener", level=log_level, line_format='medium', log_file_path=log_path)
+
+        # get the channel and the DB it is on
+        self.channel: str = os.getenv('ARCHIVER_NOTIFY_CHANNEL', 'archiver_run_events')
+        self.db_name: str = os.getenv('ARCHIVER_NOTIFY_DB', 'apsviz')
+
+        # use the DB utilities passed in, or create new ones
+        self.db_info: PGUtilsMultiConnect = _db_info if _db_info is not None else PGUtilsMultiConnect('APSViz.Settings', (self.db_name,), self.logger)
+
+        # init the listening connection, it is made on first use and remade if it fails
+        self.conn = None
+
+    def wait_for_instance_ids(self, timeout: float):
+        """
+        Waits for run events.
+
+        :param timeout: the number of seconds to wait
+        :return: the instance ids received, or None if not listening
+        """
+        # listen if not already listening
+        if self.conn is None:
+            self.conn = self.db_info.listen(self.db_name, self.channel)
+
+        # init the return value
+        ret_val = None
+
+        # if listening
+        if self.conn is not None:
+            # wait for notifications
+            payloads = self.get_notifications(timeout)
+
+            # did the connection fail?
+            if payloads is None:
+                # listen again next time
+                self.close()
+            else:
+                # get the instance ids
+                ret_val = {instance_id for instance_id in map(self.parse_payload, payloads) if instance_id}
+
+                if ret_val:
+                    self.logger.info('Received run event(s) for %s.', ', '.join(sorted(ret_val)))
+
+        # return to the caller
+        return ret_val
+
+    def get_notifications(self, timeout: float):
+        """
+        Waits for notifications on the listening connection.
+
+        :param timeout: the number of seconds to wait
+        :return: the payloads received, or None if the connection failed
+        """
+        # init the return value
+        ret_val: list = []
+
+        try:
+            # wait for the connection to have something to read
+            if select.select([self.conn], [], [], timeout) != ([], [], []):
+                # read the notifications
+                self.conn.poll()
+
+                # get the payloads
+                while self.conn.notifies:
+                    ret_val.append(self.conn.notifies.pop(0).payload)
+        except Exception:
+            self.logger.exception('Error: The listening DB connection failed.')
+
+            # the caller must listen again
+            ret_val = None
+
+        # return to the caller
+        return ret_val
+
+    def parse_payload(self, payload: str):
+        """
+        Gets the instance id out of a notification payload.
+
+        :param payload:
+        :return: the instance id, or None if the payload is not valid
+        """
+        # init the return value
+        ret_val = payload.strip()
+
+        # a json payload holds the instance id
+        if ret_val.startswith('{'):
+            try:
+                ret_val = str(json.loads(ret_val).get('instance_id', '')).strip()
+            except ValueError:
+                ret_val = ''
+
+        # the instance id is used in paths, so it must be a simple name
+        if not ret_val or ret_val in ('.', '..') or '/' in ret_val or '\\' in ret_val:
+            self.logger.warning('Warning: Invalid run event payload "%s" ignored.', payload)
+            ret_val = None
+
+        # return to the caller
+        return ret_val
+
+    @staticmethod
+    def get_targeted_rule_sets(rule_defs: dict, instance_ids: set) -> list:
+        """
+        Gets the rule sets of a rule definition that can be run on specific instances, limited to those instances.
+
+        :param rule_defs:
+        :param instance_ids:
+        :return:
+        """
+        # init the return value
+        ret_val: list = []
+
+        # for each rule set
+        for rule_set in rule_defs['rule_sets']:
+            # get the GEOSERVER_* (other than reconcile) and SWEEP_* rules
+            rules: list = [copy.deepcopy(rule) for rule in rule_set['rules'] if str(rule.get('action_type', '')).startswith(('GEOSERVER_', 'SWEEP_'))
+                           and rule.get('action_type') != 'GEOSERVER_RECONCILE']
+
+            # limit them to the instances
+            for rule in rules:
+                rule['options'] = {**(rule.get('options') or {}), 'instance_ids': sorted(instance_ids)}
+
+            # save the rule set if it has any rules left
+            if rules:
+                ret_val.append({**rule_set, 'rule_set_name': f"{rule_set['rule_set_name']} (run events)", 'rules': rules})
+
+        # return to the caller
+        return ret_val
+
+    def close(self):
+        """
+        Closes the listening connection.
+
+        :return:
+        """
+        # if there is a connection, close it
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                self.logger.warning('Error detected closing the listening DB connection.')
+
+            # listen again next time
+            self.conn = None
@@ -0,0 +1,301 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Class PreflightChecker - Checks the dependencies of the loaded rules before any work starts.
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import time
+import threading
+
+import requests
+import psycopg2
+from slack_sdk import WebClient
+
+from src.common.logger import LoggingUtil
+from src.common.pg_utils_multi import PGUtilsMultiConnect
+
+
+class PreflightChecker:
+    """
+    Class that checks every dependency (DBs, GeoServer, TDS/data paths, mount points and Slack) the rules in a rule
+    definition actually use.
+
+    All the checks run at the same time, each on its own daemon thread with its own timeout (PREFLIGHT_TIMEOUT seconds,
+    default 10), so a dependency that hangs cannot hold up the run or the process exit. Subsystems that no rule uses are
+    not checked.
+    """
+    # the DBs used by the geoserver rules
+    GEOSERVER_DB_NAMES: tuple = ('apsviz', 'adcirc_obs')
+
+    def __init__(self, _logger=None, debug: bool = False):
+        """
+        Initializes this class
+
+        :param _logger:
+        :param debug: debug mode turns off slack msgs so Slack is not checked
+        """
+        # if a reference to a logger is passed in, use it
+        if _logger is not None:
+            # get a handle to a logger
+            self.logger = _logger
+        else:
+            # get the log level and directory from the environment.
+            log_level, log_path = LoggingUtil.prep_for_logging()
+
+            # create a logger
+            self.logger = LoggingUtil.init_logging("APSVIZ.Archiver.PreflightChecker", level=log_level, line_format='medium', log_file_path=log_path)
+
+        # save the debug mode
+        self.debug: bool = debug
+
+        # get the number of seconds each check has to complete
+        self.timeout: float = float(os.getenv('PREFLIGHT_TIMEOUT', '10'))
+
+    def get_checks(self, rule_defs: dict) -> dict:
+        """
+        Gets the checks needed by the rules in a rule definition.
+
+        :param rule_defs:
+        :return: a dict of check name to a (callable, args) tuple
+        """
+        # init the return value
+        ret_val: dict = {}
+
+        # for each rule in the rule definition
+        for rule in [rule for rule_set in rule_defs['rule_sets'] for rule in rule_set['rules']]:
+            # get the action type
+            action_type: str = str(rule.get('action_type', ''))
+
+            # the geoserver rules use the DBs, the geoserver and its data directories
+            if action_type.startswith('GEOSERVER_'):
+                # add the DB checks
+                for db_name in self.GEOSERVER_DB_NAMES:
+                    ret_val[f'{db_name} DB'] = (self.check_db, (db_name,))
+
+                # add the geoserver checks
+                ret_val['GeoServer REST'] = (self.check_geoserver, ())
+                ret_val['GeoServer data path'] = (self.check_path, (os.path.join(os.getenv('GEOSERVER_PROJ_PATH', ''),
+                                                                                 os.getenv('GEOSERVER_WORKSPACE', '')),))
+                ret_val['obs/mod data path'] = (self.check_path, (os.getenv('FILESERVER_OBS_PATH', ''),))
+
+                # the TDS directories are only used when TDS is configured
+                if os.getenv('TDS_URL', '') != '':
+                    ret_val['TDS base path'] = (self.check_path, (os.getenv('TDS_BASE_PATH', ''),))
+            # the file rules use the mount points of their source and destination
+            elif action_type in ('COPY', 'MOVE', 'REMOVE', 'SWEEP_COPY', 'SWEEP_MOVE', 'SWEEP_REMOVE'):
+                # get the paths used. the directory of a file is checked, the file may not exist yet (or anymore)
+                paths: list = [rule['source']] if action_type.endswith('REMOVE') else [rule['source'], rule['destination']]
+
+                if rule.get('data_type') == 'FILE' and not action_type.startswith('SWEEP_'):
+                    paths = [os.path.dirname(path) for path in paths]
+
+                # check the mount point of each path
+                for path in paths:
+                    ret_val[f'path {path}'] = (self.check_mount, (path,))
+
+        # Slack is only used when messages are sent
+        if not self.debug and os.getenv('SYSTEM', '') in ['Dev', 'Prod', 'AWS/EKS']:
+            ret_val['Slack'] = (self.check_slack, ())
+
+        # return to the caller
+        return ret_val
+
+    def run_checks(self, rule_defs: dict) -> (bool, list):
+        """
+        Runs the checks needed by a rule definition in parallel.
+
+        :param rule_defs:
+        :return: the pass/fail flag and the report lines, one per check
+        """
+        # get the checks
+        checks: dict = self.get_checks(rule_defs)
+
+        # init storage for the results. a check that does not finish in time has no result
+        results: dict = {}
+
+        # start all the checks
+        threads: list = []
+
+        for name, (check, args) in checks.items():
+            # run the check on a daemon thread so one that hangs is abandoned
+            thread = threading.Thread(target=self.run_check, args=(results, name, check, args), name=f'preflight {name}', daemon=True)
+            thread.start()
+            threads.append(thread)
+
+        # wait for the checks, until the timeout
+        deadline: float = time.monotonic() + self.timeout
+
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+        # init the return values
+        ret_val: bool = True
+        report: list = []
+
+        # build the report
+        for name in checks:
+            # get the result, a missing one timed out
+            success, detail = results.get(name, (False, f'timed out after {self.timeout:g}s'))
+
+            # save the result
+            report.append(f"{name}: {'ok' if success else 'FAILED'} ({detail})")
+
+            # any failure fails the pre-flight
+            ret_val = ret_val and success
+
+        self.logger.info('Pre-flight checks: %s', '; '.join(report) if report else 'none needed')
+
+        # return to the caller
+        return ret_val, report
+
+    @staticmethod
+    def run_check(results: dict, name: str, check, args: tuple):
+        """
+        Runs a check and saves its result.
+
+        :param results:
+        :param name:
+        :param check:
+        :param args:
+        :return:
+        """
+        # get the start time
+        start: float = time.monotonic()
+
+        try:
+            # run the check
+            success, detail = check(*args)
+        except Exception as e:
+            # a check that raises fails
+            success, detail = False, f'{type(e).__name__}: {e}'
+
+        # save the result along with the elapsed time
+        results[name] = (success, f'{detail}, {time.monotonic() - start:.2f}s')
+
+    def check_db(self, db_name: str) -> (bool, str):
+        """
+        Checks that a DB is configured and can be connected to.
+
+        :param db_name:
+        :return:
+        """
+        # get the connection string
+        conn_str: str = PGUtilsMultiConnect.get_conn_config(db_name)
+
+        # the DB must be configured
+        if conn_str == '':
+            return False, 'not configured'
+
+        # connect and run a trivial query
+        with psycopg2.connect(conn_str, connect_timeout=max(1, int(self.timeout))) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+
+        # the connection context only ends the transaction, so close it
+        conn.close()
+
+        # return to the caller
+        return True, 'connected'
+
+    def check_geoserver(self) -> (bool, str):
+        """
+        Checks that the geoserver REST API answers.
+
+        :return:
+        """
+        # get the geoserver version
+        response = requests.get(f"{os.getenv('GEOSERVER_URL', '')}/rest/about/version.json",
+                                auth=(os.getenv('GEOSERVER_USER', ''), os.getenv('GEOSERVER_PASSWORD', '')), timeout=self.timeout)
+
+        # return to the caller
+        return response.status_code == 200, f'HTTP {response.status_code}'
+
+    @staticmethod
+    def check_path(path: str) -> (bool, str):
+        """
+        Checks that a path is configured and is a readable directory. A hung mount point shows up as a timeout.
+
+        :param path:
+        :return:
+        """
+        # init the return value
+        ret_val: tuple = (True, 'ok')
+
+        # the path must be configured
+        if not path:
+            ret_val = (False, 'not configured')
+        # the path must be a directory
+        elif not os.path.isdir(path):
+            ret_val = (False, f'{path} not found')
+        # the directory must be readable
+        elif not os.access(path, os.R_OK | os.X_OK):
+            ret_val = (False, f'{path} not readable')
+
+        # return to the caller
+        return ret_val
+
+    @staticmethod
+    def get_mount_point(path: str) -> str:
+        """
+        Gets the nearest existing directory of a path. Rules can use paths that an earlier rule creates or that were already removed.
+
+        The walk up stops at the top-level directory of the path (or the first directory below PREFLIGHT_MOUNT_ROOT when the path is
+        under it), so a missing mount comes back as itself and fails its check instead of passing as one of its parents.
+
+        :param path:
+        :return:
+        """
+        # start with the path itself
+        ret_val: str = os.path.abspath(path) if path else ''
+
+        # get the configured directory the mounts live in, a path outside of it is mounted at its top-level directory
+        mount_root: str = os.path.abspath(os.getenv('PREFLIGHT_MOUNT_ROOT', os.sep))
+
+        if not ret_val or os.path.commonpath([mount_root, ret_val]) != mount_root:
+            mount_root = os.sep
+
+        # the mount is the first directory of the path below the mount root
+        boundary: str = ret_val if ret_val in ('', mount_root) else os.path.join(mount_root, os.path.relpath(ret_val, mount_root).split(os.sep)[0])
+
+        # walk up until an existing directory is found, but never above the mount
+        while ret_val and not os.path.isdir(ret_val) and ret_val != boundary:
+            ret_val = os.path.dirname(ret_val)
+
+        # return to the caller
+        return ret_val
+
+    def check_mount(self, path: str) -> (bool, str):
+        """
+        Checks that the mount point of a rule path is there and readable. A hung mount point shows up as a timeout.
+
+        :param path:
+        :return:
+        """
+        # check the nearest existing directory, a missing mount fails
+        return self.check_path(self.get_mount_point(path))
+
+    def check_slack(self) -> (bool, str):
+        """
+        Checks that the Slack tokens are valid.
+
+        :return:
+        """
+        # for each token
+        for token_name in ['SLACK_STATUS_TOKEN', 'SLACK_ISSUES_TOKEN']:
+            # the token must be configured
+            if not os.getenv(token_name):
+                return False, f'{token_name} not configured'
+
+            # validate the token
+            WebClient(token=os.getenv(token_name), timeout=max(1, int(self.timeout))).auth_test()
+
+        # return to the caller
+        return True, 'authenticated'
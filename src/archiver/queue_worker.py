@@ -0,0 +1,153 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Class QueueWorker - Runs the tasks of the work queue.
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import time
+import threading
+
+from src.archiver.rule_handler import RuleHandler
+from src.common.logger import LoggingUtil
+from src.common.work_queue import WorkQueue
+
+
+class QueueWorker:
+    """
+    Class that claims work queue tasks and runs the rule of each one on its entity until the queue is empty.
+
+    Any number of workers (processes or pods) can run at once. When the queue is empty a worker waits for new tasks, checking every
+    WORK_QUEUE_POLL_INTERVAL seconds (default 5), for up to WORK_QUEUE_IDLE_TIMEOUT seconds (default 0, stop right away).
+    """
+
+    def __init__(self, _logger=None, _rule_handler: RuleHandler = None):
+        """
+        Initializes this class
+
+        :param _logger:
+        :param _rule_handler: the rule handler that runs the tasks
+        """
+        # if a reference to a logger is passed in, use it
+        if _logger is not None:
+            # get a handle to a logger
+            self.logger = _logger
+        else:
+            # get the log level and directory from the environment.
+            log_level, log_path = LoggingUtil.prep_for_logging()
+
+            # create a logger
+            self.logger = LoggingUtil.init_logging("APSVIZ.Archiver.QueueWorker", level=log_level, line_format='medium', log_file_path=log_path)
+
+        # use the rule handler passed in, or create a new one
+        self.rule_handler: RuleHandler = _rule_handler if _rule_handler is not None else RuleHandler(self.logger)
+
+        # get the number of seconds between checks of an empty queue and how long the queue can be empty before stopping
+        self.poll_interval: float = float(os.getenv('WORK_QUEUE_POLL_INTERVAL', '5'))
+        self.idle_timeout: float = float(os.getenv('WORK_QUEUE_IDLE_TIMEOUT', '0'))
+
+        # the event is set to stop the worker
+        self.stop_event = threading.Event()
+
+    @property
+    def work_queue(self) -> WorkQueue:
+        """
+        Gets the work queue of the rule handler.
+
+        :return:
+        """
+        return self.rule_handler.work_queue
+
+    def run(self) -> dict:
+        """
+        Runs tasks until the queue stays empty for the idle timeout or stop() is called.
+
+        :return: the total stats of the tasks run, and the number of tasks
+        """
+        # init the stat counts
+        ret_val: dict = {'tasks': 0, 'moved': 0, 'copied': 0, 'removed': 0, 'swept': 0, 'failed': 0}
+
+        self.logger.info('Work queue worker %s started.', self.work_queue.worker)
+
+        # get the time the queue was last seen with work
+        last_work: float = time.monotonic()
+
+        # until stopped
+        while not self.stop_event.is_set():
+            # claim a task
+            task = self.work_queue.claim()
+
+            # if there is a task, run it
+            if task is not None:
+                # run the task
+                task_stats: dict = self.process_task(task)
+
+                # update the totals
+                ret_val['tasks'] += 1
+
+                for key, value in task_stats.items():
+                    ret_val[key] += value
+
+                # the queue had work
+                last_work = time.monotonic()
+            # stop when the queue has been empty long enough
+            elif time.monotonic() - last_work >= self.idle_timeout:
+                break
+            else:
+                # wait for more tasks
+                self.stop_event.wait(self.poll_interval)
+
+        self.logger.info('Work queue worker %s complete. Stats: %s', self.work_queue.worker, ret_val)
+
+        # return to the caller
+        return ret_val
+
+    def process_task(self, task: dict) -> dict:
+        """
+        Runs the rule of a task on its entity and records the result.
+
+        :param task:
+        :return: the stats of the task
+        """
+        # init the stat counts
+        ret_val: dict = {'moved': 0, 'copied': 0, 'removed': 0, 'swept': 0, 'failed': 0}
+
+        self.logger.info('Task %s start. Rule: %s, entity: %s, attempt: %s.', task['id'], task['rule']['name'], task['entity'], task['attempts'])
+
+        try:
+            # get the rule, limited to the entity of the task
+            the_rule = self.rule_handler.rule_utils.validate_and_convert_to_rule(WorkQueue.get_task_rule(task))
+
+            # run the rule
+            if the_rule:
+                ret_val = self.rule_handler.process_rule(the_rule)
+            else:
+                self.logger.error('Error: The rule of task %s was not the expected type or is missing data.', task['id'])
+
+                ret_val['failed'] += 1
+        except Exception:
+            self.logger.exception('Exception detected running task %s.', task['id'])
+
+            ret_val['failed'] += 1
+
+        # record the result
+        self.work_queue.complete(task, ret_val['failed'] == 0, ret_val)
+
+        # return to the caller
+        return ret_val
+
+    def stop(self):
+        """
+        Stops the worker after the current task.
+
+        :return:
+        """
+        # signal the stop
+        self.stop_event.set()
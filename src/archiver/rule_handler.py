@@ -14,14 +14,22 @@
 
 import os
 import shutil
+from functools import cached_property
+from concurrent.futures import ThreadPoolExecutor
 
 from stat import S_ISDIR
 from collections import namedtuple
 from src.common.rule_enums import ActionType, DataType
 from src.common.general_utils import GeneralUtils
 from src.common.rule_utils import RuleUtils
-from src.common.logger import LoggingUtil
+from src.common.logger import LoggingUtil, LogCounters
 from src.common.geoserver_utils import GeoServerUtils
+from src.common.reconciler import Reconciler
+from src.common.geoserver_planner import GeoServerPlanner
+from src.common.shard import ShardSelector
+from src.common.work_lock import WorkLock
+from src.common.work_queue import WorkQueue
+from src.common.time_budget import TimeBudget, EntityPriority
 
 
 class RuleHandler:
@@ -51,8 +59,52 @@ class RuleHandler:
         # create the general utilities class
         self.general_utils = GeneralUtils(self.logger)
 
-        # create the general utilities class
-        self.geoserver_utils = GeoServerUtils(self.logger)
+        # get the shard of this process
+        self.shard = ShardSelector()
+
+        # init the time budget of the run and of the current rule. they are unlimited unless a run sets one
+        self.budget: TimeBudget = TimeBudget()
+        self.rule_budget: TimeBudget = self.budget
+
+    @cached_property
+    def geoserver_utils(self) -> GeoServerUtils:
+        """
+        Gets the geoserver utilities. They connect to the DBs so they are only created when a geoserver rule needs them.
+
+        :return:
+        """
+        # create the geoserver utilities class
+        return GeoServerUtils(self.logger)
+
+    @cached_property
+    def reconciler(self) -> Reconciler:
+        """
+        Gets the reconciler that shares the geoserver utilities.
+
+        :return:
+        """
+        # create the reconciler
+        return Reconciler(self.logger, self.geoserver_utils)
+
+    @cached_property
+    def geoserver_planner(self) -> GeoServerPlanner:
+        """
+        Gets the two-phase (plan/execute) processor that shares the geoserver utilities.
+
+        :return:
+        """
+        # create the planner
+        return GeoServerPlanner(self.logger, self.geoserver_utils)
+
+    @cached_property
+    def work_queue(self) -> WorkQueue:
+        """
+        Gets the work queue. It is in the apsviz DB so it shares the geoserver utilities DB connection.
+
+        :return:
+        """
+        # create the work queue
+        return WorkQueue(self.logger, self.geoserver_utils.db_info)
 
     def process_rule_set(self, rule_set: dict) -> dict:
         """
@@ -69,13 +121,51 @@ class RuleHandler:
         # init the stat counts
         ret_val: dict = {'moved': 0, 'copied': 0, 'removed': 0, 'swept': 0, 'failed': 0}
 
+        # rule sets with geoserver rules are locked in the apsviz DB, the others with a lock file
+        uses_db: bool = any(str(rule.get('action_type', '')).startswith('GEOSERVER_') for rule in rule_set['rules'])
+
+        db_info = self.geoserver_utils.db_info if uses_db else None
+
+        # lock the rule set so that a concurrent runner skips it
+        with WorkLock(self.logger, db_info).hold(f'rule_set/{self.shard.name}/{rule_set_name}') as acquired:
+            if acquired:
+                # run the rules
+                ret_val = self.process_rules(rule_set['rules'])
+            else:
+                self.logger.info('Rule set %s is being run by another runner. Skipping it.', rule_set_name)
+
+        # return to the caller
+        return ret_val
+
+    def process_rules(self, rules: list) -> dict:
+        """
+        Runs the rules of a rule set.
+
+        :param rules:
+        :return:
+        """
+        # init the stat counts
+        ret_val: dict = {'moved': 0, 'copied': 0, 'removed': 0, 'swept': 0, 'failed': 0}
+
         # for each rule in the rule set
-        for rule in rule_set['rules']:
+        for rule in rules:
             # convert elements to their equivalent types
             the_rule: namedtuple = self.rule_utils.validate_and_convert_to_rule(rule)
 
+            # skip the rules run by another shard
+            if the_rule and not self.owns_rule(the_rule):
+                self.logger.info('Rule "%s" is run by another shard. Skipping it in shard %s.', the_rule.name, self.shard.name)
+            # once the run is out of time the remaining rules are deferred
+            elif the_rule and self.budget.expired:
+                self.logger.info('Rule "%s" deferred, the run time budget is used up.', the_rule.name)
+
+                self.budget.defer(the_rule.name)
+            # in enqueue mode the entities of the rule are queued for the workers
+            elif the_rule and WorkQueue.enqueue_mode() and WorkQueue.is_queueable(the_rule):
+                if not self.enqueue_rule(the_rule):
+                    ret_val['failed'] += 1
             # if we get back a valid rule
-            if the_rule:
+            elif the_rule:
                 # apply the rules to the data, get back some stats
                 process_stats: dict = self.process_rule(the_rule)
 
@@ -105,6 +195,13 @@ class RuleHandler:
         self.logger.info("Rule start. Name: %s, action type: %s.", rule.name, rule.action_type)
         self.logger.debug('Rule data source: %s, dest: %s, data_type: %s.', rule.source, rule.destination, rule.data_type)
 
+        # get the time budget of the rule, part of the budget of the run
+        self.rule_budget = self.budget.child(float((rule.options or {}).get('time_budget', os.getenv('RULE_TIME_BUDGET', '0'))))
+
+        # in aggregate mode the per-entity events of the rule are counted instead of logged
+        if LoggingUtil.aggregate_mode():
+            self.rule_utils.counters = LogCounters(self.logger, rule.name)
+
         # select the operation by based on the trigger type
         if rule.action_type == ActionType.MOVE:
             # run the action handler, get the result
@@ -144,14 +241,98 @@ class RuleHandler:
             else:
                 stats['failed'] += 1
 
+        elif rule.action_type == ActionType.GEOSERVER_RECONCILE:
+            # run the reconciliation, get the result
+            success, stats = self.reconciler.reconcile(stats, rule)
+
+            # a failure is counted here, the success is counted in the reconciliation
+            if not success:
+                stats['failed'] += 1
+
         # unknown rule action type
         else:
             stats['failed'] += 1
             self.logger.error('Error: The rule "%s" with action type %s is invalid.', rule.name, rule.action_type.value)
 
+        # log the final counts of the rule
+        if self.rule_utils.counters is not None:
+            self.rule_utils.counters.close()
+            self.rule_utils.counters = None
+
         # return the stats to the caller
         return stats
 
+    def owns_rule(self, rule: RuleUtils.Rule) -> bool:
+        """
+        Checks if a rule is run in the shard of this process.
+
+        The single entity rules are run in the shard that owns their source and the reconciliation, which needs the
+        complete listings, only in the first shard. The entities of the other rules are split across the shards.
+
+        :param rule:
+        :return:
+        """
+        # init the return value
+        ret_val: bool = True
+
+        # check the owner of the rule
+        if rule.action_type in (ActionType.MOVE, ActionType.COPY, ActionType.REMOVE):
+            ret_val = self.shard.owns(rule.source)
+        elif rule.action_type == ActionType.GEOSERVER_RECONCILE:
+            ret_val = self.shard.index == 0
+
+        # return to the caller
+        return ret_val
+
+    def enqueue_rule(self, rule: RuleUtils.Rule) -> bool:
+        """
+        Queues a work queue task for each entity of a rule.
+
+        :param rule:
+        :return:
+        """
+        # init the return value
+        ret_val: bool = False
+
+        # check to see if execution params are populated
+        if self.rule_utils.validate_criteria_definition(rule):
+            # get the entities of the rule
+            entities = self.get_rule_entities(rule)
+
+            # queue the tasks
+            if entities is not None:
+                ret_val = self.work_queue.enqueue(rule, entities) >= 0
+
+        # return to the caller
+        return ret_val
+
+    def get_rule_entities(self, rule: RuleUtils.Rule):
+        """
+        Gets the entities a GEOSERVER_* or SWEEP_* rule would process.
+
+        The geoserver entities are the instances that meet the rule criteria. The sweep entities are the contents of the source
+        directory, their criteria are checked when the task is run.
+
+        :param rule:
+        :return: the list of entities, or None if the source directory was not found
+        """
+        # get the entities the rule targets (e.g. from run events)
+        if rule.options and 'instance_ids' in rule.options:
+            ret_val = list(rule.options['instance_ids'])
+        # get the geoserver instances that meet criteria
+        elif rule.action_type in (ActionType.GEOSERVER_COPY, ActionType.GEOSERVER_MOVE, ActionType.GEOSERVER_REMOVE):
+            ret_val = sorted(self.geoserver_utils.get_geoserver_entities_from_dir(rule))
+        # get the contents of the source directory
+        elif os.path.isdir(rule.source):
+            ret_val = sorted(filter(self.shard.owns, os.listdir(rule.source)))
+        else:
+            self.logger.error('Error: The source directory %s of rule "%s" was not found.', rule.source, rule.name)
+
+            ret_val = None
+
+        # return to the caller
+        return ret_val
+
     def move_data_action(self, rule: RuleUtils.Rule) -> bool:
         """
         moves data from the source to destination
@@ -262,12 +443,53 @@ class RuleHandler:
 
         # run the rule if it meets criteria
         if validated:
-            # process the rule
-            ret_val, stats = self.geoserver_utils.process_geoserver_rule(stats, rule)
+            # process the rule on each of the workspaces specified
+            if rule.options and 'workspaces' in rule.options:
+                ret_val, stats = self.geoserver_workspaces_action(stats, rule)
+            # process the rule in two phases if a plan mode was specified
+            elif rule.options and 'plan' in rule.options:
+                ret_val, stats = self.geoserver_planner.process_plan_rule(stats, rule)
+            else:
+                # process the rule
+                ret_val, stats = self.geoserver_utils.process_geoserver_rule(stats, rule, self.rule_budget)
 
         # return the success flag
         return ret_val, stats
 
+    def geoserver_workspaces_action(self, stats: dict, rule: RuleUtils.Rule) -> (bool, dict):
+        """
+        performs geoserver operations on each of the workspaces listed in the rule options, concurrently.
+
+        The "workspaces" option is a list of workspace names or {"workspace": <name>, "proj_path": <geoserver data path>} entries.
+        Each workspace gets its own data directory scan and store listings. The DB connections, the geoserver REST concurrency
+        (GEOSERVER_REST_CONCURRENCY) and the delete rate are shared by all of them.
+
+        :param stats:
+        :param rule:
+        :return:
+        """
+        # get a geoserver utils object for each workspace
+        workspaces: list = [self.geoserver_utils.for_workspace(workspace) if isinstance(workspace, str) else
+                            self.geoserver_utils.for_workspace(workspace['workspace'], workspace.get('proj_path'))
+                            for workspace in rule.options['workspaces']]
+
+        self.logger.info('Processing rule "%s" on %s workspace(s).', rule.name, len(workspaces))
+
+        # process the workspaces concurrently, each with its own stats
+        with ThreadPoolExecutor(max_workers=max(1, len(workspaces))) as executor:
+            results: list = list(executor.map(lambda geoserver_utils: geoserver_utils.process_geoserver_rule(dict.fromkeys(stats, 0), rule,
+                                                                                                             self.rule_budget), workspaces))
+
+        # merge the results
+        for (success, workspace_stats), geoserver_utils in zip(results, workspaces):
+            self.logger.info('Workspace %s result: success: %s, stats: %s', geoserver_utils.geoserver_workspace, success, workspace_stats)
+
+            for key, value in workspace_stats.items():
+                stats[key] += value
+
+        # return to the caller
+        return all(success for success, _ in results), stats
+
     def sweep_action(self, rule: RuleUtils.Rule) -> bool:
         """
         performs a sweep of a source directory. sweep operations include processing a directory
@@ -287,11 +509,18 @@ class RuleHandler:
 
         # run the rule if it meets criteria
         if validated:
-            # get a list of the contents of the source directory
-            entities = os.listdir(rule.source)
+            # get the entities the rule targets (e.g. from run events) or a list of the contents of the source directory
+            if rule.options and 'instance_ids' in rule.options:
+                entities = rule.options['instance_ids']
+            else:
+                entities = os.listdir(rule.source)
+
+            # get the entities owned by this shard, in priority order
+            entities = EntityPriority.order({entity: [os.path.join(rule.source, entity)] for entity in entities if self.shard.owns(entity)},
+                                            EntityPriority.get_priority(rule.options))
 
-            # for each item found
-            for entity in entities:
+            # for each item found, until the rule is out of time
+            for entity in self.rule_budget.take(rule.name, entities):
                 # save the path to the entity
                 full_path = os.path.join(rule.source, entity)
 
@@ -319,8 +548,8 @@ class RuleHandler:
                             # remove the directory
                             ret_val = self.rule_utils.remove_directory(rule, rule.source, entity)
                     else:
-                        self.logger.debug('%s data action %s: Entity %s failed to meet criteria in %s.', rule.data_type.name, rule.action_type.name,
-                                          entity, rule.source)
+                        self.rule_utils.log_entity('failed criteria', '%s data action %s: Entity %s failed to meet criteria in %s.',
+                                                   rule.data_type.name, rule.action_type.name, entity, rule.source)
 
                         # increment the failed criteria counter
                         failed_met_criteria += 1
@@ -342,8 +571,8 @@ class RuleHandler:
                             # remove the directory
                             ret_val = self.rule_utils.remove_file(rule, entity)
                     else:
-                        self.logger.debug('%s data action %s: Entity %s failed to meet criteria in %s.', rule.data_type.name, rule.action_type.name,
-                                          entity, rule.source)
+                        self.rule_utils.log_entity('failed criteria', '%s data action %s: Entity %s failed to meet criteria in %s.',
+                                                   rule.data_type.name, rule.action_type.name, entity, rule.source)
 
                         # increment the failed criteria counter
                         failed_met_criteria += 1
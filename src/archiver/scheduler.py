@@ -0,0 +1,330 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Archiver daemon - Runs rule files on cron-like schedules in a long-lived process.
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import datetime as dt
+import threading
+
+from src.archiver.archiver import APSVizArchiver
+from src.archiver.event_listener import RunEventListener
+from src.common.general_utils import GeneralUtils
+
+
+class CronSchedule:
+    """
+    A standard 5 field cron expression (minute, hour, day of month, month, day of week).
+
+    Each field can be *, a value, a range (a-b), a step (*/n or a-b/n) or a comma separated list of those. Sunday is 0 (or 7) in
+    the day of week field. As in cron, when both the day of month and the day of week are restricted, a day that matches either
+    one matches.
+    """
+    # the (min, max) values of each field
+    FIELD_RANGES: list = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression: str):
+        """
+        Initializes this class
+
+        :param expression:
+        """
+        # split the expression into its fields
+        fields: list = expression.split()
+
+        # there must be 5 of them
+        if len(fields) != 5:
+            raise ValueError(f'Invalid cron expression "{expression}", 5 fields are expected.')
+
+        # save the expression
+        self.expression: str = expression
+
+        # get the allowed values of each field
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [self.parse_field(field, low, high)
+                                                                           for field, (low, high) in zip(fields, self.FIELD_RANGES)]
+
+        # sunday can be 0 or 7
+        if 7 in self.weekdays:
+            self.weekdays.add(0)
+
+        # save if the day fields are restricted
+        self.days_restricted: bool = fields[2] != '*'
+        self.weekdays_restricted: bool = fields[4] != '*'
+
+    @staticmethod
+    def parse_field(field: str, low: int, high: int) -> set:
+        """
+        Gets the values allowed by a cron field.
+
+        :param field:
+        :param low:
+        :param high:
+        :return:
+        """
+        # init the return value
+        ret_val: set = set()
+
+        # for each part of a list
+        for part in field.split(','):
+            # get the step
+            value_range, _, step = part.partition('/')
+
+            # get the range
+            if value_range == '*':
+                start, end = low, high
+            elif '-' in value_range:
+                start, end = (int(value) for value in value_range.split('-', 1))
+            else:
+                start = end = int(value_range)
+
+                # a step on a single value runs to the end of the field
+                if step:
+                    end = high
+
+            # the values must be in range
+            if start < low or end > high or start > end or (step and int(step) < 1):
+                raise ValueError(f'Invalid cron field "{field}".')
+
+            # save the values
+            ret_val.update(range(start, end + 1, int(step) if step else 1))
+
+        # return to the caller
+        return ret_val
+
+    def matches_day(self, when: dt.datetime) -> bool:
+        """
+        Checks if the day of a date matches the expression.
+
+        :param when:
+        :return:
+        """
+        # check the day of month and day of week, cron uses sunday = 0
+        day_match: bool = when.day in self.days
+        weekday_match: bool = when.isoweekday() % 7 in self.weekdays
+
+        # either one matches when both are restricted
+        if self.days_restricted and self.weekdays_restricted:
+            ret_val: bool = day_match or weekday_match
+        else:
+            ret_val = day_match and weekday_match
+
+        # return to the caller
+        return when.month in self.months and ret_val
+
+    def next_run(self, after: dt.datetime) -> dt.datetime:
+        """
+        Gets the first time after a datetime that matches the expression.
+
+        :param after:
+        :return:
+        """
+        # start on the next minute
+        ret_val: dt.datetime = after.replace(second=0, microsecond=0) + dt.timedelta(minutes=1)
+
+        # give up after a bit more than 4 years, covering leap days
+        limit: dt.datetime = ret_val + dt.timedelta(days=366 * 4 + 1)
+
+        # move forward a day, an hour or a minute at a time until everything matches
+        while ret_val < limit:
+            if not self.matches_day(ret_val):
+                ret_val = ret_val.replace(hour=0, minute=0) + dt.timedelta(days=1)
+            elif ret_val.hour not in self.hours:
+                ret_val = ret_val.replace(minute=0) + dt.timedelta(hours=1)
+            elif ret_val.minute not in self.minutes:
+                ret_val += dt.timedelta(minutes=1)
+            else:
+                # return to the caller
+                return ret_val
+
+        raise ValueError(f'The cron expression "{self.expression}" never matches.')
+
+
+class ArchiverDaemon:
+    """
+    Class that runs rule files on their schedules in a single long-lived process.
+
+    The archiver, and with it the DB connections, GeoServer clients, journals and caches, is created once and kept warm between
+    runs. Each rule file is run on the cron expression in its optional "schedule" element, or DAEMON_DEFAULT_SCHEDULE (default
+    hourly). The rule files are checked for changes every DAEMON_POLL_INTERVAL seconds (default 30) and a changed file is reloaded,
+    picking up its new schedule.
+
+    With a run event listener, the GEOSERVER_* and SWEEP_* rules are also run on the instances received in run events as they
+    arrive. The scheduled full scans are then only a safety net and can be run much less often.
+    """
+
+    def __init__(self, rule_files: str, archiver: APSVizArchiver = None, listener: RunEventListener = None):
+        """
+        Initializes this class
+
+        :param rule_files: a comma separated list of rule definition files
+        :param archiver:
+        :param listener: the run event listener, if events are used
+        """
+        # create the archiver that is kept warm between runs
+        self.archiver: APSVizArchiver = archiver if archiver is not None else APSVizArchiver(rule_files)
+
+        # use the archiver logger
+        self.logger = self.archiver.logger
+
+        # get the default schedule and the number of seconds between checks for rule file changes
+        self.default_schedule: str = os.getenv('DAEMON_DEFAULT_SCHEDULE', '0 * * * *')
+        self.poll_interval: float = float(os.getenv('DAEMON_POLL_INTERVAL', '30'))
+
+        # save the rule files
+        self.rule_files: list = rule_files.split(',')
+
+        # init the schedule, modification time and next run time of each rule file
+        self.schedules: dict = {}
+        self.mtimes: dict = {}
+        self.next_runs: dict = {}
+
+        # save the run event listener
+        self.listener: RunEventListener = listener
+
+        # the event is set to stop the daemon
+        self.stop_event = threading.Event()
+
+    def load_schedules(self, now: dt.datetime):
+        """
+        Loads the schedules of the rule files that are new or have changed.
+
+        :param now:
+        :return:
+        """
+        # for each rule file
+        for infile in self.rule_files:
+            try:
+                # get the modification time
+                mtime: float = os.path.getmtime(infile)
+
+                # skip the file if it has not changed
+                if self.mtimes.get(infile) == mtime:
+                    continue
+
+                # load the schedule
+                schedule: CronSchedule = CronSchedule(GeneralUtils.load_rule_definition_file(infile).get('schedule', self.default_schedule))
+
+                # save the schedule and the next run time
+                self.schedules[infile] = schedule
+                self.mtimes[infile] = mtime
+                self.next_runs[infile] = schedule.next_run(now)
+
+                self.logger.info('Loaded %s, schedule: "%s", next run: %s', infile, schedule.expression, self.next_runs[infile])
+            except Exception:
+                self.logger.exception('Error loading the rule file %s. The previous schedule, if any, is kept.', infile)
+
+                # do not retry until the file changes again
+                if os.path.exists(infile):
+                    self.mtimes[infile] = os.path.getmtime(infile)
+
+    def run_due(self, now: dt.datetime) -> list:
+        """
+        Runs the rule files that are due.
+
+        :param now:
+        :return: the rule files that were run
+        """
+        # get the rule files that are due, in schedule order
+        ret_val: list = sorted((infile for infile, next_run in self.next_runs.items() if next_run <= now), key=self.next_runs.get)
+
+        # for each rule file that is due
+        for infile in ret_val:
+            try:
+                # run the rule file with the warm archiver
+                self.archiver.run_rule_file(infile)
+            except Exception:
+                self.logger.exception('Exception detected running %s.', infile)
+
+            # schedule the next run. runs that were missed while this one was running are skipped
+            self.next_runs[infile] = self.schedules[infile].next_run(max(now, dt.datetime.now()))
+
+        # return to the caller
+        return ret_val
+
+    def run_forever(self):
+        """
+        Runs the rule files on their schedules until stop() is called.
+
+        :return:
+        """
+        self.logger.info('Archiver daemon started for %s.', ', '.join(self.rule_files))
+
+        # until stopped
+        while not self.stop_event.is_set():
+            # get the current time
+            now: dt.datetime = dt.datetime.now()
+
+            # pick up rule file changes
+            self.load_schedules(now)
+
+            # run the rule files that are due
+            self.run_due(now)
+
+            # sleep until the next run or the next check for changes
+            if self.next_runs:
+                wait: float = min(self.poll_interval, max(0.0, (min(self.next_runs.values()) - dt.datetime.now()).total_seconds()))
+            else:
+                wait = self.poll_interval
+
+            self.wait_for_events(wait)
+
+        # stop listening
+        if self.listener is not None:
+            self.listener.close()
+
+        self.logger.info('Archiver daemon stopped.')
+
+    def wait_for_events(self, wait: float):
+        """
+        Waits for run events or a stop, running the rules on the instances in any events received.
+
+        :param wait: the number of seconds to wait
+        :return:
+        """
+        # wait for run events if listening
+        instance_ids = self.listener.wait_for_instance_ids(wait) if self.listener is not None else None
+
+        # wait for a stop if not listening
+        if instance_ids is None:
+            self.stop_event.wait(wait)
+        # run the rules on the instances in the events
+        elif instance_ids:
+            self.run_events(instance_ids)
+
+    def run_events(self, instance_ids: set):
+        """
+        Runs the GEOSERVER_* and SWEEP_* rules of the rule files on specific instances.
+
+        :param instance_ids:
+        :return:
+        """
+        # for each rule file
+        for infile in self.rule_files:
+            try:
+                # get the rule sets that can be limited to the instances
+                rule_sets: list = RunEventListener.get_targeted_rule_sets(GeneralUtils.load_rule_definition_file(infile), instance_ids)
+
+                # run them with the warm archiver
+                for rule_set in rule_sets:
+                    run_stats: dict = self.archiver.rule_handler.process_rule_set(rule_set)
+
+                    self.logger.info('Rule set %s complete. Stats: %s', rule_set['rule_set_name'], run_stats)
+            except Exception:
+                self.logger.exception('Exception detected running the run events on %s.', infile)
+
+    def stop(self):
+        """
+        Stops the daemon after the current run.
+
+        :return:
+        """
+        # signal the stop
+        self.stop_event.set()
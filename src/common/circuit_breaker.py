@@ -0,0 +1,190 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Circuit breaker - Fails calls to a dependency fast once it is detected to be down.
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import time
+import threading
+
+
+class CircuitOpenError(Exception):
+    """
+    Exception raised when a call is not made because the circuit of the dependency is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker for a dependency (a DB, the GeoServer, Slack, etc.).
+
+    The circuit opens after a number of consecutive failures (CIRCUIT_BREAKER_THRESHOLD, default 3). Calls are then refused
+    until the cool-down (CIRCUIT_BREAKER_COOL_DOWN seconds, default 300) has passed, after which a single probe call is allowed.
+    A successful probe closes the circuit, a failed one opens it for another cool-down.
+
+    There is one breaker per dependency name in the process, so every component that uses the dependency shares its state.
+    """
+    # the breakers by dependency name
+    breakers: dict = {}
+
+    # protects the breakers dict
+    breakers_lock = threading.Lock()
+
+    # the circuit states
+    CLOSED: str = 'closed'
+    OPEN: str = 'open'
+    HALF_OPEN: str = 'half-open'
+
+    def __init__(self, name: str, failure_threshold: int, cool_down: float):
+        """
+        Initializes this class
+
+        :param name: the name of the dependency
+        :param failure_threshold: the number of consecutive failures that opens the circuit
+        :param cool_down: the number of seconds to wait before probing the dependency again
+        """
+        # save the configuration
+        self.name: str = name
+        self.failure_threshold: int = max(1, failure_threshold)
+        self.cool_down: float = cool_down
+
+        # the lock protects everything below
+        self.lock = threading.Lock()
+
+        # init the state
+        self.state: str = self.CLOSED
+        self.failures: int = 0
+        self.opened_at: float = 0.0
+
+        # init the metrics
+        self.times_opened: int = 0
+        self.rejected: int = 0
+
+    @classmethod
+    def get(cls, name: str):
+        """
+        Gets the breaker for a dependency, creating it if needed.
+
+        :param name:
+        :return:
+        """
+        with cls.breakers_lock:
+            # create the breaker if it does not exist
+            if name not in cls.breakers:
+                cls.breakers[name] = CircuitBreaker(name, int(os.getenv('CIRCUIT_BREAKER_THRESHOLD', '3')),
+                                                    float(os.getenv('CIRCUIT_BREAKER_COOL_DOWN', '300')))
+
+            # return to the caller
+            return cls.breakers[name]
+
+    @classmethod
+    def get_summary(cls) -> list:
+        """
+        Gets a summary of the dependencies that had an outage since the last summary. The metrics are reset, so each run only
+        reports its own outages.
+
+        :return: a list of messages, one per breaker that opened or failed calls fast
+        """
+        # init the return value
+        ret_val: list = []
+
+        with cls.breakers_lock:
+            # get the breakers
+            breakers: list = list(cls.breakers.values())
+
+        # for each breaker that opened or refused calls
+        for breaker in breakers:
+            with breaker.lock:
+                if breaker.times_opened > 0 or breaker.rejected > 0:
+                    ret_val.append(f'{breaker.name} circuit opened {breaker.times_opened} time(s), {breaker.rejected} call(s) failed fast, '
+                                   f'now {breaker.state}')
+
+                    # start over for the next summary
+                    breaker.times_opened = 0
+                    breaker.rejected = 0
+
+        # return the summary
+        return ret_val
+
+    @classmethod
+    def reset_all(cls):
+        """
+        Removes all the breakers.
+
+        :return:
+        """
+        with cls.breakers_lock:
+            cls.breakers = {}
+
+    def is_open(self) -> bool:
+        """
+        Checks if calls are being refused, without using up the probe call.
+
+        :return:
+        """
+        with self.lock:
+            # return the state
+            return self.state == self.HALF_OPEN or (self.state == self.OPEN and time.monotonic() - self.opened_at < self.cool_down)
+
+    def allow(self) -> bool:
+        """
+        Checks if a call can be made. The caller must report the outcome of an allowed call.
+
+        :return:
+        """
+        with self.lock:
+            # init the return value
+            ret_val: bool = True
+
+            # is the circuit open?
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cool_down:
+                # let a single probe through
+                self.state = self.HALF_OPEN
+            elif self.state != self.CLOSED:
+                # fail fast
+                self.rejected += 1
+                ret_val = False
+
+            # return to the caller
+            return ret_val
+
+    def record_success(self):
+        """
+        Records a successful call, which closes the circuit.
+
+        :return:
+        """
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> bool:
+        """
+        Records a failed call.
+
+        :return: True if this failure opened the circuit
+        """
+        with self.lock:
+            # init the return value
+            ret_val: bool = False
+
+            # count the failure
+            self.failures += 1
+
+            # a failed probe or too many failures opens the circuit
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+                ret_val = True
+
+            # return to the caller
+            return ret_val
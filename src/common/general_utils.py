@@ -15,9 +15,8 @@
 import os
 import json
 
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
 from src.common.logger import LoggingUtil
+from src.common.slack_notifier import SlackNotifier
 
 
 class GeneralUtils:
@@ -62,20 +61,33 @@ class GeneralUtils:
         # log the message
         self.logger.info(final_msg)
 
-        # send the message to Slack if not in debug mode and not running locally
+        # queue the message for Slack if not in debug mode and not running locally. it is posted on a background thread
         if not debug_mode and self.system in ['Dev', 'Prod', 'AWS/EKS']:
-            # determine the client based on the channel
+            # determine the token based on the channel
             if channel == 'slack_status_channel':
-                client = WebClient(token=os.getenv('SLACK_STATUS_TOKEN'))
+                token = os.getenv('SLACK_STATUS_TOKEN')
             else:
-                client = WebClient(token=os.getenv('SLACK_ISSUES_TOKEN'))
-
-            try:
-                # send the message
-                client.chat_postMessage(channel=self.slack_channels[channel], text=final_msg)
-            except SlackApiError:
-                # log the error
-                self.logger.exception('Slack %s messaging failed. msg: %s', self.slack_channels[channel], final_msg)
+                token = os.getenv('SLACK_ISSUES_TOKEN')
+
+            # queue the message
+            SlackNotifier.get(self.logger).enqueue(self.slack_channels[channel], token, final_msg)
+
+    @staticmethod
+    def prep_for_state() -> str:
+        """
+        gets the directory where the archiver keeps state (caches, journals, etc.) that must survive between runs.
+
+        :return:
+        """
+        # default to the log directory when a state directory is not specified
+        state_path: str = os.getenv('ARCHIVER_STATE_PATH', os.getenv('LOG_PATH', os.path.dirname(__file__)))
+
+        # create the dir if it does not exist
+        if not os.path.exists(state_path):
+            os.makedirs(state_path)
+
+        # return to the caller
+        return state_path
 
     @staticmethod
     def load_rule_definition_file(infile: str) -> dict:
@@ -0,0 +1,373 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    GeoServer Planner - Two-phase (plan, then execute) processing of GEOSERVER_REMOVE rules.
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import json
+import asyncio
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+
+from src.common.rule_enums import ActionType
+from src.common.rule_utils import RuleUtils
+from src.common.general_utils import GeneralUtils
+from src.common.logger import LoggingUtil
+from src.common.geoserver_utils import GeoServerUtils
+from src.common.pg_impl_async import PGImplementationAsync
+from src.common.shard import ShardSelector
+
+
+class GeoServerPlanner:
+    """
+    Class that splits the processing of a GEOSERVER_REMOVE rule into a planning phase and an execution phase.
+
+    The planning phase collects everything up front: the target instances, their geoserver and obs/mod directories, TDS paths
+    and store names. The plan is a json document that can be saved, reviewed, diffed and replayed.
+
+    The execution phase applies the plan one system at a time: the DB records are removed with the bulk SPs (or concurrently
+    with the asyncio DB backend when DB_BACKEND=async), the store REST deletes are run concurrently and the directories are
+    removed in parallel. Targets that are already gone are not failures, so a plan can be replayed.
+
+    The rule options select the mode:
+        "plan": "build" saves the plan without executing it, "execute" replays a saved plan and "run" does both.
+        "plan_path": the plan file (defaults to geoserver_plan.json in the archiver state directory).
+    """
+    # the version of the plan document
+    PLAN_VERSION: int = 1
+
+    def __init__(self, _logger=None, _geoserver_utils: GeoServerUtils = None):
+        """
+        Initializes this class
+
+        :param _logger:
+        :param _geoserver_utils:
+        """
+        # if a reference to a logger is passed in, use it
+        if _logger is not None:
+            # get a handle to a logger
+            self.logger = _logger
+        else:
+            # get the log level and directory from the environment.
+            log_level, log_path = LoggingUtil.prep_for_logging()
+
+            # create a logger
+            self.logger = LoggingUtil.init_logging("APSVIZ.Archiver.GeoServerPlanner", level=log_level, line_format='medium', log_file_path=log_path)
+
+        # use the geoserver utilities passed in, or create a new one
+        self.geoserver_utils: GeoServerUtils = _geoserver_utils if _geoserver_utils is not None else GeoServerUtils(self.logger)
+
+        # get handles to the DB, TDS and rule utilities it uses
+        self.db_info = self.geoserver_utils.db_info
+        self.tds_utils = self.geoserver_utils.tds_utils
+        self.rule_utils: RuleUtils = self.geoserver_utils.rule_utils
+
+        # get the number of geoserver REST calls and directory removals that can be in flight at once
+        self.rest_concurrency: int = int(os.getenv('GEOSERVER_REST_CONCURRENCY', '8'))
+        self.dir_concurrency: int = int(os.getenv('DIR_REMOVE_CONCURRENCY', '8'))
+
+        # get the DB backend used to remove the DB records, sync (the bulk SPs) or async
+        self.db_backend: str = os.getenv('DB_BACKEND', 'sync').lower()
+
+    def process_plan_rule(self, stats: dict, rule: RuleUtils.Rule) -> (bool, dict):
+        """
+        Builds, saves and/or executes a plan as specified in the rule options.
+
+        :param stats:
+        :param rule:
+        :return:
+        """
+        # init the success flag
+        success: bool = True
+
+        # get the plan options
+        mode: str = rule.options.get('plan', 'run')
+        plan_path: str = rule.options.get('plan_path') or os.path.join(GeneralUtils.prep_for_state(), self.get_default_plan_name())
+
+        try:
+            # only remove operations are supported
+            if rule.action_type != ActionType.GEOSERVER_REMOVE:
+                self.logger.error('Error: Only GEOSERVER_REMOVE rules can be planned, rule "%s" is %s.', rule.name, rule.action_type.name)
+
+                # set the failure flag
+                success = False
+            elif mode in ('build', 'run'):
+                # build the plan
+                plan: dict = self.build_plan(rule)
+
+                # save it for review, diffing or replay
+                self.save_plan(plan, plan_path)
+
+                # execute it if requested
+                if mode == 'run':
+                    success, stats = self.execute_plan(stats, rule, plan)
+            elif mode == 'execute':
+                # execute the saved plan
+                success, stats = self.execute_plan(stats, rule, self.load_plan(plan_path))
+            else:
+                self.logger.error('Error: Invalid plan mode "%s" in rule "%s".', mode, rule.name)
+
+                # set the failure flag
+                success = False
+
+        except Exception:
+            self.logger.exception('Exception: Failed to process the geoserver rule plan.')
+
+            # set the failure flag
+            success = False
+
+        # return to the caller
+        return success, stats
+
+    @staticmethod
+    def get_default_plan_name() -> str:
+        """
+        Gets the default plan file name. Each shard has its own plan.
+
+        :return:
+        """
+        # get the shard of this process
+        shard: ShardSelector = ShardSelector()
+
+        # return the name
+        return f'geoserver_plan.{shard.name}.json' if shard.enabled else 'geoserver_plan.json'
+
+    def build_plan(self, rule: RuleUtils.Rule) -> dict:
+        """
+        Collects everything the rule will operate on, with one listing or query per system.
+
+        :param rule:
+        :return:
+        """
+        # get the instances that meet criteria, this scans the geoserver data directory once
+        instance_ids: list = sorted(self.geoserver_utils.get_geoserver_entities_from_dir(rule))
+
+        # resolve the TDS paths of all the instances with a single DB query
+        tds_paths: dict = {}
+
+        if self.tds_utils.tds_url != '':
+            tds_paths = self.tds_utils.get_tds_data_paths([instance_id for instance_id in instance_ids if len(instance_id.split('-')) == 3])
+
+        # get the store names by instance id with one listing per store type
+        store_names: dict = {}
+
+        for store_type in ['coverageStores', 'dataStores']:
+            for store in self.geoserver_utils.get_geoserver_stores_like_instance_id(store_type):
+                store_names.setdefault((store_type, store['name'].split('_')[0]), []).append(store['name'])
+
+        # init the return value
+        ret_val: dict = {'version': self.PLAN_VERSION, 'created': dt.datetime.now().isoformat(), 'rule_name': rule.name,
+                         'action_type': rule.action_type.name, 'geoserver_data_path': self.geoserver_utils.full_geoserver_data_path,
+                         'instances': {}}
+
+        # for each instance
+        for instance_id in instance_ids:
+            # get the obs/mod directory
+            obs_mod_dir: str = os.path.join(self.geoserver_utils.fileserver_obs_path, instance_id)
+
+            # save the targets
+            ret_val['instances'][instance_id] = {
+                'geoserver_dirs': sorted(product_dir.path for product_dir in self.geoserver_utils.instance_dirs.get(instance_id, [])),
+                'obs_mod_dir': obs_mod_dir if os.path.exists(obs_mod_dir) else '',
+                'tds_path': tds_paths.get(instance_id, ''),
+                'stores': {store_type: sorted(store_names.get((store_type, instance_id), [])) for store_type in ['coverageStores', 'dataStores']}}
+
+        self.logger.info('Plan for rule "%s" has %s instance(s).', rule.name, len(instance_ids))
+
+        # return to the caller
+        return ret_val
+
+    def save_plan(self, plan: dict, plan_path: str):
+        """
+        Saves a plan in a form that can be reviewed and diffed.
+
+        :param plan:
+        :param plan_path:
+        :return:
+        """
+        # write the plan
+        with open(plan_path, 'w', encoding='utf-8') as plan_fh:
+            json.dump(plan, plan_fh, indent=2, sort_keys=True)
+
+        self.logger.info('Plan saved to %s.', plan_path)
+
+    @staticmethod
+    def load_plan(plan_path: str) -> dict:
+        """
+        Loads a saved plan.
+
+        :param plan_path:
+        :return:
+        """
+        # read the plan
+        with open(plan_path, encoding='utf-8') as plan_fh:
+            return json.load(plan_fh)
+
+    def execute_plan(self, stats: dict, rule: RuleUtils.Rule, plan: dict) -> (bool, dict):
+        """
+        Executes a plan one system at a time.
+
+        The stats are counted the same way process_geoserver_rule() counts them, once per instance for each DB and directory
+        step, and once per store.
+
+        :param stats:
+        :param rule:
+        :param plan:
+        :return:
+        """
+        # make sure this plan can be executed
+        if plan.get('version') != self.PLAN_VERSION or plan.get('action_type') != ActionType.GEOSERVER_REMOVE.name:
+            self.logger.error('Error: The plan version or action type is not supported.')
+
+            # return to the caller
+            return False, stats
+
+        # get the instances
+        instances: dict = plan['instances']
+        instance_ids: list = sorted(instances)
+
+        self.logger.info('Executing a plan for %s instance(s).', len(instance_ids))
+
+        # step 1-3: remove the DB records, concurrently with the asyncio DB backend
+        if self.db_backend == 'async' and not rule.debug and instance_ids:
+            # get the instances that failed
+            failed: list = self.remove_db_records_async(instance_ids)
+
+            # handle the run stats, once per instance for each of the DB steps
+            stats['removed'] += 3 * (len(instance_ids) - len(failed))
+            stats['failed'] += 3 * len(failed)
+        else:
+            # or in bulk
+            for remove_fn in [self.db_info.remove_obs_mod_db_records_bulk, self.db_info.remove_run_props_db_image_records_bulk,
+                              self.db_info.remove_catalog_db_records_bulk]:
+                # execute the removal if not in debug mode
+                if not rule.debug and instance_ids:
+                    # get the instances that failed
+                    failed = remove_fn(instance_ids)
+                else:
+                    self.logger.debug('Debug mode on. Would have executed %s on %s run(s).', remove_fn.__name__, len(instance_ids))
+                    failed = []
+
+                # handle the run stats
+                stats['removed'] += len(instance_ids) - len(failed)
+                stats['failed'] += len(failed)
+
+        # step 4-5: remove the geoserver and obs/mod directories in parallel
+        dir_jobs: list = [(instance_id, path) for instance_id in instance_ids
+                          for path in instances[instance_id]['geoserver_dirs'] + [instances[instance_id]['obs_mod_dir']] if path]
+
+        dir_results: list = self.run_parallel(self.remove_directory_if_exists, [(rule, path) for _, path in dir_jobs], self.dir_concurrency)
+
+        # get the instances that had a failure
+        failed_instances: set = {instance_id for (instance_id, _), result in zip(dir_jobs, dir_results) if not result}
+
+        # handle the run stats, once per instance
+        for instance_id in instance_ids:
+            if instance_id not in failed_instances:
+                stats['removed'] += 1
+            else:
+                self.logger.error('Error removing the directories of %s', instance_id)
+                stats['failed'] += 1
+
+        # step 6: remove the TDS directories in parallel, using the paths in the plan. the paths that failed to resolve are looked up again
+        self.tds_utils.tds_data_paths.update({instance_id: instances[instance_id]['tds_path'] for instance_id in instance_ids
+                                              if instances[instance_id]['tds_path'] is not None})
+
+        tds_results: list = self.run_parallel(self.geoserver_utils.perform_tds_dir_ops, [(rule, instance_id) for instance_id in instance_ids],
+                                              self.dir_concurrency)
+
+        # handle the run stats
+        stats['removed'] += sum(tds_results)
+        stats['failed'] += len(tds_results) - sum(tds_results)
+
+        # remove the empty TDS directories left behind by all the instances at once
+        if not self.tds_utils.prune_pending_dirs():
+            stats['failed'] += 1
+
+        # step 6: remove the geoserver stores concurrently
+        store_jobs: list = [(rule, store_type, store_name) for instance_id in instance_ids
+                            for store_type, store_names in instances[instance_id]['stores'].items() for store_name in store_names]
+
+        store_results: list = self.run_parallel(self.geoserver_utils.perform_geoserver_store_ops, store_jobs, self.rest_concurrency)
+
+        # handle the run stats
+        stats['removed'] += sum(store_results)
+        stats['failed'] += len(store_results) - sum(store_results)
+
+        # report how fast the geoserver could absorb the deletes
+        if store_jobs:
+            self.logger.info('Geoserver delete rate: %s', self.geoserver_utils.delete_limiter.get_metrics())
+
+        # all the instances were processed
+        stats['swept'] += len(instance_ids)
+
+        # return to the caller
+        return True, stats
+
+    def remove_directory_if_exists(self, rule: RuleUtils.Rule, path: str) -> bool:
+        """
+        Removes a directory. A directory that is already gone (e.g. on a plan replay) is not a failure.
+
+        :param rule:
+        :param path:
+        :return:
+        """
+        # remove the directory if it is still there
+        return not os.path.exists(path) or self.rule_utils.remove_directory(rule, path)
+
+    def remove_db_records_async(self, instance_ids: list) -> list:
+        """
+        Removes the obs/mod, image run prop and catalog member records of the instances with the asyncio DB backend, with up to
+        ASYNC_DB_CONCURRENCY operations in flight at once across both DBs.
+
+        :param instance_ids:
+        :return: the instances that had a failure
+        """
+        async def remove_instances() -> dict:
+            # the connection pools belong to the event loop, so they only live for this call
+            db_info: PGImplementationAsync = PGImplementationAsync(('apsviz', 'adcirc_obs'), self.logger)
+
+            try:
+                # connect and remove the records
+                await db_info.connect()
+
+                return await db_info.remove_instances(instance_ids)
+            finally:
+                await db_info.close()
+
+        try:
+            # run the removals
+            results: dict = asyncio.run(remove_instances())
+        except Exception:
+            self.logger.exception('Error detected removing the DB records with the asyncio DB backend.')
+
+            # none of the instances can be counted as done
+            results = dict.fromkeys(instance_ids, False)
+
+        # return the instances that failed
+        return [instance_id for instance_id, success in results.items() if not success]
+
+    @staticmethod
+    def run_parallel(operation, args_list: list, max_workers: int) -> list:
+        """
+        Runs an operation on a list of arguments with a pool of threads.
+
+        :param operation:
+        :param args_list:
+        :param max_workers:
+        :return: the results of the operation, in the order of the arguments
+        """
+        # run the operations
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            ret_val: list = list(executor.map(lambda args: operation(*args), args_list))
+
+        # return the results
+        return ret_val
@@ -12,9 +12,11 @@
     Author: Phil Owen, 2/16/2023
 """
 import os
-import glob
-from pathlib import Path
+import copy
+import time
+import threading
 from stat import S_ISDIR
+from collections import namedtuple
 import requests
 
 from src.common.logger import LoggingUtil
@@ -23,6 +25,13 @@ from src.common.rule_utils import RuleUtils
 from src.common.rule_enums import ActionType
 from src.common.general_utils import GeneralUtils
 from src.common.tds_utils import TDSUtils
+from src.common.instance_journal import InstanceJournal
+from src.common.rate_limiter import AdaptiveRateLimiter
+from src.common.circuit_breaker import CircuitBreaker, CircuitOpenError
+from src.common.store_name_parser import StoreNameParser
+from src.common.shard import ShardSelector
+from src.common.work_lock import WorkLock
+from src.common.time_budget import TimeBudget, EntityPriority
 
 
 class GeoServerUtils:
@@ -35,6 +44,11 @@ class GeoServerUtils:
     The geoserver operations start with discovering the data directories on the geoserver file system that meet rule criteria (age). The Directory
     name contains the "instance_id" which is used as a key to identify target data in other systems (database records and geoserver images).
     """
+    # define a named tuple for a product directory found in the geoserver data directory
+    GeoServerDir: namedtuple = namedtuple('GeoServerDir', ['path', 'stat'])
+
+    # limits the number of geoserver REST calls in flight at once across all the workspaces being processed
+    rest_semaphore = threading.BoundedSemaphore(int(os.getenv('GEOSERVER_REST_CONCURRENCY', '8')))
 
     def __init__(self, _logger=None):
         """
@@ -78,10 +92,55 @@ class GeoServerUtils:
         # create a TDS utilities class
         self.tds_utils = TDSUtils()
 
-        # init some storage for the run names
-        self.run_names: set = set()
+        # init storage for the product directories of each instance id found in the last geoserver data directory scan
+        self.instance_dirs: dict = {}
+
+        # create the durable journal of the steps completed on each instance
+        self.journal = InstanceJournal(self.logger)
+
+        # create the limiter that paces the geoserver REST deletes to stay within a response time target
+        self.delete_limiter = AdaptiveRateLimiter(float(os.getenv('GEOSERVER_DELETE_TARGET_LATENCY', '2')),
+                                                  float(os.getenv('GEOSERVER_DELETE_MAX_RPS', '10')))
+
+    @property
+    def geoserver_breaker(self) -> CircuitBreaker:
+        """
+        Gets the circuit breaker of the geoserver. It is shared by everything in the process that calls the geoserver.
+
+        :return:
+        """
+        # return the breaker
+        return CircuitBreaker.get('geoserver')
+
+    def for_workspace(self, workspace: str, proj_path: str = None):
+        """
+        Gets a copy of this object that operates on another geoserver workspace and data path.
+
+        The copy has its own data directory scan, store listings and pending TDS directories. The DB connections, journal,
+        delete rate limiter and everything else are shared.
+
+        :param workspace:
+        :param proj_path: the geoserver data path, defaults to this object's
+        :return:
+        """
+        # make a shallow copy
+        ret_val: GeoServerUtils = copy.copy(self)
+
+        # set the workspace
+        ret_val.geoserver_workspace = workspace
+        ret_val.geoserver_proj_path = proj_path or self.geoserver_proj_path
+        ret_val.full_geoserver_data_path = os.path.join(ret_val.geoserver_proj_path, workspace)
+
+        # init the workspace specific state
+        ret_val.instance_dirs = {}
+        ret_val.tds_utils = copy.copy(self.tds_utils)
+        ret_val.tds_utils.tds_data_paths = {}
+        ret_val.tds_utils.pending_prune_dirs = set()
+
+        # return to the caller
+        return ret_val
 
-    def process_geoserver_rule(self, stats: dict, rule: RuleUtils.Rule) -> (bool, dict):
+    def process_geoserver_rule(self, stats: dict, rule: RuleUtils.Rule, budget: TimeBudget = None) -> (bool, dict):
         """
         Does the action specify (copy, move, remove) for the file system, DB and geoserver data for a run.
 
@@ -102,20 +161,23 @@ class GeoServerUtils:
             5. copy, move or remove the obs/mod files from the file server (/fileserver/obs_png/4362-2023030112-gfsforecast).
             6: remove the coverage/data stores for each product in the geoserver
 
+        The instances are processed in the priority order of the rule, until the time budget (if any) is used up.
+
+        :param stats:
+        :param rule:
+        :param budget: the time budget of the rule
         :return:
         """
         # init the success flag
         success: bool = True
 
         # get the stat action type for this rule
-        if rule.action_type == ActionType.GEOSERVER_COPY:
-            rule_action_type_name = 'copied'
-        elif rule.action_type == ActionType.GEOSERVER_MOVE:
-            rule_action_type_name = 'moved'
-        elif rule.action_type == ActionType.GEOSERVER_REMOVE:
-            rule_action_type_name = 'removed'
-        else:
-            # invalid action type, abort
+        rule_action_type_name = {ActionType.GEOSERVER_COPY: 'copied', ActionType.GEOSERVER_MOVE: 'moved',
+                                 ActionType.GEOSERVER_REMOVE: 'removed'}.get(rule.action_type)
+
+        # is this an invalid action type?
+        if rule_action_type_name is None:
+            # abort
             success = False
 
             # handle the run stats
@@ -128,55 +190,101 @@ class GeoServerUtils:
         # these are also considered to be instance ids without a product type.
         instance_ids: set = self.get_geoserver_entities_from_dir(rule)
 
+        # add the instances of this shard an interrupted run left unfinished. their geoserver directories may already be gone
+        if not rule.debug:
+            instance_ids |= set(filter(ShardSelector().owns, self.journal.get_pending_instances(self.journal_key(rule))))
+
+            # a scan limited to the targeted instances missed the pending ones, add their directories with one more scan
+            if rule.options and 'instance_ids' in rule.options and instance_ids - self.instance_dirs.keys():
+                self.instance_dirs = {**self.instance_dirs, **self.scan_geoserver_data_dir(instance_ids - self.instance_dirs.keys())}
+
+        # resolve the TDS paths of all the instances with a single DB query
+        if rule.action_type == ActionType.GEOSERVER_REMOVE and self.tds_utils.tds_url != '':
+            self.tds_utils.get_tds_data_paths([instance_id for instance_id in instance_ids if len(instance_id.split('-')) == 3])
+
         try:
             # create a list of functions to call to perform DB and directory operations
             operations: list = [self.perform_obs_mod_db_ops, self.perform_apsviz_db_ops, self.perform_catalog_db_ops, self.perform_dir_ops,
                                 self.perform_tds_dir_ops]
 
-            # for each entity
-            for instance_id in instance_ids:
-                self.logger.info('Geoserver ops operating on run %s.', instance_id)
-
-                # for each operation to perform
-                for operation in operations:
-                    self.logger.debug('Running %s on %s', operation.__name__, instance_id)
-
-                    # step 1: remove the obs/mod records from the adcirc_obs DB.
-                    # step 2: remove the image.* records from the run properties DB.
-                    # step 3. remove the catalog member records from the apsviz DB.
-                    # step 4. copy, move or remove the files from the geoserver data directory.
-                    # step 5. copy, move or remove the files from the obs/mod file directory.
-                    # step 6. copy, move or remove the files from the TDS file directory.
-                    if operation(rule, instance_id):
-                        # handle the run stats
-                        stats[rule_action_type_name] += 1
-                    else:
-                        self.logger.error('Error running %s on %s', operation.__name__, instance_id)
-
-                        # handle the run stats
-                        stats['failed'] += 1
-
-                # step 6: remove the coverage/data stores for each product in the geoserver
-                for store_type in ['coverageStores', 'dataStores']:
-                    # get the filtered list of the stores by instance id. this id includes the product type
-                    instance_id_products: list = self.get_geoserver_stores_like_instance_id(store_type, instance_id)
-
-                    # for each instance (+ a product type) found
-                    for instance_id_product in instance_id_products:
-                        # remove the product from the geoserver
-                        if self.perform_geoserver_store_ops(rule, store_type, instance_id_product):
-                            self.logger.debug('Removed the %s for: %s', store_type, instance_id_product)
+            # get the locks that keep concurrent runners off the same instances
+            work_lock: WorkLock = WorkLock(self.logger, self.db_info)
+
+            # order the instances by the priority of the rule
+            instance_ids = EntityPriority.order({instance_id: [product_dir.path for product_dir in self.instance_dirs.get(instance_id, [])]
+                                                 for instance_id in instance_ids}, EntityPriority.get_priority(rule.options))
 
+            # for each entity, until the rule is out of time
+            for instance_id in (budget or TimeBudget()).take(rule.name, instance_ids):
+                # lock the instance, skipping it if another runner is working on it
+                with work_lock.hold(f'geoserver/{self.geoserver_workspace}/{instance_id}') as acquired:
+                    if not acquired:
+                        continue
+
+                    self.logger.info('Geoserver ops operating on run %s.', instance_id)
+
+                    # get the steps that an interrupted run already completed on this instance
+                    completed_steps: set = self.journal.get_completed_steps(self.journal_key(rule), instance_id)
+
+                    # init the flag that indicates all the steps on this instance succeeded
+                    instance_success: bool = True
+
+                    # for each operation to perform
+                    for operation in operations:
+                        # skip the step if it was already completed
+                        if operation.__name__ in completed_steps:
+                            self.logger.debug('Skipping %s on %s, it was completed in a previous run', operation.__name__, instance_id)
+                            continue
+
+                        self.logger.debug('Running %s on %s', operation.__name__, instance_id)
+
+                        # step 1: remove the obs/mod records from the adcirc_obs DB.
+                        # step 2: remove the image.* records from the run properties DB.
+                        # step 3. remove the catalog member records from the apsviz DB.
+                        # step 4. copy, move or remove the files from the geoserver data directory.
+                        # step 5. copy, move or remove the files from the obs/mod file directory.
+                        # step 6. copy, move or remove the files from the TDS file directory.
+                        if operation(rule, instance_id):
                             # handle the run stats
                             stats[rule_action_type_name] += 1
+
+                            # record the completed step
+                            self.journal_step(rule, instance_id, operation.__name__)
                         else:
-                            self.logger.error('Error removing the %s for: %s', store_type, instance_id_product)
+                            self.logger.error('Error running %s on %s', operation.__name__, instance_id)
 
                             # handle the run stats
                             stats['failed'] += 1
 
-                # if we got this far, it ran to a successful completion
-                stats['swept'] += 1
+                            # this instance will have to be revisited
+                            instance_success = False
+
+                    # step 6: remove the coverage/data stores for each product in the geoserver
+                    if 'geoserver_store_ops' not in completed_steps:
+                        # remove the stores
+                        stores_success, stats = self.perform_instance_store_ops(stats, rule, instance_id, rule_action_type_name)
+
+                        # record the completed step
+                        if stores_success:
+                            self.journal_step(rule, instance_id, 'geoserver_store_ops')
+                        else:
+                            instance_success = False
+
+                    # all the steps are done, the journal no longer needs this instance
+                    if instance_success and not rule.debug:
+                        self.journal.clear_instance(self.journal_key(rule), instance_id)
+
+                    # if we got this far, it ran to a successful completion
+                    stats['swept'] += 1
+
+            # remove the empty TDS directories left behind by all the instances at once
+            if not self.tds_utils.prune_pending_dirs():
+                # handle the run stats
+                stats['failed'] += 1
+
+            # report how fast the geoserver could absorb the deletes
+            if self.delete_limiter.requests > 0:
+                self.logger.info('Geoserver delete rate: %s', self.delete_limiter.get_metrics())
 
         except Exception:
             self.logger.exception('Exception: Failed to process the geoserver rule.')
@@ -187,6 +295,76 @@ class GeoServerUtils:
         # return to the caller
         return success, stats
 
+    def perform_instance_store_ops(self, stats: dict, rule: RuleUtils.Rule, instance_id: str, rule_action_type_name: str) -> (bool, dict):
+        """
+        Removes the coverage/data stores for each product of an instance in the geoserver.
+
+        :param stats:
+        :param rule:
+        :param instance_id:
+        :param rule_action_type_name:
+        :return:
+        """
+        # init the success flag
+        success: bool = True
+
+        # the stores can't be listed if the geoserver is down
+        if self.geoserver_breaker.is_open():
+            self.logger.error('Error: The geoserver is down, the stores for %s were not removed.', instance_id)
+
+            # handle the run stats
+            stats['failed'] += 1
+
+            # return to the caller
+            return False, stats
+
+        for store_type in ['coverageStores', 'dataStores']:
+            # get the filtered list of the stores by instance id. this id includes the product type
+            instance_id_products: list = self.get_geoserver_stores_like_instance_id(store_type, instance_id)
+
+            # for each instance (+ a product type) found
+            for instance_id_product in instance_id_products:
+                # remove the product from the geoserver
+                if self.perform_geoserver_store_ops(rule, store_type, instance_id_product):
+                    self.logger.debug('Removed the %s for: %s', store_type, instance_id_product)
+
+                    # handle the run stats
+                    stats[rule_action_type_name] += 1
+                else:
+                    self.logger.error('Error removing the %s for: %s', store_type, instance_id_product)
+
+                    # handle the run stats
+                    stats['failed'] += 1
+
+                    # set the failure flag
+                    success = False
+
+        # return to the caller
+        return success, stats
+
+    def journal_key(self, rule: RuleUtils.Rule) -> str:
+        """
+        Gets the key of the journal entries for a rule. The instances of each workspace are tracked separately.
+
+        :param rule:
+        :return:
+        """
+        # return the key
+        return f'{rule.action_type.name}/{self.geoserver_workspace}'
+
+    def journal_step(self, rule: RuleUtils.Rule, instance_id: str, step: str):
+        """
+        Records a completed step of an instance so an interrupted run can skip it. Nothing is recorded in debug mode.
+
+        :param rule:
+        :param instance_id:
+        :param step:
+        :return:
+        """
+        # only record the steps that really happened
+        if not rule.debug:
+            self.journal.mark_step_completed(self.journal_key(rule), instance_id, step)
+
     def create_geoserver_store(self, store_type: str, instance_id: str) -> bool:
         """
         Adds a GeoServer store for the store type and instance id pas
@@ -219,7 +397,7 @@ class GeoServerUtils:
                                   'type': 'imagemosaic'}}
 
             # execute the post
-            ret_val = requests.post(url, auth=(self.username, self.password), json=store_config, timeout=10)
+            ret_val = self.geoserver_request('POST', url, 10, json=store_config)
 
             # was the call unsuccessful? 201 is returned for success for this one
             if ret_val.status_code != 201:
@@ -229,6 +407,11 @@ class GeoServerUtils:
                 # set the failure flag
                 success = False
 
+        except CircuitOpenError:
+            self.logger.error('Error: The geoserver is down, %s "%s" was not created.', store_type, instance_id)
+
+            # set the failure code
+            success = False
         except Exception:
             # log the error
             self.logger.exception('Exception when creating %s for "%s"', store_type, instance_id)
@@ -257,7 +440,7 @@ class GeoServerUtils:
             url = f'{self.geoserver_url}/rest/workspaces/{self.geoserver_workspace}/{store_type.lower()}/{instance_id}'
 
             # execute the get
-            result_val = requests.get(url, auth=(self.username, self.password), timeout=10)
+            result_val = self.geoserver_request('GET', url, 10)
 
             # was the call unsuccessful?
             if result_val.status_code != 200:
@@ -271,6 +454,8 @@ class GeoServerUtils:
                 # save the result
                 ret_val = result_val.json()
 
+        except CircuitOpenError:
+            self.logger.error('Error: The geoserver is down, %s store "%s" was not retrieved.', store_type, instance_id)
         except Exception:
             self.logger.exception('Exception getting %s store "%s"', store_type, instance_id)
 
@@ -285,10 +470,11 @@ class GeoServerUtils:
             - valid store types are coverageStores and dataStores
             - the url store type is all lowercase
             - keys in the response data array are [store type][singular store type]
+            - the response is streamed and only the store names are kept, so large workspaces use little memory
 
         :param store_type:
         :param instance_id:
-        :return:
+        :return: the store names that start with the instance id, or [{'name': <store name>}, ...] for all the stores
         """
         # init the return value
         ret_val: list = []
@@ -297,34 +483,24 @@ class GeoServerUtils:
             # build the URL to the service
             url = f'{self.geoserver_url}/rest/workspaces/{self.geoserver_workspace}/{store_type.lower()}'
 
-            # execute the get
-            response: requests.Response = requests.get(url, auth=(self.username, self.password), timeout=10)
-
-            # was the call unsuccessful?
-            if response.status_code != 200:
-                # log the error
-                self.logger.error('Error %s gathering all geoserver %s stores.', response.status_code, store_type)
-
-                # set the failure flag
-                ret_val = []
-            # get the return in the correct format
-            else:
-                # get the json from the return
-                result_val: dict = response.json()
-
-                # get the root of the stores
-                store: dict = result_val.get(store_type)
-
-                # get the array of stores
-                stores: list = store.get(store_type[:-1])
+            # execute the get, the body is read as it is parsed
+            with self.geoserver_request('GET', url, 10, stream=True) as response:
+                # was the call unsuccessful?
+                if response.status_code != 200:
+                    # log the error
+                    self.logger.error('Error %s gathering all geoserver %s stores.', response.status_code, store_type)
 
+                    # set the failure flag
+                    ret_val = []
                 # only return the matches if there was a search criteria
-                if instance_id is not None:
+                elif instance_id is not None:
                     # save all the coverage store names that meet filter criteria
-                    ret_val = [x['name'] for x in stores if x['name'].startswith(instance_id)]
+                    ret_val = [name for name in StoreNameParser.iter_store_names(response, store_type) if name.startswith(instance_id)]
                 else:
-                    ret_val = stores
+                    ret_val = [{'name': name} for name in StoreNameParser.iter_store_names(response, store_type)]
 
+        except CircuitOpenError:
+            self.logger.error('Error: The geoserver is down, the %s stores were not gathered.', store_type)
         except Exception:
             self.logger.exception('Exception gathering all geoserver %s stores', store_type)
 
@@ -334,6 +510,47 @@ class GeoServerUtils:
         # return the json to the caller
         return ret_val
 
+    def scan_geoserver_data_dir(self, instance_ids: set = None) -> dict:
+        """
+        Scans the geoserver data directory once and groups the product directories found by instance id.
+
+        The result is saved so that the criteria check, the tropical filter and the directory operations can all use it.
+
+        :param instance_ids: only these instances are collected (and stat'ed) when specified
+        :return: a dict of instance id to a list of GeoServerDir (path, stat) tuples
+        """
+        # init the return
+        ret_val: dict = {}
+
+        try:
+            # get a listing of the contents in the geoserver data directory
+            with os.scandir(self.full_geoserver_data_path) as entities:
+                # loop through the directory entries
+                for entity in entities:
+                    # skip the instances that were not asked for
+                    if instance_ids is not None and entity.name.split('_')[0] not in instance_ids:
+                        continue
+
+                    try:
+                        # get the details of the entity
+                        entity_details = entity.stat()
+                    # the entity was removed during the scan
+                    except FileNotFoundError:
+                        continue
+
+                    # make sure the entity is a directory
+                    if S_ISDIR(entity_details.st_mode):
+                        # add the product directory to the list for the base part of the instance id
+                        ret_val.setdefault(entity.name.split('_')[0], []).append(self.GeoServerDir(entity.path, entity_details))
+        except FileNotFoundError:
+            self.logger.error('Error: The geoserver data directory %s was not found.', self.full_geoserver_data_path)
+
+        # save the result for the directory operations
+        self.instance_dirs = ret_val
+
+        # return to the caller
+        return ret_val
+
     def get_geoserver_entities_from_dir(self, rule: RuleUtils.Rule) -> set:
         """
         Method to collect and return the run names from the data file path that meet criteria.
@@ -344,26 +561,21 @@ class GeoServerUtils:
         # init the return
         ret_val: set = set()
 
-        # get a listing of the contents in the geoserver data directory
-        entities = glob.glob(os.path.join(self.full_geoserver_data_path, '*'))
+        # scan the geoserver data directory, limited to the instances the rule targets (e.g. from run events)
+        instance_dirs: dict = self.scan_geoserver_data_dir(set(rule.options['instance_ids']) if rule.options and 'instance_ids' in rule.options
+                                                           else None)
 
-        # loop through the director names and validate
-        for entity in entities:
-            # get the details of the entity
-            entity_details = os.stat(entity)
+        # get the shard of this process
+        shard: ShardSelector = ShardSelector()
 
-            # make sure the entity still exists and is a directory
-            if not os.path.exists(entity) or not S_ISDIR(entity_details.st_mode):
+        # loop through the instances and validate
+        for instance_id, product_dirs in instance_dirs.items():
+            # skip the instances owned by other shards
+            if not shard.owns(instance_id):
                 continue
 
-            # does the entity meet criteria?
-            if self.rule_utils.meets_criteria(rule, entity_details):
-                # get the full instance id
-                full_instance_id: str = Path(entity).parts[-1]
-
-                # get the base part of the instance id
-                instance_id: str = full_instance_id.split('_')[0]
-
+            # does any of the product directories meet criteria?
+            if any(self.rule_utils.meets_criteria(rule, product_dir.stat) for product_dir in product_dirs):
                 # is this a tropical run?
                 if self.db_info.is_tropical_run(instance_id):
                     self.logger.info('Warning: %s was detected to be a tropical run. No processing will occur on this item.', instance_id)
@@ -394,7 +606,7 @@ class GeoServerUtils:
                 # if we are not in debug mode
                 if not rule.debug:
                     # remove the records
-                    success = self.tds_utils.remove_dirs(instance_id)
+                    success = self.tds_utils.remove_dirs(instance_id, defer_prune=True)
                 else:
                     self.logger.debug('Debug mode on. Would have executed perform_tds_dir_ops( %s )', instance_id)
             else:
@@ -429,16 +641,16 @@ class GeoServerUtils:
 
         # execute the call if not in debug mode
         if not rule.debug:
-            # make sure the entity still exists
-            if not os.path.exists(obs_mod_dir):
+            # make sure the entity still exists. directories that are already gone (e.g. removed by an interrupted run) don't need removing
+            if not os.path.exists(obs_mod_dir) and rule.action_type != ActionType.GEOSERVER_REMOVE:
                 success = False
                 self.logger.error('OBS/MOD (%s) directory not found.', obs_mod_dir)
             else:
-                # get a listing of the dirs associated to this instance id
-                entities = glob.glob(geo_svr_dir)
+                # get the dirs associated to this instance id from the scan of the data directory
+                entities: list = [product_dir.path for product_dir in self.instance_dirs.get(instance_id, [])]
 
                 # if the directory wasn't found
-                if len(entities) == 0:
+                if len(entities) == 0 and rule.action_type != ActionType.GEOSERVER_REMOVE:
                     self.logger.debug('No directory entities found in %s', geo_svr_dir)
 
                     # set the error flag
@@ -474,7 +686,8 @@ class GeoServerUtils:
                             success = success and self.rule_utils.remove_directory(rule, entity)
 
                         # process the obs/mod directory
-                        success = success and self.rule_utils.remove_directory(rule, obs_mod_dir)
+                        if os.path.exists(obs_mod_dir):
+                            success = success and self.rule_utils.remove_directory(rule, obs_mod_dir)
 
                 # check the return
                 if not success:
@@ -580,8 +793,8 @@ class GeoServerUtils:
 
                 # execute the call if not in debug mode and is a remove operation
                 if not rule.debug:
-                    # execute the delete
-                    ret_val = requests.delete(url, auth=(self.username, self.password), timeout=60)
+                    # execute the delete at a rate the geoserver can absorb
+                    ret_val = self.rate_limited_delete(url)
 
                     # the coverage store wasn't found
                     if ret_val.status_code == 404:
@@ -596,6 +809,12 @@ class GeoServerUtils:
                         success = False
                 else:
                     self.logger.debug('Debug mode on. Would have executed: perform_geoserver_store_ops( %s, %s )', store_type, instance_id)
+            except CircuitOpenError:
+                # log the error
+                self.logger.error('Error: The geoserver is down, store %s for "%s" was not removed.', store_type, instance_id)
+
+                # set the failure code
+                success = False
             except Exception:
                 # log the error
                 self.logger.exception('Exception when performing on store %s for "%s"', store_type, instance_id)
@@ -612,6 +831,87 @@ class GeoServerUtils:
         # return pass/fail
         return success
 
+    def rate_limited_delete(self, url: str) -> requests.Response:
+        """
+        Executes a geoserver REST delete paced by the adaptive rate limiter. The response time and outcome adjust the rate.
+
+        :param url:
+        :return:
+        """
+        # fail fast rather than wait for a slot if the geoserver is down
+        if self.geoserver_breaker.is_open():
+            raise CircuitOpenError('geoserver')
+
+        # wait for a slot
+        self.delete_limiter.acquire()
+
+        # get the start time
+        start: float = time.monotonic()
+
+        try:
+            # execute the delete
+            ret_val: requests.Response = self.geoserver_request('DELETE', url, 60)
+        except Exception:
+            # timeouts and connection errors mean the geoserver is struggling
+            self.delete_limiter.record(time.monotonic() - start, False)
+
+            # let the caller handle it
+            raise
+
+        # server errors count against the rate, anything else is a response the geoserver handled
+        self.delete_limiter.record(time.monotonic() - start, ret_val.status_code < 500)
+
+        # return to the caller
+        return ret_val
+
+    def geoserver_request(self, method: str, url: str, timeout: float, **kwargs) -> requests.Response:
+        """
+        Executes a geoserver REST request through the geoserver circuit breaker.
+
+        Connection errors, timeouts and server errors count as failures. Once the circuit is open, CircuitOpenError is raised
+        without making the request until the cool-down has passed.
+
+        :param method:
+        :param url:
+        :param timeout:
+        :param kwargs:
+        :return:
+        """
+        # fail fast if the geoserver is down
+        if not self.geoserver_breaker.allow():
+            raise CircuitOpenError('geoserver')
+
+        try:
+            # execute the request when there is a free slot
+            with self.rest_semaphore:
+                ret_val: requests.Response = requests.request(method, url, auth=(self.username, self.password), timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            # the geoserver could not be reached
+            self.record_geoserver_failure()
+
+            # let the caller handle it
+            raise
+
+        # update the circuit
+        if ret_val.status_code >= 500:
+            self.record_geoserver_failure()
+        else:
+            self.geoserver_breaker.record_success()
+
+        # return to the caller
+        return ret_val
+
+    def record_geoserver_failure(self):
+        """
+        Records a failed geoserver request, logging when the circuit opens.
+
+        :return:
+        """
+        # record the failure
+        if self.geoserver_breaker.record_failure():
+            self.logger.error('Error: The geoserver is down. Its circuit is open, geoserver calls will fail fast for the next %s seconds.',
+                              self.geoserver_breaker.cool_down)
+
     def perform_obs_mod_db_ops(self, rule: RuleUtils.Rule, instance_id: str) -> (bool, object):
         """
         removes the obs/mod adcirc_obs DB records associated to the run name
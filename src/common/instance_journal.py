@@ -0,0 +1,181 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Instance journal - Persists the progress of each instance through the geoserver rule steps between archiver runs.
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import time
+import sqlite3
+import threading
+
+from src.common.logger import LoggingUtil
+from src.common.general_utils import GeneralUtils
+
+
+class InstanceJournal:
+    """
+    Class that keeps a durable (SQLite) journal of the steps completed on each instance by a geoserver rule action.
+
+    A step is recorded as soon as it succeeds, so a run that is interrupted can skip the completed steps of an instance
+    on the next run. The entries of an instance are removed once all of its steps have completed, so the journal only
+    holds the instances that still have work left.
+    """
+
+    def __init__(self, _logger=None, journal_path: str = None):
+        """
+        Initializes this class
+
+        :param _logger:
+        :param journal_path:
+        """
+        # if a reference to a logger is passed in, use it
+        if _logger is not None:
+            # get a handle to a logger
+            self.logger = _logger
+        else:
+            # get the log level and directory from the environment.
+            log_level, log_path = LoggingUtil.prep_for_logging()
+
+            # create a logger
+            self.logger = LoggingUtil.init_logging("APSVIZ.Archiver.InstanceJournal", level=log_level, line_format='medium', log_file_path=log_path)
+
+        # get the location of the journal file
+        if journal_path is None:
+            journal_path = os.path.join(GeneralUtils.prep_for_state(), 'instance_journal.sqlite')
+
+        # save the journal file path
+        self.journal_path: str = journal_path
+
+        # the connection can be shared across threads so serialize access to it
+        self.lock = threading.Lock()
+
+        # init the DB connection
+        self.conn = None
+
+        try:
+            # open the journal
+            self.conn = sqlite3.connect(self.journal_path, check_same_thread=False)
+
+            # create the journal table if it does not exist
+            self.conn.execute('CREATE TABLE IF NOT EXISTS instance_step (action_type TEXT NOT NULL, instance_id TEXT NOT NULL, step TEXT NOT NULL, '
+                              'completed REAL NOT NULL, PRIMARY KEY (action_type, instance_id, step))')
+
+            # save the table creation
+            self.conn.commit()
+        except sqlite3.Error:
+            self.logger.exception('Error opening the instance journal %s. Journaling is disabled.', self.journal_path)
+
+            # disable the journal
+            self.conn = None
+
+    def __del__(self):
+        """
+        Closes the journal connection.
+
+        :return:
+        """
+        # if there is a connection, close it
+        if getattr(self, 'conn', None) is not None:
+            self.conn.close()
+
+    def get_completed_steps(self, action_type: str, instance_id: str) -> set:
+        """
+        Gets the steps that have already been completed on an instance.
+
+        :param action_type:
+        :param instance_id:
+        :return:
+        """
+        # init the return value
+        ret_val: set = set()
+
+        # if the journal is available
+        if self.conn is not None:
+            try:
+                with self.lock:
+                    # get the completed steps
+                    rows = self.conn.execute('SELECT step FROM instance_step WHERE action_type = ? AND instance_id = ?',
+                                             (action_type, instance_id)).fetchall()
+
+                # save the step names
+                ret_val = {row[0] for row in rows}
+            except sqlite3.Error:
+                self.logger.exception('Error reading the instance journal for %s.', instance_id)
+
+        # return to the caller
+        return ret_val
+
+    def get_pending_instances(self, action_type: str) -> set:
+        """
+        Gets the instances that have completed some, but not all, of their steps.
+
+        :param action_type:
+        :return:
+        """
+        # init the return value
+        ret_val: set = set()
+
+        # if the journal is available
+        if self.conn is not None:
+            try:
+                with self.lock:
+                    # get the instances
+                    rows = self.conn.execute('SELECT DISTINCT instance_id FROM instance_step WHERE action_type = ?', (action_type,)).fetchall()
+
+                # save the instance ids
+                ret_val = {row[0] for row in rows}
+            except sqlite3.Error:
+                self.logger.exception('Error reading the instance journal for %s.', action_type)
+
+        # return to the caller
+        return ret_val
+
+    def mark_step_completed(self, action_type: str, instance_id: str, step: str):
+        """
+        Records the completion of a step on an instance. The record is committed before returning.
+
+        :param action_type:
+        :param instance_id:
+        :param step:
+        :return:
+        """
+        # if the journal is available
+        if self.conn is not None:
+            try:
+                with self.lock:
+                    # insert or refresh the record
+                    self.conn.execute('INSERT OR REPLACE INTO instance_step (action_type, instance_id, step, completed) VALUES (?, ?, ?, ?)',
+                                      (action_type, instance_id, step, time.time()))
+
+                    # save the record
+                    self.conn.commit()
+            except sqlite3.Error:
+                self.logger.exception('Error writing the instance journal for %s.', instance_id)
+
+    def clear_instance(self, action_type: str, instance_id: str):
+        """
+        Removes the records of an instance once all of its steps have completed.
+
+        :param action_type:
+        :param instance_id:
+        :return:
+        """
+        # if the journal is available
+        if self.conn is not None:
+            try:
+                with self.lock:
+                    # remove the records
+                    self.conn.execute('DELETE FROM instance_step WHERE action_type = ? AND instance_id = ?', (action_type, instance_id))
+
+                    # save the removal
+                    self.conn.commit()
+            except sqlite3.Error:
+                self.logger.exception('Error clearing the instance journal for %s.', instance_id)
@@ -13,14 +13,24 @@
 """
 
 import os
+import time
+import queue
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import threading
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 
 class LoggingUtil:
     """
         Creates and configures a logger
+
+        When LOG_QUEUE is true the formatting and writing of log records is done by a QueueListener on a background thread.
+        The logging call only puts the record on a queue. The queues are drained at exit.
     """
+    # the queue listeners that have been started
+    listeners: list = []
+
     @staticmethod
     def init_logging(name, level=logging.INFO, line_format='short', log_file_path=None):
         """
@@ -55,6 +65,9 @@ class LoggingUtil:
         # dont allow message propagation
         logger.propagate = False
 
+        # init the handlers that do the formatting and writing
+        handlers: list = []
+
         # if there was a file path passed in use it
         if log_file_path is not None:
             # create a rotating file handler, 1mb max per file with a max number of 10 files
@@ -66,15 +79,67 @@ class LoggingUtil:
             # set the log level
             file_handler.setLevel(level)
 
-            # add the handler to the logger
-            logger.addHandler(file_handler)
+            # save the handler
+            handlers.append(file_handler)
+
+        # save the console handler
+        handlers.append(stream_handler)
+
+        # in queue mode the handlers are run by a listener on a background thread
+        if LoggingUtil.queue_mode():
+            # create the queue
+            log_queue: queue.Queue = queue.Queue(-1)
+
+            # create and start the listener
+            listener: QueueListener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+            listener.start()
+
+            # stop the listeners at exit so the queued records are written
+            if not LoggingUtil.listeners:
+                atexit.register(LoggingUtil.stop_listeners)
 
-        # add the console handler to the logger
-        logger.addHandler(stream_handler)
+            # save the listener
+            LoggingUtil.listeners.append(listener)
+
+            # the logger only queues the records
+            logger.addHandler(QueueHandler(log_queue))
+        else:
+            # add the handlers to the logger
+            for handler in handlers:
+                logger.addHandler(handler)
 
         # return to the caller
         return logger
 
+    @staticmethod
+    def queue_mode() -> bool:
+        """
+        Checks if the log records are written on a background thread.
+
+        :return:
+        """
+        return os.getenv('LOG_QUEUE', 'false').lower() in ('true', '1', 'yes')
+
+    @staticmethod
+    def aggregate_mode() -> bool:
+        """
+        Checks if the per-entity log lines are replaced by periodic counters.
+
+        :return:
+        """
+        return os.getenv('LOG_AGGREGATE', 'false').lower() in ('true', '1', 'yes')
+
+    @staticmethod
+    def stop_listeners():
+        """
+        Stops the queue listeners after they have written the queued records.
+
+        :return:
+        """
+        # stop each listener, this waits for its queue to drain
+        while LoggingUtil.listeners:
+            LoggingUtil.listeners.pop().stop()
+
     @staticmethod
     def prep_for_logging() -> (int, str):
         """
@@ -91,3 +156,68 @@ class LoggingUtil:
 
         # return to the caller
         return log_level, log_path
+
+
+class LogCounters:
+    """
+        Counts the per-entity events of a rule and logs the counts periodically, in place of a log line per entity.
+
+        The counts are logged every LOG_AGGREGATE_INTERVAL seconds (default 30) and when the rule is complete.
+    """
+    def __init__(self, logger, rule_name: str, interval: float = None):
+        """
+        Initializes this class
+
+        :param logger:
+        :param rule_name:
+        :param interval: the number of seconds between logging the counts, defaults to LOG_AGGREGATE_INTERVAL
+        """
+        # save the logger and rule name
+        self.logger = logger
+        self.rule_name: str = rule_name
+
+        # get the number of seconds between logging the counts
+        self.interval: float = float(os.getenv('LOG_AGGREGATE_INTERVAL', '30')) if interval is None else interval
+
+        # the lock protects everything below
+        self.lock = threading.Lock()
+
+        # init the counts by event and the time they were last logged
+        self.counts: dict = {}
+        self.last_logged: float = time.monotonic()
+
+    def count(self, event: str, amount: int = 1):
+        """
+        Counts an event, logging the counts if the interval has passed.
+
+        :param event:
+        :param amount:
+        :return:
+        """
+        with self.lock:
+            # count the event
+            self.counts[event] = self.counts.get(event, 0) + amount
+
+            # is it time to log the counts?
+            if time.monotonic() - self.last_logged >= self.interval:
+                self.last_logged = time.monotonic()
+                self.logger.info('Rule "%s" progress: %s', self.rule_name, self.format_counts())
+
+    def close(self):
+        """
+        Logs the final counts.
+
+        :return:
+        """
+        with self.lock:
+            # log the totals if anything was counted
+            if self.counts:
+                self.logger.info('Rule "%s" totals: %s', self.rule_name, self.format_counts())
+
+    def format_counts(self) -> str:
+        """
+        Formats the counts for logging.
+
+        :return:
+        """
+        return ', '.join(f'{event}: {count}' for event, count in sorted(self.counts.items()))
@@ -11,8 +11,13 @@
 
     Author: Phil Owen, RENCI.org
 """
+import os
+import json
+import threading
+
 from src.common.pg_utils_multi import PGUtilsMultiConnect
 from src.common.logger import LoggingUtil
+from src.common.tropical_cache import TropicalRunCache
 
 
 class PGImplementation(PGUtilsMultiConnect):
@@ -22,6 +27,23 @@ class PGImplementation(PGUtilsMultiConnect):
         Note this class is inherited from the PGUtilsMultiConnect class
         which has all the connection and cursor handling.
     """
+    # the parameterized SQL statements used by the archiver. these are shared with the async implementation
+    SQL_REMOVE_CATALOG_MEMBER: str = 'SELECT remove_catalog_member($1)'
+    SQL_IS_TROPICAL_RUN: str = 'SELECT is_tropical_run($1)'
+    SQL_REMOVE_IMAGE_RUN_PROPS: str = 'SELECT remove_image_run_props($1)'
+    SQL_REMOVE_ADCIRC_OBS_STATIONS: str = 'SELECT * FROM remove_adcirc_obs_stations($1)'
+    SQL_GET_RUN_PROPS: str = 'SELECT * FROM public.get_run_prop_items_json($1, $2)'
+    SQL_REMOVE_CATALOG_MEMBERS_BULK: str = 'SELECT remove_catalog_members_bulk($1)'
+    SQL_REMOVE_IMAGE_RUN_PROPS_BULK: str = 'SELECT remove_image_run_props_bulk($1)'
+    SQL_REMOVE_ADCIRC_OBS_STATIONS_BULK: str = 'SELECT remove_adcirc_obs_stations_bulk($1)'
+    SQL_GET_RUN_DOWNLOAD_URLS: str = 'SELECT public.get_run_prop_download_urls($1)'
+    SQL_GET_RUN_INSTANCE_NAMES: str = 'SELECT public.get_run_instance_names()'
+    SQL_GET_OBS_MOD_INSTANCE_NAMES: str = 'SELECT public.get_adcirc_obs_instance_names()'
+    SQL_TRY_ADVISORY_LOCK: str = 'SELECT pg_try_advisory_lock($1)'
+    SQL_ADVISORY_UNLOCK: str = 'SELECT pg_advisory_unlock($1)'
+    SQL_ENQUEUE_WORK_TASKS: str = 'SELECT public.archiver_enqueue_tasks($1, $2)'
+    SQL_CLAIM_WORK_TASK: str = 'SELECT public.archiver_claim_task($1, $2, $3)'
+    SQL_COMPLETE_WORK_TASK: str = 'SELECT public.archiver_complete_task($1, $2, $3, $4, $5)'
 
     def __init__(self, db_names: tuple, _logger=None, _auto_commit=True):
         # if a reference to a logger is passed in, use it
@@ -38,6 +60,19 @@ class PGImplementation(PGUtilsMultiConnect):
         # init the base class
         PGUtilsMultiConnect.__init__(self, 'APSViz.Settings', db_names, _logger=self.logger, _auto_commit=_auto_commit)
 
+        # create the persistent cache of tropical run checks
+        self.tropical_cache = TropicalRunCache(self.logger)
+
+        # get the number of instances removed per transaction in bulk operations
+        self.bulk_batch_size: int = int(os.getenv('DB_BULK_BATCH_SIZE', '500'))
+
+        # init the dedicated apsviz DB connection the advisory locks are held on, and the ids of the locks held on it
+        self.lock_conn = None
+        self.advisory_locks: set = set()
+
+        # serializes the use of the lock connection
+        self.advisory_lock = threading.Lock()
+
     def __del__(self):
         """
         Calls super base class to clean up DB connections and cursors.
@@ -47,6 +82,10 @@ class PGImplementation(PGUtilsMultiConnect):
         # clean up connections and cursors
         PGUtilsMultiConnect.__del__(self)
 
+        # closing the lock connection releases its locks
+        if getattr(self, 'lock_conn', None) is not None:
+            self.lock_conn.close()
+
     def remove_catalog_db_records(self, run_name: str):
         """
         Removes the adcirc_obs stations that are associated to the instance id from the DB.
@@ -60,10 +99,10 @@ class PGImplementation(PGUtilsMultiConnect):
 
         try:
             # build up the sql
-            sql = f"SELECT remove_catalog_member('{run_name}%')"
+            sql = self.SQL_REMOVE_CATALOG_MEMBER
 
             # execute the sql
-            sql_ret = self.exec_sql('apsviz', sql)
+            sql_ret = self.exec_prepared('apsviz', sql, (f'{run_name}%',))
 
             # check the result
             if int(sql_ret) < 0:
@@ -94,26 +133,36 @@ class PGImplementation(PGUtilsMultiConnect):
         # init storage for the SQL
         sql: str = ''
 
-        try:
-            # build up the sql
-            sql = f"SELECT is_tropical_run('{run_name}%')"
+        # has this run already been classified?
+        cached = self.tropical_cache.get(run_name)
 
-            # execute the sql
-            sql_ret = self.exec_sql('apsviz', sql)
+        # if so, there is no need to ask the DB
+        if cached is not None:
+            ret_val = cached
+        else:
+            try:
+                # build up the sql
+                sql = self.SQL_IS_TROPICAL_RUN
 
-            # check the return
-            if 'result' in sql_ret:
-                # return whatever the result is
-                ret_val = sql_ret['result']
-            # this is an error
-            else:
-                ret_val = True
+                # execute the sql
+                sql_ret = self.exec_prepared('apsviz', sql, (f'{run_name}%',))
 
-        except Exception:
-            self.logger.exception("Error detected executing SQL: %s.", sql)
+                # check the return
+                if 'result' in sql_ret:
+                    # return whatever the result is
+                    ret_val = sql_ret['result']
 
-            # set the error code
-            ret_val = True
+                    # save the classification for the next run. errors are never cached
+                    self.tropical_cache.put(run_name, ret_val)
+                # this is an error
+                else:
+                    ret_val = True
+
+            except Exception:
+                self.logger.exception("Error detected executing SQL: %s.", sql)
+
+                # set the error code
+                ret_val = True
 
         # return the success flag
         return ret_val
@@ -131,10 +180,10 @@ class PGImplementation(PGUtilsMultiConnect):
 
         try:
             # build up the sql
-            sql = f"SELECT remove_image_run_props('{run_name}')"
+            sql = self.SQL_REMOVE_IMAGE_RUN_PROPS
 
             # execute the sql
-            sql_ret = self.exec_sql('apsviz', sql)
+            sql_ret = self.exec_prepared('apsviz', sql, (run_name,))
 
             # check the result
             if sql_ret < 0:
@@ -162,10 +211,10 @@ class PGImplementation(PGUtilsMultiConnect):
 
         try:
             # build up the sql
-            sql = f"SELECT * FROM remove_adcirc_obs_stations('{run_name}')"
+            sql = self.SQL_REMOVE_ADCIRC_OBS_STATIONS
 
             # execute the sql
-            sql_ret = self.exec_sql('adcirc_obs', sql)
+            sql_ret = self.exec_prepared('adcirc_obs', sql, (run_name,))
 
             # check the result
             if sql_ret < 0:
@@ -180,6 +229,75 @@ class PGImplementation(PGUtilsMultiConnect):
         # return the success flag
         return ret_val
 
+    def remove_catalog_db_records_bulk(self, run_names: list, batch_size: int = None) -> list:
+        """
+        Removes the catalog member records that are associated to a list of instance ids from the apsviz DB.
+
+        :param run_names:
+        :param batch_size:
+        :return: the list of instance ids that were not removed
+        """
+        # remove the records in batches
+        return self.remove_db_records_bulk('apsviz', self.SQL_REMOVE_CATALOG_MEMBERS_BULK, run_names, batch_size)
+
+    def remove_run_props_db_image_records_bulk(self, run_names: list, batch_size: int = None) -> list:
+        """
+        Removes the apsviz image run props that are associated to a list of instance ids from the apsviz DB.
+
+        :param run_names:
+        :param batch_size:
+        :return: the list of instance ids that were not removed
+        """
+        # remove the records in batches
+        return self.remove_db_records_bulk('apsviz', self.SQL_REMOVE_IMAGE_RUN_PROPS_BULK, run_names, batch_size)
+
+    def remove_obs_mod_db_records_bulk(self, run_names: list, batch_size: int = None) -> list:
+        """
+        Removes the adcirc_obs stations that are associated to a list of instance ids from the adcirc_obs DB.
+
+        :param run_names:
+        :param batch_size:
+        :return: the list of instance ids that were not removed
+        """
+        # remove the records in batches
+        return self.remove_db_records_bulk('adcirc_obs', self.SQL_REMOVE_ADCIRC_OBS_STATIONS_BULK, run_names, batch_size)
+
+    def remove_db_records_bulk(self, db_name: str, sql: str, run_names: list, batch_size: int = None) -> list:
+        """
+        Executes a bulk removal SP on batches of instance ids. Each batch is one round trip and one transaction,
+        so a failure leaves the batch untouched.
+
+        :param db_name:
+        :param sql:
+        :param run_names:
+        :param batch_size:
+        :return: the list of instance ids in batches that failed
+        """
+        # init the return value
+        ret_val: list = []
+
+        # default to the configured batch size
+        if batch_size is None or batch_size < 1:
+            batch_size = self.bulk_batch_size
+
+        # for each batch of instance ids
+        for index in range(0, len(run_names), batch_size):
+            # get the batch. psycopg2 binds a list as a SQL array
+            batch: list = list(run_names[index: index + batch_size])
+
+            # execute the sql in a transaction
+            sql_ret = self.exec_sql_transaction(db_name, sql, (batch,))
+
+            # check the result
+            if sql_ret is None or sql_ret == -1:
+                self.logger.error('Error: Bulk removal failed on %s for %s instance(s) starting with %s.', db_name, len(batch), batch[0])
+
+                # save the failed instance ids
+                ret_val.extend(batch)
+
+        # return the failures
+        return ret_val
+
     def get_run_props(self, instance_id: int, uid: str):
         """
         gets the run properties for a run
@@ -187,10 +305,10 @@ class PGImplementation(PGUtilsMultiConnect):
         :return:
         """
         # create the sql
-        sql: str = f"SELECT * FROM public.get_run_prop_items_json({instance_id}, '{uid}')"
+        sql: str = self.SQL_GET_RUN_PROPS
 
         # get the data
-        ret_val = self.exec_sql('apsviz', sql)
+        ret_val = self.exec_prepared('apsviz', sql, (int(instance_id), uid))
 
         # check the result
         if ret_val != 0:
@@ -201,3 +319,265 @@ class PGImplementation(PGUtilsMultiConnect):
 
         # return the data
         return ret_val
+
+    def get_run_download_urls(self, instance_names: list) -> dict:
+        """
+        Gets the download URL run property for a list of instance names (<instance id>-<uid>) in as few queries as possible.
+
+        Only the download URL properties are transferred, not all the run properties.
+
+        :param instance_names:
+        :return: a dict of instance name to download URL. instances without a URL are not included, the ones whose lookup failed are None
+        """
+        # init the return value
+        ret_val: dict = {}
+
+        # for each batch of instance names
+        for index in range(0, len(instance_names), self.bulk_batch_size):
+            # get the batch
+            batch: list = list(instance_names[index: index + self.bulk_batch_size])
+
+            # get the data. psycopg2 binds a list as a SQL array
+            sql_ret = self.exec_prepared('apsviz', self.SQL_GET_RUN_DOWNLOAD_URLS, (batch,))
+
+            # save the URLs if any were found
+            if isinstance(sql_ret, dict):
+                ret_val.update(sql_ret)
+            elif sql_ret == -1:
+                self.logger.error('Error: Failed to get the download URLs for %s instance(s) starting with %s.', len(batch), batch[0])
+
+                # flag the failed lookups so they are not mistaken for runs without a URL
+                ret_val.update(dict.fromkeys(batch))
+
+        # return the data
+        return ret_val
+
+    def get_run_instance_names(self):
+        """
+        Gets the names of all the runs in the apsviz DB with a single query.
+
+        :return: a dict of instance name to tropical run flag, or None on an error
+        """
+        # get the data
+        sql_ret = self.exec_prepared('apsviz', self.SQL_GET_RUN_INSTANCE_NAMES)
+
+        # check the result
+        if isinstance(sql_ret, dict):
+            ret_val = sql_ret
+        else:
+            self.logger.error('Error: Failed to get the run instance names from the apsviz DB.')
+            ret_val = None
+
+        # return the data
+        return ret_val
+
+    def get_obs_mod_instance_names(self):
+        """
+        Gets the names of all the runs in the adcirc_obs DB with a single query.
+
+        :return: a set of instance names, or None on an error
+        """
+        # get the data
+        sql_ret = self.exec_prepared('adcirc_obs', self.SQL_GET_OBS_MOD_INSTANCE_NAMES)
+
+        # check the result
+        if isinstance(sql_ret, list):
+            ret_val = set(sql_ret)
+        else:
+            self.logger.error('Error: Failed to get the run instance names from the adcirc_obs DB.')
+            ret_val = None
+
+        # return the data
+        return ret_val
+
+    def get_lock_conn(self):
+        """
+        Gets the dedicated apsviz DB connection the advisory locks are held on, making a new one if there isn't a usable one.
+
+        The connection is not shared with the other DB operations, so their reconnects can't drop the locks. If the connection
+        itself was lost, the DB released its locks, so they are taken again on the new connection.
+
+        :return: the connection, or None if one could not be made
+        """
+        # was the connection lost?
+        if self.lock_conn is not None and self.lock_conn.closed:
+            self.logger.warning('The apsviz DB lock connection was lost. Taking its %s advisory lock(s) again.', len(self.advisory_locks))
+
+            self.lock_conn = None
+
+        # make a new connection if needed
+        if self.lock_conn is None:
+            self.lock_conn = self.connect('apsviz', self.dbs['apsviz'].conn_str)
+
+            # if the connection was made
+            if self.lock_conn is not None:
+                # session level locks don't need a transaction
+                self.lock_conn.autocommit = True
+
+                # take the locks of the lost session again
+                for lock_id in list(self.advisory_locks):
+                    if self.exec_lock_sql(self.SQL_TRY_ADVISORY_LOCK, lock_id) is not True:
+                        self.logger.warning('Warning: Advisory lock %s could not be taken again, another runner may have its work.', lock_id)
+
+                        self.advisory_locks.discard(lock_id)
+
+        # return to the caller
+        return self.lock_conn
+
+    def exec_lock_sql(self, sql_stmt: str, lock_id: int):
+        """
+        Executes an advisory lock function on the lock connection.
+
+        :param sql_stmt:
+        :param lock_id:
+        :return: the result of the function, or None on an error
+        """
+        # init the return value
+        ret_val = None
+
+        try:
+            # execute the sql
+            ret_val = self.execute_stmt(self.lock_conn, sql_stmt, (lock_id,), prepared=True, transaction=False)
+        except Exception:
+            self.logger.exception("Error detected executing SQL: %s.", sql_stmt)
+
+        # return to the caller
+        return ret_val
+
+    def try_advisory_lock(self, lock_id: int):
+        """
+        Tries to get a session level advisory lock on the apsviz DB, without waiting.
+
+        The lock is held on a dedicated connection until it is released or the connection is closed, so a process that dies can't
+        leave it behind.
+
+        :param lock_id: a 64-bit lock id
+        :return: True if the lock was obtained, False if someone else holds it, None if the DB can't be used for locking
+        """
+        # init the return value
+        ret_val = None
+
+        # if there is an apsviz DB
+        if 'apsviz' in self.dbs:
+            with self.advisory_lock:
+                # the statement gets one retry if the connection was lost
+                for _ in range(2):
+                    # get the lock connection
+                    if self.get_lock_conn() is None:
+                        break
+
+                    # try to get the lock
+                    ret_val = self.exec_lock_sql(self.SQL_TRY_ADVISORY_LOCK, lock_id)
+
+                    # no need to retry unless the connection was lost
+                    if ret_val is not None or not self.lock_conn.closed:
+                        break
+
+                # an error is not a lock result
+                if not isinstance(ret_val, bool):
+                    ret_val = None
+                # save the lock so it can be taken again if the connection is lost
+                elif ret_val:
+                    self.advisory_locks.add(lock_id)
+
+        # return to the caller
+        return ret_val
+
+    def advisory_unlock(self, lock_id: int) -> bool:
+        """
+        Releases an advisory lock obtained with try_advisory_lock().
+
+        :param lock_id:
+        :return: True if the lock was released
+        """
+        # init the return value
+        ret_val: bool = False
+
+        with self.advisory_lock:
+            # only the locks held on the lock connection can be released
+            if lock_id in self.advisory_locks:
+                self.advisory_locks.discard(lock_id)
+
+                # a lost connection already released the lock
+                if self.lock_conn is None or self.lock_conn.closed:
+                    ret_val = True
+                else:
+                    # release the lock
+                    ret_val = self.exec_lock_sql(self.SQL_ADVISORY_UNLOCK, lock_id) is True
+            else:
+                self.logger.warning('Warning: Advisory lock %s is not held on the lock connection.', lock_id)
+
+        # return to the caller
+        return ret_val
+
+    def enqueue_work_tasks(self, rule: dict, entities: list) -> int:
+        """
+        Adds a work queue task for each entity of a rule. Entities that already have an unfinished task of the rule are skipped.
+
+        :param rule: the rule definition, with the enum values as names
+        :param entities:
+        :return: the number of tasks added, or -1 on an error
+        """
+        # init the return value
+        ret_val: int = 0
+
+        # for each batch of entities
+        for index in range(0, len(entities), self.bulk_batch_size):
+            # get the batch
+            batch: list = list(entities[index: index + self.bulk_batch_size])
+
+            # add the tasks. psycopg2 binds a list as a SQL array
+            sql_ret = self.exec_prepared('apsviz', self.SQL_ENQUEUE_WORK_TASKS, (json.dumps(rule), batch))
+
+            # check the result
+            if sql_ret == -1:
+                self.logger.error('Error: Failed to queue the tasks of rule %s.', rule['name'])
+
+                # no need to continue
+                ret_val = -1
+                break
+
+            # count the tasks added
+            ret_val += sql_ret
+
+        # return to the caller
+        return ret_val
+
+    def claim_work_task(self, worker: str, lease: int, max_attempts: int):
+        """
+        Claims the next work queue task for a worker.
+
+        :param worker: the name of the worker
+        :param lease: the number of seconds the worker has to complete the task before it can be claimed again
+        :param max_attempts: the number of times a task is tried
+        :return: the task (id, rule, entity, attempts), or None if there is nothing to do or on an error
+        """
+        # claim the task
+        sql_ret = self.exec_prepared('apsviz', self.SQL_CLAIM_WORK_TASK, (worker, lease, max_attempts))
+
+        # check the result
+        if isinstance(sql_ret, dict):
+            ret_val = sql_ret
+        else:
+            # an empty queue returns 0, an error -1
+            if sql_ret == -1:
+                self.logger.error('Error: Failed to claim a work queue task.')
+
+            ret_val = None
+
+        # return to the caller
+        return ret_val
+
+    def complete_work_task(self, task_id: int, worker: str, success: bool, result: dict, *, max_attempts: int) -> bool:
+        """
+        Records the result of a work queue task. A failed task is retried until it used up its attempts.
+
+        :param task_id:
+        :param worker: the name of the worker that claimed the task
+        :param success:
+        :param result: the stats of the task
+        :param max_attempts: the number of times a task is tried
+        :return: True if the result was recorded, False if the worker no longer holds the claim or on an error
+        """
+        # record the result
+        return self.exec_prepared('apsviz', self.SQL_COMPLETE_WORK_TASK, (task_id, worker, success, json.dumps(result), max_attempts)) == 1
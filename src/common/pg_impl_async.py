@@ -0,0 +1,271 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Class for asyncio database functionalities
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import json
+import asyncio
+
+import asyncpg
+
+from src.common.logger import LoggingUtil
+from src.common.pg_impl import PGImplementation
+from src.common.pg_utils_multi import PGUtilsMultiConnect
+from src.common.tropical_cache import TropicalRunCache
+
+
+class PGImplementationAsync:
+    """
+        Class that contains the asyncio (asyncpg) versions of the DB calls for the Archiver.
+
+        The coroutines return the same values as their PGImplementation counterparts, so many instance cleanups against both
+        DBs can be in flight at once from a single thread. asyncpg prepares and caches the statements on each connection.
+        It is used to remove the DB records when a GEOSERVER_REMOVE plan is executed with DB_BACKEND=async (see GeoServerPlanner).
+
+        The DB connection details use the same environment parameters as PGUtilsMultiConnect. A dict of already created pools
+        (or stand-ins that implement fetchval() and close()) can be passed in, which is used for testing.
+    """
+
+    def __init__(self, db_names: tuple, _logger=None, _pools: dict = None):
+        """
+        Initializes this class
+
+        :param db_names:
+        :param _logger:
+        :param _pools:
+        """
+        # if a reference to a logger is passed in, use it
+        if _logger is not None:
+            # get a handle to a logger
+            self.logger = _logger
+        else:
+            # get the log level and directory from the environment.
+            log_level, log_path = LoggingUtil.prep_for_logging()
+
+            # create a logger
+            self.logger = LoggingUtil.init_logging("Archiver.PGImplementationAsync", level=log_level, line_format='medium',
+                                                   log_file_path=log_path)
+
+        # save the DB names
+        self.db_names: tuple = db_names
+
+        # init the connection pools
+        self.pools: dict = _pools if _pools is not None else {}
+
+        # get the number of operations that can be in flight at once
+        self.concurrency: int = int(os.getenv('ASYNC_DB_CONCURRENCY', '20'))
+
+        # create the persistent cache of tropical run checks
+        self.tropical_cache = TropicalRunCache(self.logger)
+
+    async def connect(self):
+        """
+        Creates the connection pools for the DBs that don't have one yet.
+
+        :return:
+        """
+        # for each db name specified
+        for db_name in self.db_names:
+            # get the connection parameters
+            params: dict = PGUtilsMultiConnect.get_conn_params(db_name)
+
+            # if there is a legit configuration and no pool yet
+            if db_name not in self.pools and params['port'] > 0:
+                # get the pool sizes, make sure there are enough connections to use the concurrency
+                min_size, max_size = PGUtilsMultiConnect.get_pool_config(db_name)
+
+                # create the pool
+                self.pools[db_name] = await asyncpg.create_pool(host=params['host'], port=params['port'], user=params['user'],
+                                                                password=params['password'], database=params['dbname'],
+                                                                min_size=max(1, min_size), max_size=max(self.concurrency, max_size),
+                                                                timeout=float(os.getenv('DB_CONNECT_DEADLINE', '60')), init=self.init_connection)
+
+                self.logger.debug('DB Connection pool established to %s.', db_name)
+
+    @staticmethod
+    async def init_connection(conn):
+        """
+        Sets up a new connection so json results are returned as python objects, the same as psycopg2.
+
+        :param conn:
+        :return:
+        """
+        # decode the json types
+        for type_name in ('json', 'jsonb'):
+            await conn.set_type_codec(type_name, encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+    async def close(self):
+        """
+        Closes the connection pools.
+
+        :return:
+        """
+        # for each pool
+        for db_name, pool in self.pools.items():
+            try:
+                # close it
+                await pool.close()
+            except Exception:
+                self.logger.warning('Error detected closing the %s DB connection pool.', db_name)
+
+        # clear the pools
+        self.pools = {}
+
+    async def exec_sql(self, db_name: str, sql_stmt: str, *params):
+        """
+        Executes a parameterized sql statement and returns the first column of the first record.
+
+        Mirrors PGUtilsMultiConnect.exec_prepared(): 0 is returned on an empty result and -1 on an error.
+
+        :param db_name:
+        :param sql_stmt:
+        :param params:
+        :return:
+        """
+        # init the return
+        ret_val = -1
+
+        try:
+            # execute the sql
+            ret_data = await self.pools[db_name].fetchval(sql_stmt, *params)
+
+            # trap the return
+            ret_val = 0 if ret_data is None else ret_data
+
+        except Exception:
+            self.logger.exception("Error detected executing SQL: %s.", sql_stmt)
+
+        # return to the caller
+        return ret_val
+
+    async def remove_catalog_db_records(self, run_name: str) -> bool:
+        """
+        Removes the catalog member records that are associated to the instance id from the apsviz DB.
+
+        :param run_name:
+        :return:
+        """
+        # execute the sql
+        sql_ret = await self.exec_sql('apsviz', PGImplementation.SQL_REMOVE_CATALOG_MEMBER, f'{run_name}%')
+
+        # return the success flag
+        return sql_ret != -1
+
+    async def is_tropical_run(self, run_name: str) -> bool:
+        """
+        Checks to see if this is a tropical (hurricane) run.
+
+        Note that hurricanes aren't worked on. So a True return
+        will force no activity on the run
+
+        :param run_name:
+        :return:
+        """
+        # has this run already been classified?
+        ret_val = self.tropical_cache.get(run_name)
+
+        # if not, ask the DB
+        if ret_val is None:
+            # execute the sql
+            sql_ret = await self.exec_sql('apsviz', PGImplementation.SQL_IS_TROPICAL_RUN, f'{run_name}%')
+
+            # check the return
+            if isinstance(sql_ret, dict) and 'result' in sql_ret:
+                # return whatever the result is
+                ret_val = sql_ret['result']
+
+                # save the classification for the next run. errors are never cached
+                self.tropical_cache.put(run_name, ret_val)
+            # this is an error
+            else:
+                ret_val = True
+
+        # return the result
+        return ret_val
+
+    async def remove_run_props_db_image_records(self, run_name: str) -> bool:
+        """
+        Removes the apsviz image run props that are associated to the instance id from the DB.
+
+        :param run_name:
+        :return:
+        """
+        # execute the sql
+        sql_ret = await self.exec_sql('apsviz', PGImplementation.SQL_REMOVE_IMAGE_RUN_PROPS, run_name)
+
+        # return the success flag
+        return sql_ret != -1
+
+    async def remove_obs_mod_db_records(self, run_name: str) -> bool:
+        """
+        Removes the adcirc_obs stations that are associated to the instance id from the DB.
+
+        :param run_name:
+        :return:
+        """
+        # execute the sql
+        sql_ret = await self.exec_sql('adcirc_obs', PGImplementation.SQL_REMOVE_ADCIRC_OBS_STATIONS, run_name)
+
+        # return the success flag
+        return sql_ret != -1
+
+    async def get_run_props(self, instance_id: int, uid: str):
+        """
+        gets the run properties for a run
+
+        :param instance_id:
+        :param uid:
+        :return:
+        """
+        # get the data
+        ret_val = await self.exec_sql('apsviz', PGImplementation.SQL_GET_RUN_PROPS, int(instance_id), uid)
+
+        # check the result
+        if ret_val not in (0, -1):
+            # replace with the data sorted by keys
+            ret_val = {x: ret_val[0]['run_data'][x] for x in sorted(ret_val[0]['run_data'])}
+        else:
+            ret_val = -1
+
+        # return the data
+        return ret_val
+
+    async def remove_instances(self, run_names: list) -> dict:
+        """
+        Removes the obs/mod, image run prop and catalog member records for many instances, with up to ASYNC_DB_CONCURRENCY
+        operations in flight at once across both DBs.
+
+        :param run_names:
+        :return: a dict of instance id to success flag
+        """
+        # limit the number of operations in flight
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def limited(operation, run_name: str) -> bool:
+            # wait for a slot, then run the operation
+            async with semaphore:
+                return await operation(run_name)
+
+        async def remove_instance(run_name: str) -> bool:
+            # run the removals for the instance concurrently
+            results: list = await asyncio.gather(limited(self.remove_obs_mod_db_records, run_name),
+                                                 limited(self.remove_run_props_db_image_records, run_name),
+                                                 limited(self.remove_catalog_db_records, run_name))
+
+            # the instance succeeded if all the removals did
+            return all(results)
+
+        # remove all the instances
+        results: list = await asyncio.gather(*[remove_instance(run_name) for run_name in run_names])
+
+        # return the results by instance id
+        return dict(zip(run_names, results))
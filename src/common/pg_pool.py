@@ -0,0 +1,194 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Thread-safe DB connection pool
+
+    Author: Phil Owen, RENCI.org
+"""
+
+import time
+import threading
+
+
+class PGConnectionPool:
+    """
+        Thread-safe pool of connections to a single DB.
+
+        Connections are created on demand by the connect function passed in, up to the maximum pool size.
+        A caller that checks out a connection when all of them are in use waits until one is returned.
+        Wait times and utilization are tracked so the pool can be sized properly. The time spent making new connections is
+        tracked separately, so a slow DB is not mistaken for a pool that is too small.
+    """
+
+    def __init__(self, name: str, connect_fn, min_size: int, max_size: int):
+        """
+        Initializes this class
+
+        :param name: the name of the DB
+        :param connect_fn: function that returns a new connection or None on failure
+        :param min_size:
+        :param max_size:
+        """
+        # save the pool configuration
+        self.name: str = name
+        self.connect_fn = connect_fn
+        self.max_size: int = max(1, max_size)
+        self.min_size: int = min(max(0, min_size), self.max_size)
+
+        # the condition protects everything below and signals returned connections
+        self.condition = threading.Condition()
+
+        # init the idle connections and the count of all the connections (idle + checked out)
+        self.idle: list = []
+        self.size: int = 0
+
+        # init the metrics
+        self.in_use: int = 0
+        self.peak_in_use: int = 0
+        self.checkouts: int = 0
+        self.total_wait: float = 0.0
+        self.max_wait: float = 0.0
+        self.timeouts: int = 0
+        self.connects: int = 0
+        self.total_connect: float = 0.0
+
+        # create the minimum number of connections
+        for _ in range(self.min_size):
+            # get a connection
+            conn = self.connect_fn()
+
+            # save it if it was created
+            if conn is not None:
+                self.idle.append(conn)
+                self.size += 1
+
+    def getconn(self, timeout: float):
+        """
+        Checks out a connection from the pool.
+
+        :param timeout: the number of seconds to wait for a connection
+        :return: a connection, or None if one could not be obtained in time
+        """
+        # init the return value
+        conn = None
+
+        # init the flag that indicates a new connection must be made
+        create: bool = False
+
+        # get the start time for the wait metrics
+        start: float = time.monotonic()
+
+        with self.condition:
+            # wait until there is an idle connection or room to make one
+            ready: bool = self.condition.wait_for(lambda: self.idle or self.size < self.max_size, timeout)
+
+            # get the time spent waiting for the pool
+            wait: float = time.monotonic() - start
+
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+            if ready:
+                # prefer an idle connection
+                if self.idle:
+                    conn = self.idle.pop()
+                else:
+                    # reserve the slot for the new connection
+                    self.size += 1
+                    create = True
+            else:
+                self.timeouts += 1
+
+        # make the new connection outside the lock, it may take a while
+        if create:
+            # get the start time for the connect metrics
+            start = time.monotonic()
+
+            conn = self.connect_fn()
+
+            with self.condition:
+                # count the time spent connecting
+                self.connects += 1
+                self.total_connect += time.monotonic() - start
+
+                # release the slot if the connection failed
+                if conn is None:
+                    self.size -= 1
+                    self.condition.notify()
+
+        # update the metrics
+        with self.condition:
+            # count the successful checkouts
+            if conn is not None:
+                self.checkouts += 1
+                self.in_use += 1
+                self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+        # return to the caller
+        return conn
+
+    def putconn(self, conn, discard: bool = False):
+        """
+        Returns a connection to the pool.
+
+        :param conn:
+        :param discard: close the connection rather than reuse it (e.g. it was lost)
+        :return:
+        """
+        with self.condition:
+            self.in_use -= 1
+
+            # closed or unwanted connections are dropped from the pool
+            if discard or conn.closed:
+                self.size -= 1
+            else:
+                self.idle.append(conn)
+
+            # let a waiting thread know
+            self.condition.notify()
+
+        # close a discarded connection
+        if discard and not conn.closed:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def close_all(self):
+        """
+        Closes all the idle connections in the pool.
+
+        :return:
+        """
+        with self.condition:
+            # for each idle connection
+            for conn in self.idle:
+                try:
+                    # close it
+                    conn.close()
+                except Exception:
+                    pass
+
+            # remove them from the pool
+            self.size -= len(self.idle)
+            self.idle = []
+
+    def get_metrics(self) -> dict:
+        """
+        Gets the pool wait time and utilization metrics.
+
+        :return:
+        """
+        with self.condition:
+            # return the metrics
+            return {'size': self.size, 'max_size': self.max_size, 'in_use': self.in_use, 'peak_in_use': self.peak_in_use,
+                    'utilization': self.in_use / self.max_size, 'peak_utilization': self.peak_in_use / self.max_size,
+                    'checkouts': self.checkouts, 'timeouts': self.timeouts, 'max_wait': self.max_wait,
+                    'avg_wait': self.total_wait / self.checkouts if self.checkouts else 0.0, 'connects': self.connects,
+                    'avg_connect': self.total_connect / self.connects if self.connects else 0.0}
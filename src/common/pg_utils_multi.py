@@ -14,11 +14,46 @@
 
 import os
 import time
+import threading
+from contextlib import contextmanager
 from collections import namedtuple
 
 import psycopg2
+import psycopg2.extensions
+from psycopg2 import sql
 
 from src.common.logger import LoggingUtil
+from src.common.pg_pool import PGConnectionPool
+from src.common.circuit_breaker import CircuitBreaker
+
+
+class PreparedStmtConnection(psycopg2.extensions.connection):
+    """
+        psycopg2 connection that keeps a cache of the server-side prepared statements created on it.
+
+        Prepared statements only live as long as the DB session, so the cache lives with the connection.
+    """
+    def __init__(self, *args, **kwargs):
+        # init the base class
+        super().__init__(*args, **kwargs)
+
+        # init the map of sql statement to prepared statement name
+        self.prepared_stmts: dict = {}
+
+        # init the counter used to name prepared statements
+        self.stmt_count: int = 0
+
+    def next_stmt_name(self) -> str:
+        """
+        Gets a prepared statement name that is unique for this connection.
+
+        :return:
+        """
+        # bump the counter
+        self.stmt_count += 1
+
+        # return the new name
+        return f'archiver_stmt_{self.stmt_count}'
 
 
 class PGUtilsMultiConnect:
@@ -31,6 +66,10 @@ class PGUtilsMultiConnect:
         final environment parameter should be all uppercase.
 
         Please see the get_conn_config() method below for more details.
+
+        By default, a single connection is kept for each DB and access to it is serialized so that it is safe to use from
+        worker threads. A DB can be put into pooled mode by specifying <DB name>_DB_POOL_MAX_SIZE (and optionally
+        <DB name>_DB_POOL_MIN_SIZE). In that mode, a connection is checked out of the pool for each operation.
     """
 
     def __init__(self, app_name, db_names: tuple, _logger=None, _auto_commit=True):
@@ -62,6 +101,17 @@ class PGUtilsMultiConnect:
         # save the DB names for connection/cursor closing on class tear-down
         self.db_names: tuple = db_names
 
+        # get the number of seconds to keep trying to connect and the cap on the delay between attempts
+        self.connect_deadline: float = float(os.getenv('DB_CONNECT_DEADLINE', '60'))
+        self.connect_backoff_max: float = float(os.getenv('DB_CONNECT_BACKOFF_MAX', '10'))
+
+        # get the number of seconds to wait for a pooled connection
+        self.pool_timeout: float = float(os.getenv('DB_POOL_TIMEOUT', str(self.connect_deadline)))
+
+        # init the connection pools and the locks that serialize the use of non-pooled connections
+        self.pools: dict = {}
+        self.locks: dict = {}
+
         # get the details loaded into a tuple for all the DBs
         for db_name in self.db_names:
             # get the connection string
@@ -69,11 +119,25 @@ class PGUtilsMultiConnect:
 
             # if a connection configuration was returned
             if conn_config != '':
-                # create a temporary tuple to get the discovery process started
+                # create a tuple without a connection to get the discovery process started
                 temp_tuple: namedtuple = self.db_info_tpl(db_name, conn_config, None)
 
-                # get the connection
-                self.get_db_connection(temp_tuple)
+                # save it so a connection can be made later if this one fails
+                self.dbs.update({db_name: temp_tuple})
+
+                # get the pool sizes for this DB
+                pool_min_size, pool_max_size = self.get_pool_config(db_name)
+
+                # create a pool or a single connection
+                if pool_max_size > 0:
+                    self.pools[db_name] = PGConnectionPool(db_name, lambda name=db_name, conn_str=conn_config: self.connect(name, conn_str),
+                                                           pool_min_size, pool_max_size)
+                else:
+                    # create the lock for the connection
+                    self.locks[db_name] = threading.Lock()
+
+                    # get the connection
+                    self.get_db_connection(temp_tuple)
 
     def __del__(self):
         """
@@ -94,8 +158,11 @@ class PGUtilsMultiConnect:
         :return:
         """
         try:
+            # if this is a pooled DB close all the pooled connections
+            if db_name in self.pools:
+                self.pools[db_name].close_all()
             # if there is a connection, close it
-            if self.dbs[db_name].conn is not None:
+            elif self.dbs[db_name].conn is not None:
                 # get the item out of the tuple
                 conn = self.dbs[db_name].conn
 
@@ -105,9 +172,9 @@ class PGUtilsMultiConnect:
             self.logger.warning('Error detected closing the %s DB connection.', db_name)
 
     @staticmethod
-    def get_conn_config(db_name: str) -> str:
+    def get_conn_params(db_name: str) -> dict:
         """
-        Creates a dict of the DB connection configuration.
+        Gets the DB connection parameters from the environment.
 
         :param db_name:
         :return:
@@ -116,199 +183,481 @@ class PGUtilsMultiConnect:
         db_name: str = db_name.upper().replace('-', '_')
 
         # get configuration params from the env params
-        user: str = os.environ.get(f'{db_name}_DB_USERNAME')
-        password: str = os.environ.get(f'{db_name}_DB_PASSWORD')
-        dbname: str = os.environ.get(f'{db_name}_DB_DATABASE')
-        host: str = os.environ.get(f'{db_name}_DB_HOST')
-        port: int = int(os.environ.get(f'{db_name}_DB_PORT', 0))
+        return {'user': os.environ.get(f'{db_name}_DB_USERNAME'), 'password': os.environ.get(f'{db_name}_DB_PASSWORD'),
+                'dbname': os.environ.get(f'{db_name}_DB_DATABASE'), 'host': os.environ.get(f'{db_name}_DB_HOST'),
+                'port': int(os.environ.get(f'{db_name}_DB_PORT', 0))}
+
+    @staticmethod
+    def get_conn_config(db_name: str) -> str:
+        """
+        Creates a dict of the DB connection configuration.
+
+        :param db_name:
+        :return:
+        """
+        # get configuration params from the env params
+        params: dict = PGUtilsMultiConnect.get_conn_params(db_name)
 
         # if a legit port was obtained
-        if port > 0:
+        if params['port'] > 0:
             # create a connection string
-            connection_str: str = f"host={host} port={port} dbname={dbname} user={user} password={password}"
+            connection_str: str = f"host={params['host']} port={params['port']} dbname={params['dbname']} user={params['user']} " \
+                                  f"password={params['password']}"
         else:
             connection_str = ''
 
         # return to the caller
         return connection_str
 
-    def get_db_connection(self, db_info: namedtuple) -> bool:
+    @staticmethod
+    def get_pool_config(db_name: str) -> (int, int):
+        """
+        Gets the connection pool sizes for a DB. A max size of 0 means the DB is not pooled.
+
+        :param db_name:
+        :return:
+        """
+        # insure the env parameter prefix is uppercase
+        db_name: str = db_name.upper().replace('-', '_')
+
+        # get the pool sizes from the env params
+        min_size: int = int(os.environ.get(f'{db_name}_DB_POOL_MIN_SIZE', 0))
+        max_size: int = int(os.environ.get(f'{db_name}_DB_POOL_MAX_SIZE', 0))
+
+        # return to the caller
+        return min_size, max_size
+
+    def get_pool_metrics(self) -> dict:
         """
-        Gets a connection to the DB. performs a check to continue trying until
-        a connection is made.
+        Gets the wait time and utilization metrics of all the connection pools.
 
         :return:
         """
-        # init the connection status indicator
-        good_conn: bool = False
+        # return the metrics by DB name
+        return {db_name: pool.get_metrics() for db_name, pool in self.pools.items()}
+
+    @contextmanager
+    def checkout(self, db_name: str):
+        """
+        Checks out a connection for an operation. The connection is returned when the operation completes.
+
+        Pooled DBs get a connection from the pool. Otherwise, the single DB connection is locked for the duration of the operation
+        and a new connection is made if there isn't a usable one.
+
+        :param db_name:
+        :return: a connection, or None if one could not be obtained
+        """
+        # is this a pooled DB?
+        if db_name in self.pools:
+            # get a connection from the pool
+            conn = self.pools[db_name].getconn(self.pool_timeout)
+
+            # was a connection not obtained in time?
+            if conn is None:
+                self.logger.error('Error: A pooled connection to %s could not be obtained.', db_name)
 
-        # until forever
-        while not good_conn:
             try:
-                # check the DB connection
-                good_conn = self.check_db_connection(db_info)
+                yield conn
+            finally:
+                # return the connection to the pool
+                if conn is not None:
+                    self.pools[db_name].putconn(conn)
+        else:
+            # serialize the use of the connection
+            with self.locks[db_name]:
+                # get the appropriate db info object
+                db_info = self.dbs[db_name]
+
+                # get a connection if there isn't a usable one
+                if db_info.conn is None or db_info.conn.closed:
+                    self.get_db_connection(db_info)
+
+                # return the latest connection
+                yield self.dbs[db_name].conn
 
-                # try to get a connection if the check failed
-                if not good_conn:
-                    # try to connect to the DB
-                    conn = psycopg2.connect(db_info.conn_str)
+    def connect(self, db_name: str, conn_str: str):
+        """
+        Makes a new connection to the DB. Failed attempts are retried using a capped exponential backoff
+        until the connection deadline (DB_CONNECT_DEADLINE seconds) has passed.
 
-                    # set the autocommit on the connection
-                    conn.autocommit = self.auto_commit
+        :param db_name:
+        :param conn_str:
+        :return: the connection, or None if it failed
+        """
+        # init the return value
+        conn = None
 
-                    # create a new db info tuple
-                    verified_tuple: namedtuple = self.db_info_tpl(db_info.name, db_info.conn_str, conn)
+        # get the time when we give up
+        deadline: float = time.monotonic() + self.connect_deadline
 
-                    # check the new DB connection
-                    good_conn = self.check_db_connection(verified_tuple)
+        # init the first retry delay
+        delay: float = 0.5
 
-                    # is the connection ok now?
-                    if not good_conn:
-                        self.logger.warning('DB Connection not established (auto commit %s) to %s.', self.auto_commit, db_info.name)
-                    else:
-                        self.logger.debug('DB Connection established (auto commit %s) to %s.', self.auto_commit, db_info.name)
+        # until a connection is made or the deadline has passed
+        while conn is None:
+            try:
+                # try to connect to the DB. a single attempt can't take longer than the time left
+                conn = psycopg2.connect(conn_str, connection_factory=PreparedStmtConnection,
+                                        connect_timeout=max(1, int(min(deadline - time.monotonic(), 10))))
 
-                        # add the verified connection to the dict
-                        self.dbs.update({db_info.name: verified_tuple})
+                # set the autocommit on the connection
+                conn.autocommit = self.auto_commit
 
-                        # no need to continue
-                        break
+                self.logger.debug('DB Connection established (auto commit %s) to %s.', self.auto_commit, db_name)
 
-            except Exception:
-                self.logger.exception('Error getting connection %s.', db_info.name)
-                good_conn = False
+            except Exception as e:
+                # get the time left before we give up
+                remaining: float = deadline - time.monotonic()
+
+                # have we run out of time?
+                if remaining <= 0:
+                    self.logger.error('DB Connection failed to %s. Giving up after %s seconds: %s', db_name, self.connect_deadline, e)
+
+                    # no need to continue
+                    break
+
+                self.logger.warning('DB Connection failed to %s. Retrying in %.1f seconds: %s', db_name, min(delay, remaining), e)
 
-            # are we still looking for a connection
-            if good_conn is False:
-                self.logger.error('DB Connection failed to %s. Retrying...', db_info.name)
-                time.sleep(5)
+                # wait for the next attempt
+                time.sleep(min(delay, remaining))
+
+                # back off for the next attempt
+                delay = min(delay * 2, self.connect_backoff_max)
+
+        # return the connection
+        return conn
+
+    def get_db_connection(self, db_info: namedtuple) -> bool:
+        """
+        Gets a new connection to the DB and saves it as the DB's connection (non-pooled mode).
+
+        :return:
+        """
+        # init the connection status indicator
+        good_conn: bool = False
+
+        # close the old connection if there was one
+        if db_info.conn is not None:
+            self.close_db_conn(db_info)
+
+        # get a new connection
+        conn = self.connect(db_info.name, db_info.conn_str)
+
+        # save the new connection. a failed one is saved as None so the closed connection is never handed out again
+        self.dbs.update({db_info.name: self.db_info_tpl(db_info.name, db_info.conn_str, conn)})
+
+        # set the success flag
+        good_conn = conn is not None
 
         # return pass/fail flag
         return good_conn
 
-    def check_db_connection(self, db_info: namedtuple) -> bool:
+    def close_db_conn(self, db_info: namedtuple):
         """
-        Checks to see if there is a good connection to the DB.
+        Closes a connection that is being replaced.
 
         :param db_info:
-        :return: boolean
+        :return:
         """
-        # init the return value
-        ret_val = None
+        try:
+            # close the connection
+            db_info.conn.close()
+        except Exception:
+            self.logger.debug('Error detected closing the stale %s DB connection.', db_info.name)
 
-        # init the cursor storage
-        cursor = None
+    def exec_sql(self, db_name: str, sql_stmt: str):
+        """
+        Executes a sql statement.
 
-        try:
-            # is there an existing connection?
-            if not db_info.conn:
-                self.logger.debug('Existing DB connection not found for %s', db_info.name)
+        :param db_name:
+        :param sql_stmt:
+        :return:
+        """
+        # execute the statement as is
+        return self.run_sql(db_name, sql_stmt)
 
-                # force getting a new connection
-                ret_val = False
-            else:
-                # get the cursor
-                cursor = db_info.conn.cursor()
+    def exec_prepared(self, db_name: str, sql_stmt: str, params: tuple = ()):
+        """
+        Executes a parameterized sql statement using a server-side prepared statement.
 
-                # get the DB version
-                cursor.execute("SELECT version()")
+        The statement uses positional placeholders ($1, $2, ...) and is prepared once per connection.
+        Subsequent calls with the same statement skip the parse/plan steps.
 
-                # get the value
-                db_version = cursor.fetchone()
+        :param db_name:
+        :param sql_stmt:
+        :param params:
+        :return:
+        """
+        # execute the statement using the prepared statement cache
+        return self.run_sql(db_name, sql_stmt, params, prepared=True)
 
-                # set the success (or not) flag
-                ret_val = bool(db_version)
+    def exec_sql_transaction(self, db_name: str, sql_stmt: str, params: tuple = ()):
+        """
+        Executes a parameterized sql statement (see exec_prepared()) inside a transaction. The statement is committed on success
+        and rolled back on failure, regardless of the auto commit setting of the connection.
 
-        except psycopg2.DatabaseError:
-            self.logger.debug('Error database error checking DB connection.')
+        :param db_name:
+        :param sql_stmt:
+        :param params:
+        :return:
+        """
+        # execute the prepared statement in a transaction
+        return self.run_sql(db_name, sql_stmt, params, prepared=True, transaction=True)
 
-            # connection failed
-            ret_val = False
+    def run_sql(self, db_name: str, sql_stmt: str, params: tuple = None, *, prepared: bool = False, transaction: bool = False):
+        """
+        Executes a sql statement and returns the first column of the first record.
 
-        except psycopg2.InterfaceError:
-            self.logger.debug('Error database interface error checking DB connection.')
+        The statement is executed on the existing connection. A new connection is only made when there isn't one or the
+        statement failed because the connection was lost, in which case the statement is retried once.
 
-            # connection failed
-            ret_val = False
+        :param db_name:
+        :param sql_stmt:
+        :param params:
+        :param prepared:
+        :param transaction:
+        :return:
+        """
+        # init the return
+        ret_val = -1
 
-        except Exception:
-            self.logger.debug('General DB connection issue. Probably connection time out.')
+        # get the circuit breaker for this DB
+        breaker: CircuitBreaker = CircuitBreaker.get(db_name)
 
-            # connection failed
-            ret_val = False
+        # fail fast if the DB is down
+        if not breaker.allow():
+            self.logger.debug('The %s DB circuit is open, the SQL was not executed: %s.', db_name, sql_stmt)
+
+            # return to the caller
+            return ret_val
+
+        # init the flag that indicates the DB could not be reached
+        db_down: bool = False
+
+        # the statement gets one retry if the connection was lost
+        for attempt in range(2):
+            # get a connection for the operation
+            with self.checkout(db_name) as conn:
+                # no connection, no need to continue
+                if conn is None:
+                    db_down = True
+                    break
+
+                try:
+                    # execute the sql
+                    ret_val = self.execute_stmt(conn, sql_stmt, params, prepared=prepared, transaction=transaction)
+
+                    # no need to continue
+                    break
+
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    # if the connection was lost, a new one will be used on the retry
+                    if conn.closed and attempt == 0:
+                        self.logger.warning('DB connection to %s was lost. Reconnecting.', db_name)
+                    else:
+                        self.logger.exception("Error detected executing SQL: %s.", sql_stmt)
+
+                        # the connection can't be used
+                        db_down = bool(conn.closed)
+
+                        # no need to continue
+                        break
+
+                except Exception:
+                    self.logger.exception("Error detected executing SQL: %s.", sql_stmt)
+
+                    # no need to continue
+                    break
+
+        # update the circuit. a SQL error still means the DB is up
+        if not db_down:
+            breaker.record_success()
+        elif breaker.record_failure():
+            self.logger.error('Error: The %s DB is down. Its circuit is open, DB calls will fail fast for the next %s seconds.', db_name,
+                              breaker.cool_down)
 
         # return to the caller
         return ret_val
 
-    def exec_sql(self, db_name: str, sql_stmt: str):
+    def execute_stmt(self, conn, sql_stmt: str, params: tuple, *, prepared: bool, transaction: bool):
         """
-        Executes a sql statement.
+        Executes a sql statement on a connection. Exceptions are raised to the caller.
 
-        :param db_name:
+        :param conn:
         :param sql_stmt:
+        :param params:
+        :param prepared:
+        :param transaction:
         :return:
         """
         # init the return
         ret_val = None
 
-        # get the appropriate db info object
-        db_info = self.dbs[db_name]
-
-        # insure we have a valid DB connection
-        success = self.get_db_connection(db_info)
+        # save the current commit mode
+        auto_commit = conn.autocommit
 
-        # did we get a connection?
-        if success:
-            # init the cursor
-            cursor = None
+        # init the cursor
+        cursor = None
 
-            try:
-                # make sure the latest db_info is used
-                db_info = self.dbs[db_name]
+        try:
+            # turn off the auto commit if the statement must run in a transaction
+            if transaction:
+                conn.autocommit = False
 
-                # get a cursor
-                cursor = db_info.conn.cursor()
+            # get a cursor
+            cursor = conn.cursor()
 
-                # execute the sql
-                cursor.execute(sql_stmt)
+            # execute the sql
+            if prepared:
+                self.execute_prepared(conn, cursor, sql_stmt, params)
+            else:
+                cursor.execute(sql_stmt, params)
 
-                # get the returned value
-                ret_data = cursor.fetchone()
+            # get the returned value
+            ret_data = cursor.fetchone()
 
-                # trap the return
-                if ret_data is None or ret_data[0] is None:
-                    # specify a return code on an empty result
-                    ret_val = 0
-                else:
-                    # get the one and only record of json
-                    ret_val = ret_data[0]
+            # save the transaction
+            if transaction:
+                conn.commit()
 
-            except Exception:
-                self.logger.exception("Error detected executing SQL: %s.", sql_stmt)
+            # trap the return
+            if ret_data is None or ret_data[0] is None:
+                # specify a return code on an empty result
+                ret_val = 0
+            else:
+                # get the one and only record of json
+                ret_val = ret_data[0]
 
-                # set the error code
-                ret_val = -1
-            finally:
-                # in there is a cursor, close it
-                if cursor is not None:
-                    # close it
-                    cursor.close()
+        except Exception:
+            # undo anything done in the transaction
+            if transaction and not conn.closed:
+                self.rollback(conn)
+
+            # a statement prepared in a failed transaction may not survive it, prepare it again next time
+            if transaction and prepared:
+                conn.prepared_stmts.pop(sql_stmt, None)
+
+            # let the caller handle it
+            raise
+        finally:
+            # in there is a cursor, close it
+            if cursor is not None and not cursor.closed:
+                # close it
+                cursor.close()
 
-        else:
-            # set the error code
-            ret_val = -1
+            # restore the commit mode
+            if transaction and not conn.closed:
+                self.restore_auto_commit(conn, auto_commit)
 
         # return to the caller
         return ret_val
 
+    @staticmethod
+    def execute_prepared(conn, cursor, sql_stmt: str, params: tuple):
+        """
+        Executes a statement using the connection's cache of server-side prepared statements.
+
+        :param conn:
+        :param cursor:
+        :param sql_stmt:
+        :param params:
+        :return:
+        """
+        # get the cached prepared statement name
+        stmt_name: str = conn.prepared_stmts.get(sql_stmt)
+
+        # if this statement has not been prepared on this connection
+        if stmt_name is None:
+            # get a name that is unique for this connection
+            stmt_name = conn.next_stmt_name()
+
+            # prepare the statement on the server
+            cursor.execute(f'PREPARE {stmt_name} AS {sql_stmt}')
+
+            # save it for the next call
+            conn.prepared_stmts[sql_stmt] = stmt_name
+
+        # execute the prepared statement, binding the parameters
+        if params:
+            cursor.execute(f'EXECUTE {stmt_name} ({", ".join(["%s"] * len(params))})', params)
+        else:
+            cursor.execute(f'EXECUTE {stmt_name}')
+
+    def rollback(self, conn):
+        """
+        Rolls back the current transaction on a connection.
+
+        :param conn:
+        :return:
+        """
+        try:
+            # undo the transaction
+            conn.rollback()
+        except Exception:
+            self.logger.warning('Error detected rolling back a DB transaction.')
+
+    def restore_auto_commit(self, conn, auto_commit: bool):
+        """
+        Restores the auto commit mode on a connection.
+
+        :param conn:
+        :param auto_commit:
+        :return:
+        """
+        try:
+            # restore the commit mode
+            conn.autocommit = auto_commit
+        except Exception:
+            self.logger.warning('Error restoring the auto commit mode on a DB connection.')
+
     def commit(self, db_name: str):
         """
-        issues a transaction commit
+        issues a transaction commit on the DB connection (non-pooled mode). A pooled connection is only held for a single operation,
+        so use exec_sql_transaction() to commit work on a pooled DB.
 
         :param db_name:
         :return:
         """
-        # if this connection is set to not auto commit
-        if not self.dbs[db_name].conn.autocommit:
-            # issue the commit
-            self.dbs[db_name].conn.commit()
+        # there is no connection to commit in pooled mode
+        if db_name in self.pools:
+            self.logger.warning('Warning: commit() is not supported on the pooled %s DB, use exec_sql_transaction().', db_name)
+        else:
+            # get the connection
+            with self.checkout(db_name) as conn:
+                # if this connection is set to not auto commit
+                if conn is not None and not conn.autocommit:
+                    # issue the commit
+                    conn.commit()
+
+    def listen(self, db_name: str, channel: str):
+        """
+        Opens a dedicated connection to a DB that LISTENs on a notification channel. The connection is not shared with
+        the other DB operations and is closed by the caller.
+
+        :param db_name:
+        :param channel:
+        :return: the connection, or None if it failed
+        """
+        # make a new connection
+        conn = self.connect(db_name, self.dbs[db_name].conn_str) if db_name in self.dbs else None
+
+        # if the connection was made
+        if conn is not None:
+            try:
+                # notifications are only delivered outside a transaction
+                conn.autocommit = True
+
+                # start listening
+                with conn.cursor() as cursor:
+                    cursor.execute(sql.SQL('LISTEN {}').format(sql.Identifier(channel)))
+
+                self.logger.info('Listening on the %s DB channel %s.', db_name, channel)
+            except Exception:
+                self.logger.exception('Error: Could not LISTEN on the %s DB channel %s.', db_name, channel)
+
+                # close the connection
+                conn.close()
+                conn = None
+
+        # return to the caller
+        return conn
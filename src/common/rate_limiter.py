@@ -0,0 +1,127 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Adaptive rate limiter - Paces requests to a service based on its response latency and errors.
+
+    Author: Phil Owen, RENCI.org
+"""
+
+import time
+import threading
+
+
+class AdaptiveRateLimiter:
+    """
+    Thread-safe rate limiter that adjusts the requests per second with additive increase/multiplicative decrease (AIMD).
+
+    Every response within the latency target raises the rate by about one request per second, each second. A slow response
+    or an error cuts the rate in half, at most once per round trip so a burst of slow responses from requests that were already
+    in flight only counts once. The rate stays between the minimum and the hard ceiling.
+    """
+
+    def __init__(self, target_latency: float, max_rps: float, min_rps: float = 0.1, initial_rps: float = None):
+        """
+        Initializes this class
+
+        :param target_latency: the response time in seconds that should not be exceeded
+        :param max_rps: the hard ceiling on requests per second
+        :param min_rps: the floor on requests per second
+        :param initial_rps: the starting rate, defaults to a quarter of the ceiling
+        """
+        # save the configuration
+        self.target_latency: float = target_latency
+        self.max_rps: float = max(max_rps, min_rps)
+        self.min_rps: float = min_rps
+
+        # init the current rate
+        self.rps: float = min(self.max_rps, max(self.min_rps, initial_rps if initial_rps is not None else self.max_rps / 4))
+
+        # the lock protects everything below
+        self.lock = threading.Lock()
+
+        # init the time the next request can be sent and the time of the last rate decrease
+        self.next_slot: float = 0.0
+        self.last_decrease: float = 0.0
+
+        # init the metrics
+        self.requests: int = 0
+        self.errors: int = 0
+        self.slow: int = 0
+        self.total_latency: float = 0.0
+        self.total_wait: float = 0.0
+        self.lowest_rps: float = self.rps
+
+    def acquire(self):
+        """
+        Waits until a request can be sent at the current rate.
+
+        :return:
+        """
+        with self.lock:
+            # get the current time
+            now: float = time.monotonic()
+
+            # reserve the next slot
+            slot: float = max(now, self.next_slot)
+            self.next_slot = slot + 1.0 / self.rps
+
+            # track the wait
+            self.total_wait += slot - now
+
+        # wait for the slot outside the lock
+        if slot > now:
+            time.sleep(slot - now)
+
+    def record(self, latency: float, success: bool):
+        """
+        Adjusts the rate based on the outcome of a request.
+
+        :param latency: the response time in seconds
+        :param success: False if the request failed because of the service (a 5xx status, timeout, etc.)
+        :return:
+        """
+        with self.lock:
+            # get the current time
+            now: float = time.monotonic()
+
+            # update the metrics
+            self.requests += 1
+            self.total_latency += latency
+
+            # was this an error or slow response?
+            if not success or latency > self.target_latency:
+                # count it
+                if not success:
+                    self.errors += 1
+                else:
+                    self.slow += 1
+
+                # back off, once per round trip
+                if now - self.last_decrease >= latency:
+                    self.rps = max(self.min_rps, self.rps / 2)
+                    self.lowest_rps = min(self.lowest_rps, self.rps)
+                    self.last_decrease = now
+
+                    # the new rate applies right away
+                    self.next_slot = max(self.next_slot, now + 1.0 / self.rps)
+            else:
+                # speed up by about one request per second, each second
+                self.rps = min(self.max_rps, self.rps + 1.0 / self.rps)
+
+    def get_metrics(self) -> dict:
+        """
+        Gets the rate and latency metrics.
+
+        :return:
+        """
+        with self.lock:
+            # return the metrics
+            return {'rps': round(self.rps, 3), 'lowest_rps': round(self.lowest_rps, 3), 'max_rps': self.max_rps, 'requests': self.requests,
+                    'errors': self.errors, 'slow': self.slow, 'avg_latency': self.total_latency / self.requests if self.requests else 0.0,
+                    'total_wait': round(self.total_wait, 3)}
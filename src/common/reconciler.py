@@ -0,0 +1,329 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Reconciler - Finds (and optionally cleans up) run artifacts that were orphaned by partial failures.
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+
+from src.common.rule_enums import ActionType
+from src.common.rule_utils import RuleUtils
+from src.common.logger import LoggingUtil
+from src.common.geoserver_utils import GeoServerUtils
+
+
+class Reconciler:
+    """
+    Class that reconciles the run artifacts across the systems the archiver operates on.
+
+    A run's artifacts live in the GeoServer data directory, the obs/mod file server directory, the TDS tree, the apsviz and
+    adcirc_obs DBs and the GeoServer store catalogs. The GeoServer data directory drives the GEOSERVER_REMOVE rule, so a run
+    that is no longer in it but still has artifacts in another system is an orphan that the archiver will never visit again.
+
+    Each system is listed once in bulk and the orphans are found with set differences by instance id, so the cost is
+    linear in the number of runs. The tropical run flags come with the apsviz DB listing (see get_run_instance_names() in
+    src/sql/apsviz_functions.sql), so no per-instance queries are made.
+    """
+    # the names of the systems that are reconciled
+    GEOSERVER_DIR: str = 'geoserver_dir'
+    OBS_MOD_DIR: str = 'obs_mod_dir'
+    APSVIZ_DB: str = 'apsviz_db'
+    OBS_MOD_DB: str = 'adcirc_obs_db'
+    GEOSERVER_STORES: str = 'geoserver_stores'
+    TDS: str = 'tds'
+
+    def __init__(self, _logger=None, _geoserver_utils: GeoServerUtils = None):
+        """
+        Initializes this class
+
+        :param _logger:
+        :param _geoserver_utils:
+        """
+        # if a reference to a logger is passed in, use it
+        if _logger is not None:
+            # get a handle to a logger
+            self.logger = _logger
+        else:
+            # get the log level and directory from the environment.
+            log_level, log_path = LoggingUtil.prep_for_logging()
+
+            # create a logger
+            self.logger = LoggingUtil.init_logging("APSVIZ.Archiver.Reconciler", level=log_level, line_format='medium', log_file_path=log_path)
+
+        # use the geoserver utilities passed in, or create a new one
+        self.geoserver_utils: GeoServerUtils = _geoserver_utils if _geoserver_utils is not None else GeoServerUtils(self.logger)
+
+        # get handles to the DB, TDS and rule utilities it uses
+        self.db_info = self.geoserver_utils.db_info
+        self.tds_utils = self.geoserver_utils.tds_utils
+        self.rule_utils: RuleUtils = self.geoserver_utils.rule_utils
+
+        # init the store names by instance id found in the last listing
+        self.store_names: dict = {}
+
+        # init the tropical run flags by instance id found in the last listing
+        self.tropical_runs: dict = {}
+
+    def get_listings(self):
+        """
+        Gets the instance ids present in each system, with one bulk listing per system.
+
+        :return: a dict of system name to a set of instance ids, or None if a DB listing failed
+        """
+        # init the return value
+        ret_val: dict = {}
+
+        # get the instances in the geoserver data directory
+        ret_val[self.GEOSERVER_DIR] = set(self.geoserver_utils.scan_geoserver_data_dir().keys())
+
+        # get the instances in the obs/mod file server directory
+        ret_val[self.OBS_MOD_DIR] = self.list_dir_names(self.geoserver_utils.fileserver_obs_path)
+
+        # get the instances in the apsviz DB, this includes the tropical run flags
+        self.tropical_runs = self.db_info.get_run_instance_names()
+
+        # get the instances in the adcirc_obs DB
+        obs_mod_names = self.db_info.get_obs_mod_instance_names()
+
+        # a failed DB listing would make every run in it look like an orphan
+        if self.tropical_runs is None or obs_mod_names is None:
+            self.logger.error('Error: A DB listing failed, the reconciliation was aborted.')
+
+            # return to the caller
+            return None
+
+        ret_val[self.APSVIZ_DB] = set(self.tropical_runs.keys())
+        ret_val[self.OBS_MOD_DB] = obs_mod_names
+
+        # get the store names in the geoserver catalogs by instance id
+        self.store_names = {}
+
+        for store_type in ['coverageStores', 'dataStores']:
+            # get all the stores. these names include the product type
+            for store in self.geoserver_utils.get_geoserver_stores_like_instance_id(store_type):
+                # save the store by the instance id
+                self.store_names.setdefault(store['name'].split('_')[0], []).append((store_type, store['name']))
+
+        ret_val[self.GEOSERVER_STORES] = set(self.store_names.keys())
+
+        # get the instances that have a TDS directory. the TDS tree is not organized by instance id, so the paths of all the
+        # known runs are resolved with the batched download URL lookup
+        ret_val[self.TDS] = set()
+
+        if self.tds_utils.tds_url != '':
+            # get all the instance ids that could have a TDS directory
+            instance_ids: list = sorted({instance_id for instance_ids in ret_val.values() for instance_id in instance_ids
+                                         if len(instance_id.split('-')) == 3})
+
+            # save the ones that have a TDS directory
+            ret_val[self.TDS] = {instance_id for instance_id, path in self.tds_utils.get_tds_data_paths(instance_ids).items()
+                                 if path and os.path.isdir(path)}
+
+        # return to the caller
+        return ret_val
+
+    @staticmethod
+    def list_dir_names(path: str) -> set:
+        """
+        Gets the names of the directories in a path.
+
+        :param path:
+        :return:
+        """
+        # init the return value
+        ret_val: set = set()
+
+        # make sure the path exists
+        if path and os.path.isdir(path):
+            # get a listing of the directory
+            with os.scandir(path) as entities:
+                # save the directory names
+                ret_val = {entity.name for entity in entities if entity.is_dir()}
+
+        # return to the caller
+        return ret_val
+
+    def find_orphans(self, listings: dict) -> dict:
+        """
+        Finds the instances that are not in the geoserver data directory but still have artifacts in other systems.
+
+        :param listings:
+        :return: a dict of instance id to the sorted list of systems that still have artifacts
+        """
+        # init the return value
+        ret_val: dict = {}
+
+        # for each system other than the geoserver data directory
+        for system, instance_ids in listings.items():
+            if system != self.GEOSERVER_DIR:
+                # save the orphans in this system
+                for instance_id in instance_ids - listings[self.GEOSERVER_DIR]:
+                    ret_val.setdefault(instance_id, []).append(system)
+
+        # return the orphans in a predictable order
+        return {instance_id: sorted(ret_val[instance_id]) for instance_id in sorted(ret_val)}
+
+    @staticmethod
+    def get_run_number(instance_id: str) -> int:
+        """
+        Gets the run number at the start of an instance id.
+
+        :param instance_id:
+        :return: the run number, or -1 if there is none
+        """
+        # get the first part of the instance id
+        run_number: str = instance_id.split('-')[0]
+
+        # return to the caller
+        return int(run_number) if run_number.isdigit() else -1
+
+    def get_cleanup_candidates(self, listings: dict, orphans: dict) -> list:
+        """
+        Gets the orphans that are safe to clean up.
+
+        Runs that are at or above the newest run in the geoserver data directory may still be in progress, tropical runs
+        are never worked on and instance ids without a run number can't be compared, so these are skipped.
+
+        :param listings:
+        :param orphans:
+        :return:
+        """
+        # get the newest run number in the geoserver data directory. nothing is cleaned up if it is empty
+        newest_run: int = max((self.get_run_number(instance_id) for instance_id in listings[self.GEOSERVER_DIR]), default=-1)
+
+        # return the candidates
+        return [instance_id for instance_id in orphans if -1 < self.get_run_number(instance_id) < newest_run and
+                not self.tropical_runs.get(instance_id, False)]
+
+    def reconcile(self, stats: dict, rule: RuleUtils.Rule) -> (bool, dict):
+        """
+        Reports the orphaned run artifacts, and removes them if the rule options have "cleanup" set.
+
+        The optional "cleanup_systems" rule option limits the removals to a list of system names.
+
+        :param stats:
+        :param rule:
+        :return:
+        """
+        # init the success flag
+        success: bool = True
+
+        # get the rule options
+        options: dict = rule.options or {}
+
+        try:
+            # get the bulk listings of all the systems
+            listings = self.get_listings()
+
+            # were all the listings gathered?
+            if listings is None:
+                success = False
+            else:
+                # find the orphans
+                orphans: dict = self.find_orphans(listings)
+
+                self.logger.info('Reconciliation found %s orphaned run(s). Runs per system: %s', len(orphans),
+                                 {system: len(instance_ids) for system, instance_ids in listings.items()})
+
+                # report the orphans
+                for instance_id, systems in orphans.items():
+                    self.logger.info('Orphaned run %s has artifacts in: %s', instance_id, ', '.join(systems))
+
+                # clean up the orphans if requested
+                if options.get('cleanup', False):
+                    # get the orphans that can be removed
+                    candidates: list = self.get_cleanup_candidates(listings, orphans)
+
+                    self.logger.info('Reconciliation cleanup of %s of %s orphaned run(s).', len(candidates), len(orphans))
+
+                    # remove them
+                    stats = self.cleanup({instance_id: orphans[instance_id] for instance_id in candidates}, stats, rule,
+                                         options.get('cleanup_systems'))
+
+                # if we got this far, it ran to a successful completion
+                stats['swept'] += 1
+
+        except Exception:
+            self.logger.exception('Exception: Failed to reconcile the run artifacts.')
+
+            # set the failure flag
+            success = False
+
+        # return to the caller
+        return success, stats
+
+    def cleanup(self, orphans: dict, stats: dict, rule: RuleUtils.Rule, systems: list = None) -> dict:
+        """
+        Removes the orphaned artifacts from the systems they were found in. The DB records are removed with the bulk SPs.
+
+        :param orphans: a dict of instance id to the list of systems that have artifacts
+        :param stats:
+        :param rule:
+        :param systems: the systems to clean up, all of them if not specified
+        :return:
+        """
+        # the removal operations only work on a remove rule
+        remove_rule: RuleUtils.Rule = rule._replace(action_type=ActionType.GEOSERVER_REMOVE)
+
+        # get the instances to clean up in each system
+        targets: dict = {}
+
+        for instance_id, instance_systems in orphans.items():
+            for system in instance_systems:
+                if systems is None or system in systems:
+                    targets.setdefault(system, []).append(instance_id)
+
+        # remove the DB records in bulk
+        for system, remove_fns in [(self.OBS_MOD_DB, [self.db_info.remove_obs_mod_db_records_bulk]),
+                                   (self.APSVIZ_DB, [self.db_info.remove_run_props_db_image_records_bulk,
+                                                     self.db_info.remove_catalog_db_records_bulk])]:
+            # if there is something to remove
+            if targets.get(system):
+                for remove_fn in remove_fns:
+                    # execute the removal if not in debug mode
+                    if not rule.debug:
+                        # get the instances that failed
+                        failed: list = remove_fn(targets[system])
+                    else:
+                        self.logger.debug('Debug mode on. Would have executed %s on %s run(s).', remove_fn.__name__, len(targets[system]))
+                        failed = []
+
+                    # handle the run stats
+                    stats['removed'] += len(targets[system]) - len(failed)
+                    stats['failed'] += len(failed)
+
+        # remove the obs/mod directories
+        for instance_id in targets.get(self.OBS_MOD_DIR, []):
+            if self.rule_utils.remove_directory(rule, os.path.join(self.geoserver_utils.fileserver_obs_path, instance_id)):
+                stats['removed'] += 1
+            else:
+                stats['failed'] += 1
+
+        # remove the geoserver stores
+        for instance_id in targets.get(self.GEOSERVER_STORES, []):
+            for store_type, store_name in self.store_names.get(instance_id, []):
+                if self.geoserver_utils.perform_geoserver_store_ops(remove_rule, store_type, store_name):
+                    stats['removed'] += 1
+                else:
+                    stats['failed'] += 1
+
+        # remove the TDS directories
+        for instance_id in targets.get(self.TDS, []):
+            if self.geoserver_utils.perform_tds_dir_ops(remove_rule, instance_id):
+                stats['removed'] += 1
+            else:
+                stats['failed'] += 1
+
+        # remove the empty TDS directories left behind
+        if not self.tds_utils.prune_pending_dirs():
+            stats['failed'] += 1
+
+        # return the stats
+        return stats
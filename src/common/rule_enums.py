@@ -71,6 +71,7 @@ class ActionType(int, Enum):
     GEOSERVER_MOVE = 8
     GEOSERVER_COPY = 9
     GEOSERVER_REMOVE = 10
+    GEOSERVER_RECONCILE = 11
     NONE = 99
 
 
@@ -18,16 +18,19 @@ import time
 
 from collections import namedtuple
 from src.common.rule_enums import DataType, QueryCriteriaType, PredicateType, ActionType, QueryDataType
-from src.common.logger import LoggingUtil
+from src.common.logger import LoggingUtil, LogCounters
 
 
 class RuleUtils:
     """
     Utility methods used for rule based components in this project.
     """
-    # define a named tuple where a rule can be housed
+    # define a named tuple where a rule can be housed. the options element is optional and holds action specific settings
     Rule: namedtuple = namedtuple('Rule', ['name', 'description', 'query_criteria_type', 'query_data_type', 'query_data_value', 'predicate_type',
-                                           'action_type', 'data_type', 'source', 'destination', 'debug'])
+                                           'action_type', 'data_type', 'source', 'destination', 'debug', 'options'], defaults=(None,))
+
+    # the rule elements that do not have to be in a rule definition
+    optional_rule_elements: tuple = ('options',)
 
     """
     Rule utility methods used for components in this project.
@@ -49,6 +52,24 @@ class RuleUtils:
             # create a logger
             self.logger = LoggingUtil.init_logging("APSVIZ.Archiver.RuleUtils", level=log_level, line_format='medium', log_file_path=log_path)
 
+        # init the counters of the rule being run. when set, the per-entity events are counted instead of logged
+        self.counters: LogCounters = None
+
+    def log_entity(self, event: str, msg: str, *args):
+        """
+        Logs a per-entity debug message, or counts the event when the rule has counters.
+
+        :param event: the name of the event counted
+        :param msg:
+        :param args:
+        :return:
+        """
+        # count or log the event
+        if self.counters is not None:
+            self.counters.count(event)
+        else:
+            self.logger.debug(msg, *args)
+
     def move_file(self, rule: Rule, opt_name: str = None) -> bool:
         """
         Moves the file from source to destination
@@ -74,7 +95,7 @@ class RuleUtils:
                 new_source = os.path.join(rule.source, opt_name)
 
             # log the targets
-            self.logger.debug('Move file. Source: %s to destination: %s', new_source, rule.destination)
+            self.log_entity('move file', 'Move file. Source: %s to destination: %s', new_source, rule.destination)
 
             # only perform the op if we aren't in debug mode
             if not rule.debug:
@@ -126,7 +147,7 @@ class RuleUtils:
                 new_destination = os.path.join(rule_destination, opt_name)
 
             # log the targets
-            self.logger.debug('Move directory. Source: %s to destination: %s', new_source, new_destination)
+            self.log_entity('move directory', 'Move directory. Source: %s to destination: %s', new_source, new_destination)
 
             # only perform the op if we aren't in debug mode
             if not rule.debug:
@@ -178,7 +199,7 @@ class RuleUtils:
                 new_source = os.path.join(rule.source, opt_name)
 
             # log the targets
-            self.logger.debug('COPY file. Source %s to destination %s', new_source, rule.destination)
+            self.log_entity('copy file', 'COPY file. Source %s to destination %s', new_source, rule.destination)
 
             # only perform the op if we aren't in debug mode
             if not rule.debug:
@@ -223,7 +244,7 @@ class RuleUtils:
                 new_destination = os.path.join(rule_destination, opt_name)
 
             # log the targets
-            self.logger.debug('Copy directory. Source %s to destination %s', new_source, new_destination)
+            self.log_entity('copy directory', 'Copy directory. Source %s to destination %s', new_source, new_destination)
 
             # only perform the op if we aren't in debug mode
             if not rule.debug:
@@ -265,7 +286,7 @@ class RuleUtils:
                 new_source = os.path.join(rule.source, opt_name)
 
             # log the targets
-            self.logger.debug('Remove file. Source %s', new_source)
+            self.log_entity('remove file', 'Remove file. Source %s', new_source)
 
             # only perform the op if we aren't in debug mode
             if not rule.debug:
@@ -304,7 +325,7 @@ class RuleUtils:
                 new_source = os.path.join(rule_source, opt_name)
 
             # log the targets
-            self.logger.debug('Remove directory. Source %s', new_source)
+            self.log_entity('remove directory', 'Remove directory. Source %s', new_source)
 
             # only perform the op if we aren't in debug mode
             if not rule.debug:
@@ -371,8 +392,8 @@ class RuleUtils:
         target_age = rule.query_data_value
 
         # log the targets
-        self.logger.debug('Source: %s, destination: %s, current age: %s, target age: %s, predicate: %s', rule.source, rule.destination, current_age,
-                          target_age, rule.predicate_type)
+        self.log_entity('age checked', 'Source: %s, destination: %s, current age: %s, target age: %s, predicate: %s', rule.source, rule.destination,
+                        current_age, target_age, rule.predicate_type)
 
         # make the EQUALS comparison
         if rule.predicate_type == PredicateType.EQUALS:
@@ -403,8 +424,8 @@ class RuleUtils:
             self.logger.error("Error: Unspecified predicate type.")
 
         if ret_val:
-            self.logger.debug("%s - Source: %s, destination: %s, current age: %s, target age: %s, predicate: %s", 'Success' if ret_val else 'Failed.',
-                              rule.source, rule.destination, current_age, target_age, rule.predicate_type)
+            self.log_entity('met age criteria', "%s - Source: %s, destination: %s, current age: %s, target age: %s, predicate: %s",
+                            'Success' if ret_val else 'Failed.', rule.source, rule.destination, current_age, target_age, rule.predicate_type)
 
         # return to the caller
         return ret_val
@@ -443,8 +464,8 @@ class RuleUtils:
         try:
             # ensure that all elements are in the data
             for item in self.Rule._fields:
-                # if the element was not found
-                if item not in rule:
+                # if a required element was not found
+                if item not in rule and item not in self.optional_rule_elements:
                     self.logger.error('Error: Rule element %s not found in rule definition.', item)
 
                     # set the failure flag
@@ -484,7 +505,8 @@ class RuleUtils:
                     elif the_rule.action_type in [ActionType.SWEEP_COPY, ActionType.SWEEP_MOVE, ActionType.SWEEP_REMOVE] and not os.path.isfile(
                             the_rule.source):
                         success = True
-                    elif the_rule.action_type in [ActionType.GEOSERVER_COPY, ActionType.GEOSERVER_MOVE, ActionType.GEOSERVER_REMOVE]:
+                    elif the_rule.action_type in [ActionType.GEOSERVER_COPY, ActionType.GEOSERVER_MOVE, ActionType.GEOSERVER_REMOVE,
+                                                   ActionType.GEOSERVER_RECONCILE]:
                         success = True
 
                     else:
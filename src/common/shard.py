@@ -0,0 +1,142 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Shard selector - Splits the entities to process across several archiver pods.
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import json
+import glob
+import zlib
+
+from src.common.general_utils import GeneralUtils
+
+
+class ShardSelector:
+    """
+    Class that decides which entities (instance ids, file or directory names) the archiver process owns.
+
+    The shard of this process is SHARD_INDEX (or JOB_COMPLETION_INDEX, set by a Kubernetes indexed Job) of SHARD_COUNT shards.
+    Every name is hashed with a stable hash (CRC32) so all the pods agree on the owner of a name without coordinating. With a
+    SHARD_COUNT of 1 (the default) everything is owned.
+
+    The stats of each shard are saved in the shard_stats directory of ARCHIVER_STATE_PATH so they can be merged.
+    """
+
+    def __init__(self):
+        """
+        Initializes this class
+
+        """
+        # get the number of shards and the shard of this process
+        self.count: int = max(1, int(os.getenv('SHARD_COUNT', '1')))
+        self.index: int = int(os.getenv('SHARD_INDEX', os.getenv('JOB_COMPLETION_INDEX', '0')))
+
+        # the index must be one of the shards
+        if not 0 <= self.index < self.count:
+            raise ValueError(f'Invalid shard index {self.index} for {self.count} shard(s).')
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Checks if the entities are split across several shards.
+
+        :return:
+        """
+        return self.count > 1
+
+    @property
+    def name(self) -> str:
+        """
+        Gets the name of this shard.
+
+        :return:
+        """
+        return f'{self.index}-of-{self.count}'
+
+    def get_shard(self, entity_name: str) -> int:
+        """
+        Gets the shard that owns an entity.
+
+        :param entity_name:
+        :return:
+        """
+        return zlib.crc32(entity_name.encode('utf-8')) % self.count
+
+    def owns(self, entity_name: str) -> bool:
+        """
+        Checks if this shard owns an entity.
+
+        :param entity_name:
+        :return:
+        """
+        return not self.enabled or self.get_shard(entity_name) == self.index
+
+    def save_stats(self, run_name: str, stats: dict) -> str:
+        """
+        Saves the stats of this shard for a run.
+
+        :param run_name: the name of the run (e.g. the rule definition file name) the stats are for
+        :param stats:
+        :return: the stats file path
+        """
+        # get the stats directory
+        stats_dir: str = os.path.join(GeneralUtils.prep_for_state(), 'shard_stats')
+
+        os.makedirs(stats_dir, exist_ok=True)
+
+        # get the stats file path
+        ret_val: str = os.path.join(stats_dir, f'{run_name}.{self.count}.{self.index}.json')
+
+        # write the stats
+        with open(ret_val, 'w', encoding='utf-8') as stats_fh:
+            json.dump({'shard_index': self.index, 'shard_count': self.count, 'stats': stats}, stats_fh)
+
+        # return to the caller
+        return ret_val
+
+    @staticmethod
+    def merge_stats(stats_list: list) -> dict:
+        """
+        Merges stats by adding up the counts.
+
+        :param stats_list:
+        :return:
+        """
+        # init the return value
+        ret_val: dict = {}
+
+        # add up the counts
+        for stats in stats_list:
+            for key, value in stats.items():
+                ret_val[key] = ret_val.get(key, 0) + value
+
+        # return to the caller
+        return ret_val
+
+    def load_merged_stats(self, run_name: str) -> (dict, int):
+        """
+        Merges the saved stats of all the shards of a run.
+
+        :param run_name:
+        :return: the merged stats and the number of shards that have saved their stats
+        """
+        # init storage for the stats of each shard
+        stats_list: list = []
+
+        # read the stats of each shard
+        stats_files: list = glob.glob(os.path.join(GeneralUtils.prep_for_state(), 'shard_stats', f'{glob.escape(run_name)}.{self.count}.*.json'))
+
+        for stats_file in sorted(stats_files):
+            with open(stats_file, encoding='utf-8') as stats_fh:
+                stats_list.append(json.load(stats_fh)['stats'])
+
+        # return to the caller
+        return self.merge_stats(stats_list), len(stats_list)
@@ -0,0 +1,209 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Slack notifier - Sends Slack messages on a background thread so they are never on the critical path.
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import time
+import queue
+import atexit
+import threading
+
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+
+from src.common.logger import LoggingUtil
+from src.common.circuit_breaker import CircuitBreaker
+
+
+class SlackNotifier:
+    """
+    Class that queues Slack messages and posts them from a background thread.
+
+    One WebClient is kept per token, each post is bounded by SLACK_SEND_TIMEOUT seconds (default 10) and the Slack circuit
+    breaker is honored. The messages still in the queue are sent at process exit, waiting at most SLACK_FLUSH_TIMEOUT seconds
+    (default 30).
+
+    There is one notifier per process, see get().
+    """
+    # the notifier of the process
+    notifier = None
+
+    # protects the notifier creation
+    notifier_lock = threading.Lock()
+
+    def __init__(self, _logger=None):
+        """
+        Initializes this class
+
+        :param _logger:
+        """
+        # if a reference to a logger is passed in, use it
+        if _logger is not None:
+            # get a handle to a logger
+            self.logger = _logger
+        else:
+            # get the log level and directory from the environment.
+            log_level, log_path = LoggingUtil.prep_for_logging()
+
+            # create a logger
+            self.logger = LoggingUtil.init_logging("APSVIZ.Archiver.SlackNotifier", level=log_level, line_format='medium', log_file_path=log_path)
+
+        # get the number of seconds a post and the exit flush can take
+        self.send_timeout: int = int(os.getenv('SLACK_SEND_TIMEOUT', '10'))
+        self.flush_timeout: float = float(os.getenv('SLACK_FLUSH_TIMEOUT', '30'))
+
+        # init the queue of (channel, token, message) tuples
+        self.queue: queue.Queue = queue.Queue()
+
+        # init the clients by token
+        self.clients: dict = {}
+
+        # the condition protects the pending count and the worker thread
+        self.condition = threading.Condition()
+
+        # init the number of messages queued but not yet handled
+        self.pending: int = 0
+
+        # init the worker thread, it is started with the first message
+        self.thread = None
+
+    @classmethod
+    def get(cls, _logger=None):
+        """
+        Gets the notifier of the process, creating it if needed.
+
+        :param _logger:
+        :return:
+        """
+        with cls.notifier_lock:
+            # create the notifier if it does not exist
+            if cls.notifier is None:
+                cls.notifier = SlackNotifier(_logger)
+
+                # send the queued messages at exit
+                atexit.register(cls.notifier.flush)
+
+            # return to the caller
+            return cls.notifier
+
+    def enqueue(self, channel: str, token: str, msg: str):
+        """
+        Queues a message for sending.
+
+        :param channel: the Slack channel id
+        :param token: the Slack token of the channel
+        :param msg:
+        :return:
+        """
+        with self.condition:
+            # count the message
+            self.pending += 1
+
+            # start the worker if it is not running
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run_worker, name='slack notifier', daemon=True)
+                self.thread.start()
+
+        # queue the message
+        self.queue.put((channel, token, msg))
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits for the queued messages to be sent.
+
+        :param timeout: the number of seconds to wait, defaults to SLACK_FLUSH_TIMEOUT
+        :return: True if all the messages were handled
+        """
+        # get the time to give up
+        deadline: float = time.monotonic() + (self.flush_timeout if timeout is None else timeout)
+
+        with self.condition:
+            # wait for the queue to drain or the deadline
+            while self.pending > 0 and time.monotonic() < deadline:
+                self.condition.wait(deadline - time.monotonic())
+
+            # were any messages left behind?
+            if self.pending > 0:
+                self.logger.warning('%s Slack message(s) were not sent before the flush timeout.', self.pending)
+
+            # return to the caller
+            return self.pending == 0
+
+    def run_worker(self):
+        """
+        Sends the queued messages.
+
+        :return:
+        """
+        # the worker runs for the life of the process
+        while True:
+            # get the next message
+            channel, token, msg = self.queue.get()
+
+            # send it
+            self.send(channel, token, msg)
+
+            with self.condition:
+                # this message has been handled
+                self.pending -= 1
+
+                # wake up anyone flushing
+                self.condition.notify_all()
+
+    def get_client(self, token: str) -> WebClient:
+        """
+        Gets the client of a token, creating it if needed. This is only called on the worker thread.
+
+        :param token:
+        :return:
+        """
+        # create the client if it does not exist
+        if token not in self.clients:
+            self.clients[token] = WebClient(token=token, timeout=self.send_timeout)
+
+        # return to the caller
+        return self.clients[token]
+
+    def send(self, channel: str, token: str, msg: str):
+        """
+        Posts a message to Slack.
+
+        :param channel:
+        :param token:
+        :param msg:
+        :return:
+        """
+        # get the circuit breaker of Slack
+        breaker: CircuitBreaker = CircuitBreaker.get('slack')
+
+        # don't wait on Slack if it is down
+        if not breaker.allow():
+            self.logger.warning('The Slack circuit is open, the message was not sent.')
+        else:
+            try:
+                # send the message
+                self.get_client(token).chat_postMessage(channel=channel, text=msg)
+
+                # Slack is up
+                breaker.record_success()
+            except SlackApiError:
+                # log the error
+                self.logger.exception('Slack %s messaging failed. msg: %s', channel, msg)
+
+                # Slack answered, so it is up
+                breaker.record_success()
+            except Exception:
+                # log the error
+                self.logger.exception('Slack %s could not be reached. msg: %s', channel, msg)
+
+                # count the failure
+                breaker.record_failure()
@@ -0,0 +1,175 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Store name parser - Streams the store names out of a GeoServer store listing with bounded memory.
+
+    Author: Phil Owen, RENCI.org
+"""
+import re
+import json
+import codecs
+
+# ijson is optional, the incremental tokenizer below is used when it is not installed
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+class StoreNameParser:
+    """
+    Incremental tokenizer for the GeoServer REST store listing, e.g.:
+
+        {"coverageStores": {"coverageStore": [{"name": "<store name>", "href": "<url>"}, ...]}}
+
+    Text is fed in chunks of any size and the store names are returned as soon as they are complete. Only the current
+    container nesting and the string being read are kept, so the memory used does not grow with the size of the listing.
+    An empty workspace (GeoServer returns {"coverageStores": ""}) has no names.
+    """
+    # finds the end of a string or the start of an escape sequence
+    STRING_SPECIAL = re.compile(r'["\\]')
+
+    # the container nesting of a store name: the root object, the store type object, the store array and the store object
+    STORE_NAME_PATH: list = ['{', '{', '[', '{']
+
+    def __init__(self):
+        """
+        Initializes this class
+
+        """
+        # init the nesting of containers. each entry is the container type and, for objects, the current key
+        self.stack: list = []
+
+        # init the flag that indicates the next string in an object is a key
+        self.expect_key: bool = False
+
+        # init the string state. the raw text (with escapes) of the string being read is kept until it is complete
+        self.in_string: bool = False
+        self.escape: bool = False
+        self.buf: list = []
+
+    def feed(self, text: str) -> list:
+        """
+        Parses the next chunk of the listing.
+
+        :param text:
+        :return: the store names completed in this chunk
+        """
+        # init the return value
+        ret_val: list = []
+
+        # init the position in the chunk
+        index: int = 0
+
+        # for each character of interest in the chunk
+        while index < len(text):
+            # are we in a string?
+            if self.in_string:
+                # the character after a backslash is part of the escape sequence
+                if self.escape:
+                    self.buf.append(text[index])
+                    self.escape = False
+                    index += 1
+                    continue
+
+                # find the end of the string or the next escape sequence
+                match = self.STRING_SPECIAL.search(text, index)
+
+                # the string continues in the next chunk
+                if match is None:
+                    self.buf.append(text[index:])
+                    break
+
+                # save the text up to the special character
+                self.buf.append(text[index:match.start()])
+                index = match.end()
+
+                # start an escape sequence or end the string
+                if match.group() == '\\':
+                    self.buf.append('\\')
+                    self.escape = True
+                else:
+                    self.in_string = False
+
+                    # handle the complete string
+                    name = self.end_string(json.loads(f'"{"".join(self.buf)}"'))
+
+                    # save it if it was a store name
+                    if name is not None:
+                        ret_val.append(name)
+            else:
+                # get the character
+                char: str = text[index]
+                index += 1
+
+                # handle the structural characters, everything else (white space, numbers, literals) is skipped
+                if char == '"':
+                    self.in_string = True
+                    self.buf = []
+                elif char in '{[':
+                    self.stack.append([char, None])
+                    self.expect_key = char == '{'
+                elif char in '}]':
+                    self.stack.pop()
+                elif char == ',':
+                    self.expect_key = bool(self.stack) and self.stack[-1][0] == '{'
+                elif char == ':':
+                    self.expect_key = False
+
+        # return to the caller
+        return ret_val
+
+    def end_string(self, value: str):
+        """
+        Handles a complete string.
+
+        :param value:
+        :return: the value if it is a store name, otherwise None
+        """
+        # init the return value
+        ret_val = None
+
+        # is this the key of an object member?
+        if self.expect_key:
+            self.stack[-1][1] = value
+            self.expect_key = False
+        # is this the value of a store name?
+        elif self.stack and self.stack[-1][1] == 'name' and [container[0] for container in self.stack] == self.STORE_NAME_PATH:
+            ret_val = value
+
+        # return to the caller
+        return ret_val
+
+    @staticmethod
+    def iter_store_names(response, store_type: str):
+        """
+        Streams the store names from a GeoServer store listing response that was requested with stream=True.
+
+        :param response:
+        :param store_type: coverageStores or dataStores
+        :return: a generator of store names
+        """
+        # use ijson if it is installed
+        if ijson is not None:
+            # decode any compression in the raw stream
+            response.raw.decode_content = True
+
+            # stream the names
+            yield from ijson.items(response.raw, f'{store_type}.{store_type[:-1]}.item.name')
+        else:
+            # create the tokenizer and an incremental decoder for text split across chunks
+            parser: StoreNameParser = StoreNameParser()
+            decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')()
+
+            # parse the body as it arrives
+            for chunk in response.iter_content(chunk_size=65536):
+                yield from parser.feed(decoder.decode(chunk))
+
+            # parse anything left in the decoder
+            yield from parser.feed(decoder.decode(b'', final=True))
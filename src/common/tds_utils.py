@@ -63,6 +63,15 @@ class TDSUtils:
         # init some storage for the run names
         self.run_names: set = set()
 
+        # init storage for the TDS paths that have been resolved
+        self.tds_data_paths: dict = {}
+
+        # get the directory that empty directory pruning will not go above
+        self.prune_boundary: str = os.environ.get('TDS_PRUNE_BOUNDARY', self.tds_base_directory)
+
+        # init storage for the directories waiting to be pruned
+        self.pending_prune_dirs: set = set()
+
         # Windows platforms use a different dir separator
         if sys.platform == 'win32':
             self.dir_sep = '\\'
@@ -70,11 +79,12 @@ class TDSUtils:
         else:
             self.dir_sep = '/'
 
-    def remove_dirs(self, instance_id: str) -> bool:
+    def remove_dirs(self, instance_id: str, defer_prune: bool = False) -> bool:
         """
-        recursively removes empty directories
+        removes the TDS data directory of a run and then prunes the empty directories above it
 
         :param instance_id:
+        :param defer_prune: save the directory for a later call to prune_pending_dirs() rather than pruning now
         :return:
         """
         # init the return value
@@ -91,47 +101,20 @@ class TDSUtils:
                 data_path: str = self.get_tds_data_path(instance_id, instance_id_parts)
 
                 try:
+                    # the path lookup failed, leave the data for a later run
+                    if data_path is None:
+                        self.logger.error('Error: The TDS path lookup failed for instance id %s.', instance_id)
+                        ret_val = False
                     # if there is no path, this must be on a TDS server outside this namespace
-                    if len(data_path) > 0:
+                    elif len(data_path) > 0:
                         # remove the directory specified that has the data
                         shutil.rmtree(data_path)
 
-                        # get the number of directories that must be checked when looking for empties.
-                        # we use the advisory value (YYYYMMDD) in the instance id for the directory to start checking from.
-                        # this should avoid a huge number of recursive directory checks.
-                        dir_count = (len(data_path.split(self.dir_sep)) - len(data_path.split(instance_id_parts[1])[0].split(self.dir_sep))) * -1
-
-                        # get the starting directory to start traversing up to
-                        interrogate_path = self.dir_sep.join(data_path.split(self.dir_sep)[0: dir_count])
-
-                        # walk the directory path from the bottom up
-                        for current_dir, _, _ in os.walk(interrogate_path, topdown=False):
-                            self.logger.debug('Interrogating the %s directory.', current_dir)
-
-                            # is anything in the subdirectory?
-                            if len(os.listdir(current_dir)) == 0:
-                                try:
-                                    # try to remove the directory
-                                    os.rmdir(current_dir)
-
-                                    self.logger.debug('Empty subdirectory %s has been removed.', current_dir)
-                                # if this occurs, show it as a warning as the directory is not configured properly
-                                except PermissionError:
-                                    self.logger.warning('There was a permissions error removing directory %s.', current_dir)
-
-                                    # set the failure flag
-                                    ret_val = False
-
-                                    # no need to continue
-                                    break
-                                # all other issues will be ignored
-                                except OSError:
-                                    self.logger.debug('Exception removing directory %s, ignoring.', current_dir)
-                            else:
-                                self.logger.debug('Directory %s was not empty, interrogation complete.', current_dir)
-
-                                # there is no need to continue looking for empty directories
-                                break
+                        # the pruning of empty directories starts at the parent of the removed directory
+                        if defer_prune:
+                            self.pending_prune_dirs.add(os.path.dirname(data_path))
+                        else:
+                            ret_val = self.prune_empty_dirs([os.path.dirname(data_path)])
                     else:
                         self.logger.warning('Warning: no TDS path found for instance id %s.', instance_id)
                 except FileNotFoundError:
@@ -145,44 +128,176 @@ class TDSUtils:
         # return the result
         return ret_val
 
-    def get_tds_data_path(self, instance_id: str, instance_id_parts: list) -> (str, int):
+    def prune_pending_dirs(self) -> bool:
+        """
+        prunes the empty directories above all the data directories removed with remove_dirs(defer_prune=True)
+
+        :return:
+        """
+        # prune the directories
+        ret_val: bool = self.prune_empty_dirs(list(self.pending_prune_dirs))
+
+        # they have all been handled
+        self.pending_prune_dirs.clear()
+
+        # return the result
+        return ret_val
+
+    def prune_empty_dirs(self, start_dirs: list) -> bool:
+        """
+        removes empty directories by walking up from each start directory with os.rmdir(). the walk stops at the first directory
+        that is not empty or at the prune boundary (TDS_PRUNE_BOUNDARY, defaults to the TDS base path).
+
+        the cost depends on the depth of the paths rather than the size of the tree. when pruning many paths, the directories are
+        handled a level at a time from the deepest up, so a parent is only tried once after all of its pruned children are gone.
+
+        :param start_dirs:
+        :return:
+        """
+        # init the return value
+        ret_val: bool = True
+
+        # get the boundary, nothing at or above this is removed
+        boundary: str = os.path.normpath(self.prune_boundary) if self.prune_boundary else ''
+
+        # do not prune without a boundary
+        if not boundary:
+            self.logger.debug('No TDS prune boundary defined, empty directories will not be removed.')
+        else:
+            # get the directories to try that are inside the boundary
+            pending: set = {os.path.normpath(x) for x in start_dirs if os.path.normpath(x).startswith(boundary + os.sep)}
+
+            # until there is nothing left to try
+            while pending:
+                # get the deepest level of directories
+                depth: int = max(x.count(os.sep) for x in pending)
+                level: set = {x for x in pending if x.count(os.sep) == depth}
+
+                # these are being handled now
+                pending -= level
+
+                # for each directory at this level
+                for current_dir in level:
+                    try:
+                        # try to remove the directory. this fails if it is not empty
+                        os.rmdir(current_dir)
+
+                        self.logger.debug('Empty subdirectory %s has been removed.', current_dir)
+                    # the directory may have already been removed
+                    except FileNotFoundError:
+                        pass
+                    # if this occurs, show it as a warning as the directory is not configured properly
+                    except PermissionError:
+                        self.logger.warning('There was a permissions error removing directory %s.', current_dir)
+
+                        # set the failure flag
+                        ret_val = False
+
+                        # no need to continue up this path
+                        continue
+                    # the directory is not empty (or otherwise can't be removed), the walk up this path is complete
+                    except OSError:
+                        self.logger.debug('Directory %s was not empty, interrogation complete.', current_dir)
+
+                        # no need to continue up this path
+                        continue
+
+                    # get the parent directory
+                    parent_dir: str = os.path.dirname(current_dir)
+
+                    # try the parent next if it is inside the boundary
+                    if parent_dir.startswith(boundary + os.sep):
+                        pending.add(parent_dir)
+
+        # return the result
+        return ret_val
+
+    def get_tds_data_path(self, instance_id: str, instance_id_parts: list) -> str:
         """
         Given the run id get the file system path to the directory on the TDS server
 
+        Paths resolved ahead of time by get_tds_data_paths() are used when available.
+
         :param instance_id:
         :param instance_id_parts:
 
-        :return:
+        :return: the path, an empty string if there is none in this namespace or None if the lookup failed
+        """
+        # has this path already been resolved?
+        if instance_id in self.tds_data_paths:
+            ret_val: str = self.tds_data_paths[instance_id]
+        # make sure we have the expected instance id format
+        elif len(instance_id_parts) == 3:
+            # get the path from the DB
+            ret_val = self.get_tds_data_paths([instance_id]).get(instance_id, '')
+        else:
+            ret_val = ''
+
+        # return the value to the caller
+        return ret_val
+
+    def get_tds_data_paths(self, instance_ids: list) -> dict:
+        """
+        Given a list of run ids get the file system paths to the directories on the TDS server.
+
+        The download URLs for all the runs are obtained with a single DB query. The paths are also saved for later calls
+        to get_tds_data_path(), except for the failed lookups, which are tried again.
+
+        :param instance_ids:
+        :return: a dict of instance id to TDS path. the path is empty if it was not found or is on a TDS server outside this namespace,
+                 and None if the lookup failed
         """
         # init the return values
-        ret_val: str = ''
+        ret_val: dict = {}
+
+        # get the download URLs from the DB
+        download_urls: dict = self.db_info.get_run_download_urls(instance_ids)
+
+        # for each instance id
+        for instance_id in instance_ids:
+            # get the download url
+            download_url: str = download_urls.get(instance_id, '')
+
+            # did the lookup fail?
+            if download_url is None:
+                # the path is unknown, not missing
+                ret_val[instance_id] = None
+            # did we get something?
+            elif not download_url:
+                self.logger.info('Error: Did not get the TDS run property for: %s', instance_id)
+
+                # no path for this one
+                ret_val[instance_id] = ''
+            else:
+                # convert the URL to a path
+                ret_val[instance_id] = self.get_tds_path_from_url(download_url)
 
-        # get the run properties from the DB
-        run_properties = self.db_info.get_run_props(instance_id_parts[0], '-'.join(instance_id_parts[1:]))
+        # save the paths for later. the failed lookups are left out so they are tried again
+        self.tds_data_paths.update({instance_id: path for instance_id, path in ret_val.items() if path is not None})
 
-        # did we get something?
-        if run_properties == -1:
-            self.logger.info('Error: Did not get the TDS run property for: %s', instance_id)
-        else:
-            # init the download url key name
-            property_index: str = ''
+        # return the value to the caller
+        return ret_val
 
-            # make sure we handle the case of legacy ASGS data
-            if 'output.downloadurl' in run_properties:
-                property_index = 'output.downloadurl'
-            elif 'downloadurl' in run_properties:
-                property_index = 'downloadurl'
+    def get_tds_path_from_url(self, download_url: str) -> str:
+        """
+        Converts a TDS download URL to the file system path on the TDS server
+
+        :param download_url:
+        :return: the path, or an empty string if the URL is on a TDS server outside this namespace
+        """
+        # init the return values
+        ret_val: str = ''
 
-            # is this a path on the current namespace?
-            if len(property_index) > 0 and run_properties[property_index].find(self.tds_url) != -1:
-                # remove the url from the path
-                ret_val = run_properties[property_index].replace(self.tds_url, '')
+        # is this a path on the current namespace?
+        if download_url.find(self.tds_url) != -1:
+            # remove the url from the path
+            ret_val = download_url.replace(self.tds_url, '')
 
-                # force all the directory separators to the current platform
-                ret_val = ret_val.replace('/', self.dir_sep)
+            # force all the directory separators to the current platform
+            ret_val = ret_val.replace('/', self.dir_sep)
 
-                # join the values to get a good file directory path
-                ret_val = os.path.join(self.tds_base_directory, ret_val)
+            # join the values to get a good file directory path
+            ret_val = os.path.join(self.tds_base_directory, ret_val)
 
         # return the value to the caller
         return ret_val
@@ -0,0 +1,213 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Time budget - Limits the time a run and its rules can take, and orders the entities so the time goes to the most valuable work.
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import time
+import threading
+
+
+class TimeBudget:
+    """
+    Class that tracks a time limit and records the work that was deferred when it ran out.
+
+    A run gets a budget of RUN_TIME_BUDGET seconds and each rule a child budget of its "time_budget" option or RULE_TIME_BUDGET
+    seconds. A budget of 0 (the default) is unlimited. A child budget is used up when it or its parent is. The work deferred under a
+    child budget is recorded in the run budget, so it can be reported once for the whole run.
+    """
+
+    def __init__(self, seconds: float = 0, parent=None):
+        """
+        Initializes this class
+
+        :param seconds: the time limit, 0 for none
+        :param parent: the budget this one is part of
+        """
+        # get the time the budget runs out, if ever
+        self.deadline = time.monotonic() + seconds if seconds > 0 else None
+
+        # save the parent budget
+        self.parent: TimeBudget = parent
+
+        # init the deferred entities by rule name. a rule that was not started at all has None
+        self.deferred: dict = {}
+
+        # protects the deferred dict, the workspaces of a rule are processed concurrently
+        self.deferred_lock = threading.Lock()
+
+    @property
+    def expired(self) -> bool:
+        """
+        Checks if the budget, or the budget it is part of, is used up.
+
+        :return:
+        """
+        return (self.deadline is not None and time.monotonic() >= self.deadline) or (self.parent is not None and self.parent.expired)
+
+    def child(self, seconds: float):
+        """
+        Gets a budget that is part of this one.
+
+        :param seconds: the time limit of the child, 0 for none
+        :return:
+        """
+        return TimeBudget(seconds, self)
+
+    def defer(self, rule_name: str, entities: list = None):
+        """
+        Records the work of a rule that was deferred to a later run.
+
+        :param rule_name:
+        :param entities: the entities that were not reached, None if the rule was not started
+        :return:
+        """
+        # the deferred work is recorded in the run budget
+        if self.parent is not None:
+            self.parent.defer(rule_name, entities)
+        else:
+            with self.deferred_lock:
+                if entities is None:
+                    self.deferred.setdefault(rule_name, None)
+                else:
+                    self.deferred[rule_name] = (self.deferred.get(rule_name) or []) + list(entities)
+
+    def take(self, rule_name: str, entities: list):
+        """
+        Yields the entities of a rule until the budget is used up. The ones left are deferred.
+
+        :param rule_name:
+        :param entities:
+        :return:
+        """
+        # for each entity
+        for index, entity in enumerate(entities):
+            # stop cleanly between entities when the time is up
+            if self.expired:
+                self.defer(rule_name, entities[index:])
+                break
+
+            yield entity
+
+    def get_report(self) -> str:
+        """
+        Gets a description of the work deferred in a run.
+
+        :return:
+        """
+        # init storage for the description of each rule
+        rule_msgs: list = []
+
+        with self.deferred_lock:
+            # describe each rule
+            for rule_name, entities in self.deferred.items():
+                if entities is None:
+                    rule_msgs.append(f'{rule_name}: not started')
+                else:
+                    rule_msgs.append(f"{rule_name}: {len(entities)} entity(ies) not reached "
+                                     f"({', '.join(entities[:5])}{', ...' if len(entities) > 5 else ''})")
+
+        # return to the caller
+        return f"Time budget used up, work deferred to the next run: {'; '.join(rule_msgs)}."
+
+
+class EntityPriority:
+    """
+    Orders the entities of a rule by the ENTITY_PRIORITY setting, or the "priority" option of the rule:
+
+        none: the order they were found in (the default).
+        oldest: oldest first, by the change time the age criteria use.
+        largest: most bytes first.
+        reclaim_rate: most bytes reclaimed per second first. Removal time is mostly spent per file, so this is the bytes per file.
+
+    Entities whose data is already gone (e.g. interrupted work) are quick to finish and always come first. The sizes are found by
+    walking the entities, which takes time of its own, so largest and reclaim_rate are best used on a moderate number of entities.
+    """
+    # the priorities that can be used
+    PRIORITIES: tuple = ('none', 'oldest', 'largest', 'reclaim_rate')
+
+    @classmethod
+    def get_priority(cls, options: dict) -> str:
+        """
+        Gets the priority of a rule.
+
+        :param options: the rule options
+        :return: the priority, unknown ones are none
+        """
+        # get the priority of the rule or the default one
+        ret_val: str = str((options or {}).get('priority', os.getenv('ENTITY_PRIORITY', 'none'))).lower()
+
+        # return to the caller
+        return ret_val if ret_val in cls.PRIORITIES else 'none'
+
+    @staticmethod
+    def get_usage(paths: list) -> (int, int):
+        """
+        Gets the disk usage of an entity.
+
+        :param paths: the files or directories of the entity
+        :return: the number of bytes and files
+        """
+        # init the counts
+        total_bytes: int = 0
+        total_files: int = 0
+
+        # walk the paths
+        pending: list = list(paths)
+
+        while pending:
+            try:
+                # get the path details, without following links
+                path = pending.pop()
+
+                if os.path.isdir(path) and not os.path.islink(path):
+                    # walk the contents
+                    with os.scandir(path) as entries:
+                        pending.extend(entry.path for entry in entries)
+                else:
+                    # count the file
+                    total_bytes += os.lstat(path).st_size
+                    total_files += 1
+            # the path was removed during the walk
+            except FileNotFoundError:
+                continue
+
+        # return to the caller
+        return total_bytes, total_files
+
+    @classmethod
+    def order(cls, entities: dict, priority: str) -> list:
+        """
+        Orders entities by a priority.
+
+        :param entities: a dict of entity name to the list of its file or directory paths
+        :param priority:
+        :return: the ordered entity names
+        """
+        # init the sort keys. with no priority, all the keys are the same
+        keys: dict = dict.fromkeys(entities, (0, 0))
+
+        # get the sort key of each entity. the sort is ascending, so bigger values are negated
+        for name, paths in entities.items() if priority in cls.PRIORITIES[1:] else []:
+            # get the paths that still exist
+            paths = [path for path in paths if os.path.lexists(path)]
+
+            if not paths:
+                keys[name] = (0, 0)
+            elif priority == 'oldest':
+                keys[name] = (1, min(os.lstat(path).st_ctime for path in paths))
+            else:
+                total_bytes, total_files = cls.get_usage(paths)
+
+                keys[name] = (1, -total_bytes if priority == 'largest' else -total_bytes / max(1, total_files))
+
+        # return to the caller. the sort is stable, so ties keep the order found
+        return sorted(entities, key=keys.get)
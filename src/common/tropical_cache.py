@@ -0,0 +1,137 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Tropical run cache - Persists the tropical/synoptic classification of runs between archiver runs.
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import time
+import sqlite3
+import threading
+
+from src.common.logger import LoggingUtil
+from src.common.general_utils import GeneralUtils
+
+
+class TropicalRunCache:
+    """
+    Class that keeps a persistent (SQLite) map of instance id to tropical run status.
+
+    Whether a run is tropical never changes once the run exists, so the answer from the DB only needs to be obtained once.
+    An optional TTL (in seconds) can be specified to force a periodic re-check of the DB. A TTL of 0 means entries never expire.
+    """
+
+    def __init__(self, _logger=None, cache_path: str = None, ttl: int = None):
+        """
+        Initializes this class
+
+        :param _logger:
+        :param cache_path:
+        :param ttl:
+        """
+        # if a reference to a logger is passed in, use it
+        if _logger is not None:
+            # get a handle to a logger
+            self.logger = _logger
+        else:
+            # get the log level and directory from the environment.
+            log_level, log_path = LoggingUtil.prep_for_logging()
+
+            # create a logger
+            self.logger = LoggingUtil.init_logging("APSVIZ.Archiver.TropicalRunCache", level=log_level, line_format='medium', log_file_path=log_path)
+
+        # get the location of the cache file
+        if cache_path is None:
+            cache_path = os.path.join(GeneralUtils.prep_for_state(), 'tropical_run_cache.sqlite')
+
+        # save the cache file path
+        self.cache_path: str = cache_path
+
+        # get the entry time to live in seconds. 0 means the entries never expire
+        self.ttl: int = int(os.getenv('TROPICAL_CACHE_TTL', '0')) if ttl is None else ttl
+
+        # the connection can be shared across threads so serialize access to it
+        self.lock = threading.Lock()
+
+        # init the DB connection
+        self.conn = None
+
+        try:
+            # open the cache
+            self.conn = sqlite3.connect(self.cache_path, check_same_thread=False)
+
+            # create the cache table if it does not exist
+            self.conn.execute('CREATE TABLE IF NOT EXISTS tropical_run (instance_id TEXT PRIMARY KEY, is_tropical INTEGER NOT NULL, '
+                              'created REAL NOT NULL)')
+
+            # save the table creation
+            self.conn.commit()
+        except sqlite3.Error:
+            self.logger.exception('Error opening the tropical run cache %s. Caching is disabled.', self.cache_path)
+
+            # disable the cache
+            self.conn = None
+
+    def __del__(self):
+        """
+        Closes the cache connection.
+
+        :return:
+        """
+        # if there is a connection, close it
+        if getattr(self, 'conn', None) is not None:
+            self.conn.close()
+
+    def get(self, instance_id: str):
+        """
+        Gets the cached tropical status of a run.
+
+        :param instance_id:
+        :return: True/False if the run is cached, None if it was not found or has expired
+        """
+        # init the return value
+        ret_val = None
+
+        # if the cache is available
+        if self.conn is not None:
+            try:
+                with self.lock:
+                    # get the cached record
+                    row = self.conn.execute('SELECT is_tropical, created FROM tropical_run WHERE instance_id = ?', (instance_id,)).fetchone()
+
+                # was an unexpired record found?
+                if row is not None and (self.ttl <= 0 or time.time() - row[1] < self.ttl):
+                    ret_val = bool(row[0])
+            except sqlite3.Error:
+                self.logger.exception('Error reading the tropical run cache for %s.', instance_id)
+
+        # return to the caller
+        return ret_val
+
+    def put(self, instance_id: str, is_tropical: bool):
+        """
+        Saves the tropical status of a run.
+
+        :param instance_id:
+        :param is_tropical:
+        :return:
+        """
+        # if the cache is available
+        if self.conn is not None:
+            try:
+                with self.lock:
+                    # insert or refresh the record
+                    self.conn.execute('INSERT OR REPLACE INTO tropical_run (instance_id, is_tropical, created) VALUES (?, ?, ?)',
+                                      (instance_id, int(bool(is_tropical)), time.time()))
+
+                    # save the record
+                    self.conn.commit()
+            except sqlite3.Error:
+                self.logger.exception('Error writing the tropical run cache for %s.', instance_id)
@@ -0,0 +1,184 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Work lock - Keeps concurrent archiver runs from working on the same rule sets and instances.
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import fcntl
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from src.common.logger import LoggingUtil
+from src.common.general_utils import GeneralUtils
+
+
+class WorkLock:
+    """
+    Class that takes non-blocking locks on units of work (rule sets, instances) so that a second runner skips locked work
+    right away instead of repeating it.
+
+    With a DB connection the locks are apsviz DB session advisory locks (pg_try_advisory_lock), held on a connection of their own.
+    Otherwise, e.g. for the filesystem-only rules or when the DB is down, they are fcntl locks on files in the locks directory of
+    ARCHIVER_STATE_PATH, which must then be shared by the runners. Either kind of lock is released by the OS/DB if the runner dies.
+
+    The locks held are tracked for the whole process, so threads of one process are also kept off the same work.
+    Locking is turned off with WORK_LOCKS=false.
+    """
+    # the locks held in this process, by key. the value is ('db', db_info, lock id) or ('file', file descriptor)
+    held: dict = {}
+
+    # protects the held dict
+    held_lock = threading.Lock()
+
+    def __init__(self, _logger=None, _db_info=None):
+        """
+        Initializes this class
+
+        :param _logger:
+        :param _db_info: a PGImplementation to use for DB advisory locks
+        """
+        # if a reference to a logger is passed in, use it
+        if _logger is not None:
+            # get a handle to a logger
+            self.logger = _logger
+        else:
+            # get the log level and directory from the environment.
+            log_level, log_path = LoggingUtil.prep_for_logging()
+
+            # create a logger
+            self.logger = LoggingUtil.init_logging("APSVIZ.Archiver.WorkLock", level=log_level, line_format='medium', log_file_path=log_path)
+
+        # save the DB utilities
+        self.db_info = _db_info
+
+        # get the locking mode
+        self.enabled: bool = os.getenv('WORK_LOCKS', 'true').lower() in ('true', '1', 'yes')
+
+    @staticmethod
+    def get_lock_id(key: str) -> int:
+        """
+        Gets a stable 64-bit DB advisory lock id for a key.
+
+        :param key:
+        :return:
+        """
+        return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+    def acquire(self, key: str) -> bool:
+        """
+        Tries to lock a unit of work, without waiting.
+
+        :param key:
+        :return: True if the lock was obtained (or locking is off)
+        """
+        # init the return value
+        ret_val: bool = True
+
+        # if locking is on
+        if self.enabled:
+            with self.held_lock:
+                # another thread of this process has the work
+                if key in self.held:
+                    ret_val = False
+                else:
+                    # try the DB lock first
+                    lock_id: int = self.get_lock_id(key)
+
+                    db_locked = self.db_info.try_advisory_lock(lock_id) if self.db_info is not None else None
+
+                    # use the DB lock if the DB could be used, otherwise fall back to a file lock
+                    if db_locked is not None:
+                        ret_val = db_locked
+
+                        if ret_val:
+                            self.held[key] = ('db', self.db_info, lock_id)
+                    else:
+                        # get the file lock
+                        lock_fd = self.lock_file(key)
+
+                        ret_val = lock_fd is not None
+
+                        if ret_val:
+                            self.held[key] = ('file', lock_fd)
+
+            # log a skip
+            if not ret_val:
+                self.logger.info('%s is locked by another runner.', key)
+
+        # return to the caller
+        return ret_val
+
+    def lock_file(self, key: str):
+        """
+        Tries to take an exclusive lock on the lock file of a key, without waiting.
+
+        :param key:
+        :return: the open file descriptor holding the lock, or None if the file is locked
+        """
+        # get the locks directory
+        lock_dir: str = os.path.join(GeneralUtils.prep_for_state(), 'locks')
+
+        os.makedirs(lock_dir, exist_ok=True)
+
+        # open the lock file. the name is a hash as keys can contain path separators
+        ret_val = os.open(os.path.join(lock_dir, f'{hashlib.sha1(key.encode("utf-8")).hexdigest()}.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+
+        try:
+            # take the lock
+            fcntl.flock(ret_val, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            # someone else has it
+            os.close(ret_val)
+            ret_val = None
+
+        # return to the caller
+        return ret_val
+
+    def release(self, key: str):
+        """
+        Releases the lock of a unit of work.
+
+        :param key:
+        :return:
+        """
+        with self.held_lock:
+            # get the lock, if it is held
+            lock = self.held.pop(key, None)
+
+        # release it
+        if lock is not None:
+            try:
+                if lock[0] == 'db':
+                    lock[1].advisory_unlock(lock[2])
+                else:
+                    # closing the file releases the lock
+                    os.close(lock[1])
+            except Exception:
+                self.logger.exception('Error releasing the lock of %s.', key)
+
+    @contextmanager
+    def hold(self, key: str):
+        """
+        Locks a unit of work for the duration of a with block.
+
+        :param key:
+        :return: True if the lock was obtained
+        """
+        # try to get the lock
+        acquired: bool = self.acquire(key)
+
+        try:
+            yield acquired
+        finally:
+            # release it
+            if acquired:
+                self.release(key)
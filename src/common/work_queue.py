@@ -0,0 +1,156 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Work queue - Distributes the entities of the GEOSERVER_* and SWEEP_* rules to any number of workers through the apsviz DB.
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import socket
+from enum import Enum
+
+from src.common.logger import LoggingUtil
+from src.common.rule_enums import ActionType
+from src.common.rule_utils import RuleUtils
+
+
+class WorkQueue:
+    """
+    Class that queues and claims the tasks of the work queue table (see src/sql/apsviz_work_queue.sql).
+
+    A task is a rule and one of its entities (an instance id, file or directory name). A run in enqueue mode (WORK_QUEUE=enqueue)
+    queues a task for each entity the GEOSERVER_COPY/MOVE/REMOVE and SWEEP_* rules find instead of running them. The workers
+    claim the tasks one at a time, so the work balances across them however much the entities vary in size.
+
+    A claim is a lease of WORK_QUEUE_LEASE seconds (default 3600). The task of a worker that died is claimed again once its lease
+    expires, and a failed task is retried, up to WORK_QUEUE_MAX_ATTEMPTS tries (default 3).
+    """
+
+    def __init__(self, _logger=None, _db_info=None):
+        """
+        Initializes this class
+
+        :param _logger:
+        :param _db_info: the PGImplementation of the apsviz DB the queue is in
+        """
+        # if a reference to a logger is passed in, use it
+        if _logger is not None:
+            # get a handle to a logger
+            self.logger = _logger
+        else:
+            # get the log level and directory from the environment.
+            log_level, log_path = LoggingUtil.prep_for_logging()
+
+            # create a logger
+            self.logger = LoggingUtil.init_logging("APSVIZ.Archiver.WorkQueue", level=log_level, line_format='medium', log_file_path=log_path)
+
+        # save the DB utilities
+        self.db_info = _db_info
+
+        # get the lease of a claim and the number of times a task is tried
+        self.lease: int = int(os.getenv('WORK_QUEUE_LEASE', '3600'))
+        self.max_attempts: int = int(os.getenv('WORK_QUEUE_MAX_ATTEMPTS', '3'))
+
+        # get the name of this worker, it identifies the claims of this process
+        self.worker: str = f'{socket.gethostname()}-{os.getpid()}'
+
+    @staticmethod
+    def enqueue_mode() -> bool:
+        """
+        Checks if the queueable rules are queued instead of run.
+
+        :return:
+        """
+        return os.getenv('WORK_QUEUE', '').lower() == 'enqueue'
+
+    @staticmethod
+    def is_queueable(rule: RuleUtils.Rule) -> bool:
+        """
+        Checks if the entities of a rule can be processed as work queue tasks.
+
+        The rules on several workspaces and the two-phase (plan) rules are run as a whole.
+
+        :param rule:
+        :return:
+        """
+        # get the options of the rule
+        options: dict = rule.options or {}
+
+        # return to the caller
+        return rule.action_type in (ActionType.GEOSERVER_COPY, ActionType.GEOSERVER_MOVE, ActionType.GEOSERVER_REMOVE, ActionType.SWEEP_COPY,
+                                    ActionType.SWEEP_MOVE, ActionType.SWEEP_REMOVE) and 'workspaces' not in options and 'plan' not in options
+
+    @staticmethod
+    def get_rule_def(rule: RuleUtils.Rule) -> dict:
+        """
+        Gets the rule definition of a rule, as it would be in a rule definition file.
+
+        :param rule:
+        :return:
+        """
+        # the enum values are saved by name
+        return {key: value.name if isinstance(value, Enum) else value for key, value in rule._asdict().items()}
+
+    @staticmethod
+    def get_task_rule(task: dict) -> dict:
+        """
+        Gets the rule definition of a task, limited to the entity of the task.
+
+        :param task:
+        :return:
+        """
+        # get the rule
+        rule: dict = task['rule']
+
+        # return to the caller
+        return {**rule, 'options': {**(rule.get('options') or {}), 'instance_ids': [task['entity']]}}
+
+    def enqueue(self, rule: RuleUtils.Rule, entities: list) -> int:
+        """
+        Queues a task for each entity of a rule.
+
+        :param rule:
+        :param entities:
+        :return: the number of tasks queued, or -1 on an error
+        """
+        # queue the tasks
+        ret_val: int = self.db_info.enqueue_work_tasks(self.get_rule_def(rule), entities)
+
+        self.logger.info('Rule "%s": %s of %s entity(ies) queued.', rule.name, ret_val, len(entities))
+
+        # return to the caller
+        return ret_val
+
+    def claim(self):
+        """
+        Claims the next task.
+
+        :return: the task (id, rule, entity, attempts), or None if there is nothing to do
+        """
+        # claim the task
+        return self.db_info.claim_work_task(self.worker, self.lease, self.max_attempts)
+
+    def complete(self, task: dict, success: bool, stats: dict) -> bool:
+        """
+        Records the result of a task.
+
+        :param task:
+        :param success:
+        :param stats:
+        :return: True if the result was recorded
+        """
+        # record the result
+        ret_val: bool = self.db_info.complete_work_task(task['id'], self.worker, success, stats, max_attempts=self.max_attempts)
+
+        # the task was claimed by another worker if this one took longer than the lease
+        if not ret_val:
+            self.logger.warning('Warning: The result of task %s (%s) was not recorded, the claim may have expired.', task['id'], task['entity'])
+
+        # return to the caller
+        return ret_val
@@ -0,0 +1,40 @@
+-- SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+-- SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+-- SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+--
+-- SPDX-License-Identifier: GPL-3.0-or-later
+-- SPDX-License-Identifier: LicenseRef-RENCI
+-- SPDX-License-Identifier: MIT
+
+-- Functions used by the APSViz Archiver in the adcirc_obs DB.
+--
+-- These build on the existing per-instance SPs so that the removal logic stays in one place.
+
+-- Removes the obs/mod stations for an array of instance ids in a single call.
+CREATE OR REPLACE FUNCTION public.remove_adcirc_obs_stations_bulk(_run_names text[])
+    RETURNS integer
+    LANGUAGE plpgsql
+AS $$
+DECLARE
+    _run_name text;
+BEGIN
+    FOREACH _run_name IN ARRAY _run_names
+    LOOP
+        PERFORM public.remove_adcirc_obs_stations(_run_name);
+    END LOOP;
+
+    -- return the number of instances processed
+    RETURN coalesce(cardinality(_run_names), 0);
+END;
+$$;
+
+-- Gets the names of all the runs that have obs/mod stations, used to reconcile the archiver's systems.
+-- Note: this reads the model run id of the station table (drf_apsviz_station) that remove_adcirc_obs_stations() cleans up.
+CREATE OR REPLACE FUNCTION public.get_adcirc_obs_instance_names()
+    RETURNS text[]
+    LANGUAGE sql
+    STABLE
+AS $$
+    SELECT coalesce(array_agg(DISTINCT s.model_run_id), '{}'::text[])
+    FROM public.drf_apsviz_station s;
+$$;
@@ -0,0 +1,91 @@
+-- SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+-- SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+-- SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+--
+-- SPDX-License-Identifier: GPL-3.0-or-later
+-- SPDX-License-Identifier: LicenseRef-RENCI
+-- SPDX-License-Identifier: MIT
+
+-- Functions used by the APSViz Archiver in the apsviz DB.
+--
+-- These build on the existing per-instance SPs so that the removal logic stays in one place.
+
+-- Removes the catalog members for an array of instance ids in a single call.
+-- Each instance id is matched as a prefix, the same way remove_catalog_member() is called for a single run.
+CREATE OR REPLACE FUNCTION public.remove_catalog_members_bulk(_run_names text[])
+    RETURNS integer
+    LANGUAGE plpgsql
+AS $$
+DECLARE
+    _run_name text;
+BEGIN
+    FOREACH _run_name IN ARRAY _run_names
+    LOOP
+        PERFORM public.remove_catalog_member(_run_name || '%');
+    END LOOP;
+
+    -- return the number of instances processed
+    RETURN coalesce(cardinality(_run_names), 0);
+END;
+$$;
+
+-- Removes the image.* run properties for an array of instance ids in a single call.
+CREATE OR REPLACE FUNCTION public.remove_image_run_props_bulk(_run_names text[])
+    RETURNS integer
+    LANGUAGE plpgsql
+AS $$
+DECLARE
+    _run_name text;
+BEGIN
+    FOREACH _run_name IN ARRAY _run_names
+    LOOP
+        PERFORM public.remove_image_run_props(_run_name);
+    END LOOP;
+
+    -- return the number of instances processed
+    RETURN coalesce(cardinality(_run_names), 0);
+END;
+$$;
+
+-- Gets the TDS download URL for an array of instance names (<instance id>-<uid>) in a single call.
+-- The result is a json object of instance name to URL. The output.downloadurl property is preferred over the
+-- legacy downloadurl property, the same as the per-instance lookup using get_run_prop_items_json().
+-- Note: this reads the run properties table (ASGS_Mon_config_item) that get_run_prop_items_json() is built on.
+CREATE OR REPLACE FUNCTION public.get_run_prop_download_urls(_instance_names text[])
+    RETURNS json
+    LANGUAGE sql
+    STABLE
+AS $$
+    WITH targets AS (
+        SELECT instance_name, split_part(instance_name, '-', 1)::integer AS instance_id, substr(instance_name, strpos(instance_name, '-') + 1) AS uid
+        FROM unnest(_instance_names) AS instance_name
+        WHERE split_part(instance_name, '-', 1) ~ '^[0-9]+$'
+    )
+    SELECT json_object_agg(t.instance_name, urls.value)
+    FROM targets t
+    JOIN LATERAL (
+        SELECT ci.value
+        FROM public."ASGS_Mon_config_item" ci
+        WHERE ci.instance_id = t.instance_id AND ci.uid = t.uid AND ci.key IN ('output.downloadurl', 'downloadurl')
+        ORDER BY (ci.key = 'output.downloadurl') DESC
+        LIMIT 1
+    ) urls ON true;
+$$;
+
+-- Gets the names (<instance id>-<uid>) of all the runs that have run properties, used to reconcile the archiver's systems.
+-- The result is a json object of instance name to a flag that is true for tropical (hurricane) runs. The flags come from the
+-- forcing.tropicalcyclone run property of each run, aggregated in the same pass over the run properties table. Runs without the
+-- property are flagged as tropical, the same as a failed is_tropical_run() lookup, so they are never worked on.
+CREATE OR REPLACE FUNCTION public.get_run_instance_names()
+    RETURNS json
+    LANGUAGE sql
+    STABLE
+AS $$
+    SELECT coalesce(json_object_agg(r.instance_name, r.is_tropical), '{}'::json)
+    FROM (
+        SELECT ci.instance_id::text || '-' || ci.uid AS instance_name,
+               coalesce(bool_or(lower(ci.value) = 'on') FILTER (WHERE ci.key = 'forcing.tropicalcyclone'), true) AS is_tropical
+        FROM public."ASGS_Mon_config_item" ci
+        GROUP BY ci.instance_id, ci.uid
+    ) r;
+$$;
@@ -0,0 +1,87 @@
+-- SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+-- SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+-- SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+--
+-- SPDX-License-Identifier: GPL-3.0-or-later
+-- SPDX-License-Identifier: LicenseRef-RENCI
+-- SPDX-License-Identifier: MIT
+
+-- The work queue of the APSViz Archiver in the apsviz DB.
+--
+-- A run in enqueue mode (WORK_QUEUE=enqueue) adds a task for each entity (instance id, file or directory name) found by the
+-- GEOSERVER_* and SWEEP_* rules. Any number of workers (main.py --worker) claim the tasks with FOR UPDATE SKIP LOCKED, run the rule
+-- on the entity and record the result. A claim is a lease, the task of a worker that died is claimed again when the lease expires.
+
+-- the tasks. status is one of pending, claimed, done or failed
+CREATE TABLE IF NOT EXISTS public.archiver_work_queue (
+    id bigserial PRIMARY KEY,
+    rule_name text NOT NULL,
+    rule json NOT NULL,
+    entity text NOT NULL,
+    status text NOT NULL DEFAULT 'pending',
+    attempts integer NOT NULL DEFAULT 0,
+    worker text,
+    lease_expires timestamptz,
+    result json,
+    created timestamptz NOT NULL DEFAULT now(),
+    updated timestamptz NOT NULL DEFAULT now()
+);
+
+-- a rule and entity is only queued once until its task is finished
+CREATE UNIQUE INDEX IF NOT EXISTS archiver_work_queue_open_idx ON public.archiver_work_queue (rule_name, entity) WHERE status IN ('pending', 'claimed');
+
+-- Adds a task for each entity of a rule. Entities that already have an unfinished task of the rule are skipped.
+-- Returns the number of tasks added.
+CREATE OR REPLACE FUNCTION public.archiver_enqueue_tasks(_rule json, _entities text[])
+    RETURNS integer
+    LANGUAGE sql
+AS $$
+    WITH added AS (
+        INSERT INTO public.archiver_work_queue (rule_name, rule, entity)
+        SELECT _rule ->> 'name', _rule, entity
+        FROM unnest(_entities) AS entity
+        ON CONFLICT (rule_name, entity) WHERE status IN ('pending', 'claimed') DO NOTHING
+        RETURNING 1
+    )
+    SELECT count(*)::integer FROM added;
+$$;
+
+-- Claims the oldest pending task, or a claimed task whose lease expired, for a worker. Concurrent workers skip the rows locked by
+-- each other's claims. Expired tasks that used up their attempts are failed first.
+-- Returns the task as json (id, rule, entity, attempts), or null if there is nothing to do.
+CREATE OR REPLACE FUNCTION public.archiver_claim_task(_worker text, _lease_seconds integer, _max_attempts integer)
+    RETURNS json
+    LANGUAGE sql
+AS $$
+    UPDATE public.archiver_work_queue
+    SET status = 'failed', result = json_build_object('error', 'lease expired'), lease_expires = NULL, updated = now()
+    WHERE status = 'claimed' AND lease_expires < now() AND attempts >= _max_attempts;
+
+    UPDATE public.archiver_work_queue q
+    SET status = 'claimed', worker = _worker, attempts = q.attempts + 1, lease_expires = now() + make_interval(secs => _lease_seconds), updated = now()
+    WHERE q.id = (
+        SELECT c.id
+        FROM public.archiver_work_queue c
+        WHERE c.status = 'pending' OR (c.status = 'claimed' AND c.lease_expires < now())
+        ORDER BY c.id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING json_build_object('id', q.id, 'rule', q.rule, 'entity', q.entity, 'attempts', q.attempts);
+$$;
+
+-- Records the result of a task claimed by a worker. A failed task is retried until it used up its attempts.
+-- Returns 1 if the task was updated, 0 if the worker no longer holds the claim (e.g. its lease expired and it was claimed again).
+CREATE OR REPLACE FUNCTION public.archiver_complete_task(_id bigint, _worker text, _success boolean, _result json, _max_attempts integer)
+    RETURNS integer
+    LANGUAGE sql
+AS $$
+    WITH completed AS (
+        UPDATE public.archiver_work_queue
+        SET status = CASE WHEN _success THEN 'done' WHEN attempts < _max_attempts THEN 'pending' ELSE 'failed' END,
+            result = _result, lease_expires = NULL, updated = now()
+        WHERE id = _id AND worker = _worker AND status = 'claimed'
+        RETURNING 1
+    )
+    SELECT count(*)::integer FROM completed;
+$$;
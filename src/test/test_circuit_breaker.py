@@ -0,0 +1,104 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Test the dependency circuit breakers
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import time
+
+import requests
+
+from src.common.circuit_breaker import CircuitBreaker
+from src.common.geoserver_utils import GeoServerUtils
+
+
+def test_circuit_states():
+    """
+    tests opening the circuit, failing fast and probing after the cool-down
+
+    :return:
+    """
+    # create a breaker
+    breaker: CircuitBreaker = CircuitBreaker('test', 2, 0.2)
+
+    # a failure under the threshold leaves it closed, a success resets the count
+    assert breaker.allow() and not breaker.record_failure()
+    breaker.record_success()
+    assert breaker.allow() and not breaker.record_failure()
+
+    # the second consecutive failure opens it
+    assert breaker.allow() and breaker.record_failure()
+
+    # calls fail fast
+    assert breaker.is_open() and not breaker.allow()
+
+    # after the cool-down a single probe is allowed
+    time.sleep(0.25)
+
+    assert breaker.allow() and not breaker.allow()
+
+    # a failed probe opens it again
+    assert breaker.record_failure() and not breaker.allow()
+
+    # a successful probe closes it
+    time.sleep(0.25)
+
+    assert breaker.allow()
+    breaker.record_success()
+
+    assert breaker.allow() and not breaker.is_open()
+
+    # check the metrics
+    assert breaker.times_opened == 2 and breaker.rejected == 3
+
+
+def test_geoserver_fail_fast(monkeypatch, tmp_path):
+    """
+    tests that the geoserver is no longer called once its circuit is open
+
+    :return:
+    """
+    # point the geoserver, obs/mod and state paths at the test directory
+    monkeypatch.setenv('GEOSERVER_PROJ_PATH', str(tmp_path))
+    monkeypatch.setenv('FILESERVER_OBS_PATH', os.path.join(tmp_path, 'obsmod'))
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path))
+
+    # start with a fresh set of breakers
+    CircuitBreaker.reset_all()
+    monkeypatch.setenv('CIRCUIT_BREAKER_THRESHOLD', '2')
+
+    # count the requests made
+    calls: list = []
+
+    def request(*args, **kwargs):
+        calls.append((args, kwargs))
+        raise requests.ConnectionError('connection refused')
+
+    monkeypatch.setattr(requests, 'request', request)
+
+    # get a handle to the geoserver utils
+    geo_svr: GeoServerUtils = GeoServerUtils()
+
+    # list the stores a few times
+    for _ in range(5):
+        assert not geo_svr.get_geoserver_stores_like_instance_id('coverageStores')
+
+    # only the calls that opened the circuit should have been made
+    assert len(calls) == 2
+
+    # the outage should be in the summary
+    assert CircuitBreaker.get_summary() == ['geoserver circuit opened 1 time(s), 3 call(s) failed fast, now open']
+
+    # the next run only reports new outages
+    assert not CircuitBreaker.get_summary()
+
+    # clean up
+    CircuitBreaker.reset_all()
@@ -11,8 +11,12 @@
 
     Author: Phil Owen, 3/2/2023
 """
+import time
+
 import pytest
 from src.common.pg_impl import PGImplementation
+from src.common.pg_utils_multi import PGUtilsMultiConnect
+from src.common.circuit_breaker import CircuitBreaker
 
 
 @pytest.mark.skip(reason="Local test only")
@@ -111,3 +115,221 @@ def test_is_tropical():
     ret_val = db_info.is_tropical_run('4397-031-nowcast')
 
     assert ret_val
+
+
+@pytest.mark.skip(reason="Local test only")
+def test_remove_adcirc_obs_stations_bulk():
+    """
+    test the SP that removes the obs/mod station data for a list of instance IDs
+
+    :return:
+    """
+    # specify the DB to get a connection
+    db_name: tuple = ('adcirc_obs',)
+
+    # create a DB connection object
+    db_info = PGImplementation(db_name)
+
+    # assign some instance ids
+    instance_ids: list = ['test_instance_1', 'test_instance_2', 'test_instance_3']
+
+    # add a test record for each instance id
+    for instance_id in instance_ids:
+        # create the sql statement to insert a test record
+        sql: str = f"WITH added_record AS (INSERT INTO stations(instance_id) VALUES ('{instance_id}') RETURNING 1) SELECT to_json(count(*)) " \
+                   f"FROM added_record;"
+
+        # make the db request
+        assert db_info.exec_sql('adcirc_obs', sql) == 1
+
+    # remove the records in batches of 2, nothing should fail
+    assert not db_info.remove_obs_mod_db_records_bulk(instance_ids, 2)
+
+
+def test_remove_db_records_bulk_batching(monkeypatch, tmp_path_factory):
+    """
+    tests that bulk removals are split into batches and that failed batches are reported
+
+    :return:
+    """
+    # keep the archiver state out of the source tree
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path_factory.mktemp('state')))
+
+    # create a DB object without any connections
+    db_info = PGImplementation(())
+
+    # storage for the batches executed
+    batches: list = []
+
+    def exec_sql_transaction(_db_name, _sql, params):
+        # save the batch
+        batches.append(params[0])
+
+        # fail the batch that has the bad instance in it
+        return -1 if 'bad' in params[0] else len(params[0])
+
+    # intercept the DB call
+    monkeypatch.setattr(db_info, 'exec_sql_transaction', exec_sql_transaction)
+
+    # remove 5 instances in batches of 2
+    failed: list = db_info.remove_obs_mod_db_records_bulk(['1', '2', 'bad', '4', '5'], 2)
+
+    # check the batches and the failures
+    assert batches == [['1', '2'], ['bad', '4'], ['5']]
+    assert failed == ['bad', '4']
+
+
+def test_execute_prepared_cache():
+    """
+    tests that a statement is prepared once per connection and that parameters are bound, not interpolated
+
+    :return:
+    """
+    class TestCursor:
+        """
+        cursor stand-in that records the statements executed
+        """
+        def __init__(self):
+            self.statements: list = []
+
+        def execute(self, sql, params=None):
+            """
+            saves the statement
+            """
+            self.statements.append((sql, params))
+
+    class TestConnection:
+        """
+        connection stand-in that has a prepared statement cache
+        """
+        def __init__(self):
+            self.prepared_stmts: dict = {}
+
+        @staticmethod
+        def next_stmt_name():
+            """
+            returns the name of the prepared statement
+            """
+            return 'archiver_stmt_1'
+
+    # create the stand-ins
+    conn = TestConnection()
+    cursor = TestCursor()
+
+    # execute the same statement twice, once with an instance name that has a quote in it
+    PGUtilsMultiConnect.execute_prepared(conn, cursor, 'SELECT is_tropical_run($1)', ("4397-031-nowcast%",))
+    PGUtilsMultiConnect.execute_prepared(conn, cursor, 'SELECT is_tropical_run($1)', ("4397-031-o'nowcast%",))
+
+    # the statement should have only been prepared once
+    assert cursor.statements == [('PREPARE archiver_stmt_1 AS SELECT is_tropical_run($1)', None),
+                                 ('EXECUTE archiver_stmt_1 (%s)', ("4397-031-nowcast%",)),
+                                 ('EXECUTE archiver_stmt_1 (%s)', ("4397-031-o'nowcast%",))]
+
+
+def test_db_connection_deadline(monkeypatch, tmp_path_factory):
+    """
+    tests that connecting to an unreachable DB gives up after the connection deadline instead of retrying forever
+
+    :return:
+    """
+    # keep the archiver state out of the source tree
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path_factory.mktemp('state')))
+
+    # point a test DB at a port where nothing is listening
+    monkeypatch.setenv('UNREACHABLE_DB_USERNAME', 'user')
+    monkeypatch.setenv('UNREACHABLE_DB_PASSWORD', 'password')
+    monkeypatch.setenv('UNREACHABLE_DB_DATABASE', 'unreachable')
+    monkeypatch.setenv('UNREACHABLE_DB_HOST', '127.0.0.1')
+    monkeypatch.setenv('UNREACHABLE_DB_PORT', '1')
+
+    # keep the deadline short
+    monkeypatch.setenv('DB_CONNECT_DEADLINE', '2')
+
+    # get the start time
+    start: float = time.monotonic()
+
+    # create a DB connection object. this should not block forever
+    db_info = PGImplementation(('unreachable',))
+
+    # the statement should fail after another connection attempt
+    assert db_info.exec_sql('unreachable', 'SELECT version()') == -1
+
+    # both connection attempts should have given up at the deadline
+    assert time.monotonic() - start < 10
+
+
+def test_commit(monkeypatch):
+    """
+    tests committing the work on a DB connection, and that pooled DBs are left alone
+
+    :return:
+    """
+    # get a pooled and a non-pooled test DB
+    monkeypatch.setenv('COMMIT_DB_POOL_MAX_SIZE', '1')
+
+    # the connections made
+    conns: list = []
+
+    class StandInConnection:
+        """
+        connection stand-in that records its commits
+        """
+        def __init__(self):
+            self.closed: int = 0
+            self.autocommit: bool = False
+            self.commits: int = 0
+
+        def commit(self):
+            """
+            records the commit
+            """
+            self.commits += 1
+
+        def close(self):
+            """
+            closes the connection
+            """
+            self.closed = 1
+
+    monkeypatch.setattr(PGUtilsMultiConnect, 'get_conn_config', staticmethod(lambda db_name: f'dbname={db_name}'))
+    monkeypatch.setattr(PGUtilsMultiConnect, 'connect', lambda self, db_name, conn_str: conns.append(StandInConnection()) or conns[-1])
+
+    # create a DB object with both DBs
+    db_info = PGUtilsMultiConnect('test', ('single', 'commit'), _auto_commit=False)
+
+    # the single connection is committed
+    db_info.commit('single')
+
+    assert db_info.dbs['single'].conn.commits == 1
+
+    # a pooled DB has no connection to commit
+    db_info.commit('commit')
+
+    assert db_info.pools['commit'].get_metrics()['checkouts'] == 0
+
+
+def test_db_down_single_connect(monkeypatch):
+    """
+    tests that a statement against a DB that is down makes a single connection attempt cycle before failing
+
+    :return:
+    """
+    # the connection attempt cycles made, each one fails
+    connects: list = []
+
+    monkeypatch.setattr(PGUtilsMultiConnect, 'get_conn_config', staticmethod(lambda db_name: f'dbname={db_name}'))
+    monkeypatch.setattr(PGUtilsMultiConnect, 'connect', lambda self, db_name, conn_str: connects.append(db_name))
+
+    # start with a fresh breaker
+    CircuitBreaker.reset_all()
+
+    # create a DB object, the first connection fails
+    db_info = PGUtilsMultiConnect('test', ('down',))
+
+    assert db_info.dbs['down'].conn is None and len(connects) == 1
+
+    # the statement makes one more connection attempt cycle and fails
+    assert db_info.exec_sql('down', 'SELECT version()') == -1 and len(connects) == 2
+
+    # clean up
+    CircuitBreaker.reset_all()
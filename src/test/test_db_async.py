@@ -0,0 +1,125 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Test the asyncio DB operations against a stand-in for the Postgres connection pools
+
+    Author: Phil Owen, RENCI.org
+"""
+import asyncio
+
+import pytest
+
+from src.common.pg_impl import PGImplementation
+from src.common.pg_impl_async import PGImplementationAsync
+
+
+class StandInPool:
+    """
+    stand-in for an asyncpg pool that answers the archiver SPs after a short delay
+    """
+    def __init__(self):
+        # init the statements executed and the concurrency tracking
+        self.statements: list = []
+        self.in_flight: int = 0
+        self.peak_in_flight: int = 0
+
+    async def fetchval(self, sql: str, *params):
+        """
+        returns a canned result for the statement
+        """
+        # track the concurrency
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+        # save the statement
+        self.statements.append((sql, params))
+
+        # simulate the round trip
+        await asyncio.sleep(0.05)
+
+        self.in_flight -= 1
+
+        # a failure for the bad instance
+        if str(params[0]).startswith('bad'):
+            raise RuntimeError('Stand-in DB error')
+
+        # return the canned results
+        if sql == PGImplementation.SQL_IS_TROPICAL_RUN:
+            ret_val = {'result': params[0].split('-')[1].isdigit() and len(params[0].split('-')[1]) == 3}
+        elif sql == PGImplementation.SQL_GET_RUN_PROPS:
+            ret_val = [{'run_data': {'downloadurl': 'https://tds/a', 'a': 1}}]
+        else:
+            ret_val = 1
+
+        return ret_val
+
+    async def close(self):
+        """
+        closes the pool
+        """
+
+
+def test_async_remove_instances(monkeypatch, tmp_path):
+    """
+    tests that the instance removals against both DBs are run concurrently
+
+    :return:
+    """
+    # keep the tropical cache out of the way
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path))
+
+    # create the stand-in pools
+    pools: dict = {'apsviz': StandInPool(), 'adcirc_obs': StandInPool()}
+
+    # create the async DB object
+    db_info = PGImplementationAsync(('apsviz', 'adcirc_obs'), _pools=pools)
+
+    # get some instance ids to remove
+    instance_ids: list = [f'{4000 + x}-2024020600-gfsforecast' for x in range(10)] + ['bad-2024020600-gfsforecast']
+
+    # remove them
+    results: dict = asyncio.run(db_info.remove_instances(instance_ids))
+
+    # check the results
+    assert all(results[instance_id] for instance_id in instance_ids[:-1])
+    assert not results['bad-2024020600-gfsforecast']
+
+    # there should have been one call per instance against obs/mod DB, two against the apsviz DB
+    assert len(pools['adcirc_obs'].statements) == 11
+    assert len(pools['apsviz'].statements) == 22
+
+    # the calls should have been in flight at the same time
+    assert pools['apsviz'].peak_in_flight > 1 and pools['adcirc_obs'].peak_in_flight > 1
+
+
+@pytest.mark.parametrize('instance_id, expected', [('4397-031-nowcast', True), ('4356-2023042018-nowcast', False)])
+def test_async_is_tropical_run(monkeypatch, tmp_path, instance_id, expected):
+    """
+    tests the tropical run check and its use of the cache
+
+    :return:
+    """
+    # keep the tropical cache out of the way
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path))
+
+    # create the stand-in pool
+    pool: StandInPool = StandInPool()
+
+    # create the async DB object
+    db_info = PGImplementationAsync(('apsviz',), _pools={'apsviz': pool})
+
+    # check the run twice
+    assert asyncio.run(db_info.is_tropical_run(instance_id)) is expected
+    assert asyncio.run(db_info.is_tropical_run(instance_id)) is expected
+
+    # the second call should have come from the cache
+    assert len(pool.statements) == 1
+
+    # get the run properties, these should come back sorted
+    assert list(asyncio.run(db_info.get_run_props(4356, '2023042018-nowcast')).keys()) == ['a', 'downloadurl']
@@ -0,0 +1,128 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Test the run event listener
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+
+import pytest
+
+from src.archiver.event_listener import RunEventListener
+from src.archiver.rule_handler import RuleHandler
+from src.common.pg_utils_multi import PGUtilsMultiConnect
+
+
+class FakeDBInfo:
+    """
+    Counts the listens.
+    """
+    def __init__(self):
+        """
+        Initializes this class
+        """
+        self.listens: int = 0
+
+    def listen(self, db_name: str, channel: str):
+        """
+        Returns a fake connection.
+        """
+        self.listens += 1
+
+        return f'{db_name}/{channel}'
+
+
+def test_run_events(monkeypatch):
+    """
+    tests the run event payloads and that a failed connection is listened on again
+
+    :return:
+    """
+    # queue some payloads, a connection failure and some more payloads
+    payloads: list = [['4358-2023071612-namforecast', '{"instance_id": "4359-2023071612-namforecast", "event": "expired"}', '../etc',
+                       '{"event": "expired"}', '{bad json'], None, ['4360-2023071612-namforecast']]
+
+    # create the listener
+    db_info: FakeDBInfo = FakeDBInfo()
+    listener: RunEventListener = RunEventListener(_db_info=db_info)
+
+    monkeypatch.setattr(listener, 'get_notifications', lambda timeout: payloads.pop(0))
+
+    # the valid instance ids are received
+    assert listener.wait_for_instance_ids(1) == {'4358-2023071612-namforecast', '4359-2023071612-namforecast'}
+
+    # a connection failure is not an event
+    assert listener.wait_for_instance_ids(1) is None and listener.conn is None
+
+    # the connection is remade
+    assert listener.wait_for_instance_ids(1) == {'4360-2023071612-namforecast'} and db_info.listens == 2
+
+
+def test_targeted_rule_sets(tmp_path, monkeypatch, tmp_path_factory):
+    """
+    tests that the GEOSERVER_* and SWEEP_* rules are limited to the instances in the events
+
+    :return:
+    """
+    # keep the archiver state out of the source tree
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path_factory.mktemp('state')))
+
+    # create some instance directories
+    for instance_id in ['1111', '2222', '3333']:
+        os.makedirs(os.path.join(tmp_path, instance_id))
+
+    # a rule definition with a sweep, a copy and a reconcile rule
+    sweep_rule: dict = {'name': 'Sweep', 'description': 'Sweep.', 'query_criteria_type': 'BY_AGE', 'query_data_type': 'INTEGER',
+                        'query_data_value': 0, 'predicate_type': 'GREATER_THAN_OR_EQUAL_TO', 'action_type': 'SWEEP_REMOVE', 'data_type': 'DIRECTORY',
+                        'source': str(tmp_path), 'destination': 'N/A', 'debug': False}
+
+    rule_defs: dict = {'rule_sets': [{'rule_set_name': 'sweeps', 'rules': [sweep_rule, {**sweep_rule, 'action_type': 'COPY'}]},
+                                     {'rule_set_name': 'reconcile', 'rules': [{**sweep_rule, 'action_type': 'GEOSERVER_RECONCILE'}]}]}
+
+    # get the targeted rule sets
+    rule_sets: list = RunEventListener.get_targeted_rule_sets(rule_defs, {'2222', '4444'})
+
+    assert len(rule_sets) == 1 and rule_sets[0]['rule_set_name'] == 'sweeps (run events)'
+    assert [rule['options'] for rule in rule_sets[0]['rules']] == [{'instance_ids': ['2222', '4444']}]
+
+    # the rule definition is not changed
+    assert 'options' not in sweep_rule
+
+    # run the targeted sweep, only the instance in the event is removed
+    stats: dict = RuleHandler().process_rule_set(rule_sets[0])
+
+    assert stats['swept'] == 1 and stats['failed'] == 0
+    assert sorted(os.listdir(tmp_path)) == ['1111', '3333']
+
+
+@pytest.mark.skip(reason="Local test only")
+def test_db_listen():
+    """
+    tests receiving notifications on a DB channel
+
+    :return:
+    """
+    # create a DB connection object
+    db_info: PGUtilsMultiConnect = PGUtilsMultiConnect('APSViz.Settings', ('apsviz',))
+
+    # create the listener
+    listener: RunEventListener = RunEventListener(_db_info=db_info)
+
+    # listen on the channel
+    assert listener.wait_for_instance_ids(0.1) == set()
+
+    # send a notification
+    db_info.exec_sql('apsviz', f"SELECT pg_notify('{listener.channel}', 'test-instance')")
+
+    # receive it
+    assert listener.wait_for_instance_ids(5) == {'test-instance'}
+
+    # close the listening connection
+    listener.close()
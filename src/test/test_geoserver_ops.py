@@ -18,6 +18,7 @@ import pytest
 from src.test.test_utils import run_rule
 from src.common.geoserver_utils import GeoServerUtils
 from src.common.rule_utils import RuleUtils
+from src.archiver.rule_handler import RuleHandler
 
 # init the full coverage store name (aka instance id e.g., 4303-2023020206-namforecast_maxele63)
 instance_id: str = 'test_store'
@@ -355,3 +356,97 @@ def test_remove_coverage_store():
 
     # check the result
     assert len(ret_val) == 0
+
+
+def test_scan_geoserver_data_dir(monkeypatch, tmp_path):
+    """
+    tests the single pass scan of the geoserver data directory
+
+    :return:
+    """
+    # point the geoserver, obs/mod and state paths at the test directory
+    monkeypatch.setenv('GEOSERVER_PROJ_PATH', str(tmp_path))
+    monkeypatch.setenv('FILESERVER_OBS_PATH', os.path.join(tmp_path, 'obsmod'))
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path))
+
+    # create some product directories for two instances, and a file that should be ignored
+    for name in ['4537-2024020600-gfsforecast_maxele63', '4537-2024020600-gfsforecast_swan_HS_max63', '4538-2024020600-gfsforecast_maxele63']:
+        os.makedirs(os.path.join(tmp_path, 'ADCIRC_2024', name))
+
+    with open(os.path.join(tmp_path, 'ADCIRC_2024', '4539-2024020600-gfsforecast.txt'), 'w', encoding='utf-8') as fh:
+        fh.write('not a directory')
+
+    # get a handle to the geoserver utils and point it at the test data
+    geo_svr: GeoServerUtils = GeoServerUtils()
+    geo_svr.full_geoserver_data_path = os.path.join(tmp_path, 'ADCIRC_2024')
+
+    # no runs are tropical
+    monkeypatch.setattr(geo_svr.db_info, 'is_tropical_run', lambda run_name: False)
+
+    # scan the directory
+    instance_dirs: dict = geo_svr.scan_geoserver_data_dir()
+
+    # check the result
+    assert sorted(instance_dirs.keys()) == ['4537-2024020600-gfsforecast', '4538-2024020600-gfsforecast']
+    assert len(instance_dirs['4537-2024020600-gfsforecast']) == 2
+
+    # create a test rule dict
+    test_rule: dict = {'name': 'Test - Test get run name entities BY_AGE', 'description': 'Test get run name entities BY_AGE.',
+                       'query_criteria_type': 'BY_AGE', 'query_data_type': 'INTEGER', 'query_data_value': -1, 'predicate_type': 'GREATER_THAN',
+                       'action_type': 'GEOSERVER_REMOVE', 'data_type': 'NONE', 'source': 'not_used', 'destination': dest_dir, 'debug': test_mode}
+
+    # get the instances that meet criteria
+    entities: set = geo_svr.get_geoserver_entities_from_dir(RuleUtils().validate_and_convert_to_rule(test_rule))
+
+    # interrogate the result
+    assert entities == {'4537-2024020600-gfsforecast', '4538-2024020600-gfsforecast'}
+
+
+def test_geoserver_workspaces(monkeypatch, tmp_path):
+    """
+    tests running a geoserver rule on several workspaces at once
+
+    :return:
+    """
+    # point the geoserver, obs/mod and state paths at the test directory
+    monkeypatch.setenv('GEOSERVER_PROJ_PATH', str(tmp_path))
+    monkeypatch.setenv('FILESERVER_OBS_PATH', os.path.join(tmp_path, 'obsmod'))
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path))
+
+    # keep the TDS server out of the way
+    monkeypatch.setenv('TDS_URL', '')
+
+    # create the geoserver data directories of two workspaces, one in another data path and both with instance 4001, and the obs/mod data
+    # directories
+    for name in ['data/ADCIRC_2023/4001-2023020600-gfsforecast_maxele63', 'data/ADCIRC_2023/4002-2023020600-gfsforecast_maxele63',
+                 'other/ADCIRC_2024/4001-2023020600-gfsforecast_maxele63', 'other/ADCIRC_2024/4537-2024020600-gfsforecast_maxele63', 'obsmod/4001-2023020600-gfsforecast',
+                 'obsmod/4002-2023020600-gfsforecast', 'obsmod/4537-2024020600-gfsforecast']:
+        os.makedirs(os.path.join(tmp_path, name))
+
+    # get a rule handler and point it at the test data
+    rule_handler: RuleHandler = RuleHandler()
+    rule_handler.geoserver_utils.geoserver_proj_path = os.path.join(tmp_path, 'data')
+    rule_handler.geoserver_utils.fileserver_obs_path = os.path.join(tmp_path, 'obsmod')
+
+    # stand in for the DB and geoserver calls
+    for operation in ['perform_obs_mod_db_ops', 'perform_apsviz_db_ops', 'perform_catalog_db_ops', 'perform_tds_dir_ops']:
+        monkeypatch.setattr(rule_handler.geoserver_utils, operation, lambda rule, instance_id: True)
+
+    monkeypatch.setattr(rule_handler.geoserver_utils.db_info, 'is_tropical_run', lambda run_name: False)
+    monkeypatch.setattr(rule_handler.geoserver_utils, 'get_geoserver_stores_like_instance_id', lambda store_type, instance_id=None: [])
+
+    # create a test rule dict
+    test_rule: dict = {'name': 'Test - Remove geoserver entries BY_AGE', 'description': 'Remove geoserver entries BY_AGE.',
+                       'query_criteria_type': 'BY_AGE', 'query_data_type': 'INTEGER', 'query_data_value': -1, 'predicate_type': 'GREATER_THAN',
+                       'action_type': 'GEOSERVER_REMOVE', 'data_type': 'NONE', 'source': 'NA', 'destination': 'NA', 'debug': False,
+                       'options': {'workspaces': ['ADCIRC_2023', {'workspace': 'ADCIRC_2024', 'proj_path': os.path.join(tmp_path, 'other')}]}}
+
+    # run the rule
+    stats: dict = rule_handler.process_rule(RuleUtils().validate_and_convert_to_rule(test_rule))
+
+    # 5 steps for each of the 4 instances in both workspaces, the shared instance is done in each of them
+    assert stats['failed'] == 0 and stats['removed'] == 20
+
+    # the data directories should be gone
+    assert not os.listdir(os.path.join(tmp_path, 'data/ADCIRC_2023')) and not os.listdir(os.path.join(tmp_path, 'other/ADCIRC_2024'))
+    assert not os.listdir(os.path.join(tmp_path, 'obsmod'))
@@ -0,0 +1,170 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Test the two-phase (plan/execute) processing of geoserver rules
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import json
+
+import pytest
+
+from src.common.geoserver_planner import GeoServerPlanner
+from src.common.pg_impl_async import PGImplementationAsync
+from src.common.rule_utils import RuleUtils
+
+
+def test_plan_and_execute(monkeypatch, tmp_path):
+    """
+    tests building a plan, saving it and replaying it
+
+    :return:
+    """
+    # point the geoserver, obs/mod and state paths at the test directory
+    monkeypatch.setenv('GEOSERVER_PROJ_PATH', str(tmp_path))
+    monkeypatch.setenv('FILESERVER_OBS_PATH', os.path.join(tmp_path, 'obsmod'))
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path))
+
+    # no TDS server in this test
+    monkeypatch.setenv('TDS_URL', '')
+
+    # create the geoserver and obs/mod data directories
+    for name in ['ADCIRC_2024/4537-2024020600-gfsforecast_maxele63', 'ADCIRC_2024/4537-2024020600-gfsforecast_swan_HS_max63',
+                 'ADCIRC_2024/4538-2024020600-gfsforecast_maxele63', 'obsmod/4537-2024020600-gfsforecast', 'obsmod/4538-2024020600-gfsforecast']:
+        os.makedirs(os.path.join(tmp_path, name))
+
+    # get a planner
+    planner: GeoServerPlanner = GeoServerPlanner()
+
+    # point it at the test data
+    planner.geoserver_utils.full_geoserver_data_path = os.path.join(tmp_path, 'ADCIRC_2024')
+    planner.geoserver_utils.fileserver_obs_path = os.path.join(tmp_path, 'obsmod')
+
+    # no runs are tropical
+    monkeypatch.setattr(planner.db_info, 'is_tropical_run', lambda run_name: False)
+
+    # the geoserver stores
+    monkeypatch.setattr(planner.geoserver_utils, 'get_geoserver_stores_like_instance_id',
+                        lambda store_type: [{'name': '4537-2024020600-gfsforecast_maxele63'}, {'name': '4999-2024020600-gfsforecast_maxele63'}]
+                        if store_type == 'coverageStores' else [])
+
+    # save the bulk DB removals and store removals
+    removed: list = []
+
+    monkeypatch.setattr(planner.db_info, 'remove_obs_mod_db_records_bulk', lambda run_names: removed.append(('obs', run_names)) or [])
+    monkeypatch.setattr(planner.db_info, 'remove_run_props_db_image_records_bulk', lambda run_names: removed.append(('props', run_names)) or [])
+    monkeypatch.setattr(planner.db_info, 'remove_catalog_db_records_bulk', lambda run_names: removed.append(('catalog', run_names)) or [])
+    monkeypatch.setattr(planner.geoserver_utils, 'perform_geoserver_store_ops',
+                        lambda rule, store_type, name: removed.append((store_type, name)) or True)
+
+    # create a test rule dict that only builds the plan
+    plan_path: str = os.path.join(tmp_path, 'plan.json')
+
+    test_rule: dict = {'name': 'Test - Plan geoserver removal', 'description': 'Test the geoserver plan.', 'query_criteria_type': 'BY_AGE',
+                       'query_data_type': 'INTEGER', 'query_data_value': -1, 'predicate_type': 'GREATER_THAN', 'action_type': 'GEOSERVER_REMOVE',
+                       'data_type': 'NONE', 'source': 'NA', 'destination': 'NA', 'debug': False, 'options': {'plan': 'build', 'plan_path': plan_path}}
+
+    # build the plan
+    success, stats = planner.process_plan_rule({'moved': 0, 'copied': 0, 'removed': 0, 'swept': 0, 'failed': 0},
+                                               RuleUtils().validate_and_convert_to_rule(dict(test_rule)))
+
+    # nothing should have been done
+    assert success and stats['removed'] == 0 and not removed
+
+    # check the saved plan
+    with open(plan_path, encoding='utf-8') as plan_fh:
+        plan: dict = json.load(plan_fh)
+
+    assert sorted(plan['instances']) == ['4537-2024020600-gfsforecast', '4538-2024020600-gfsforecast']
+    assert len(plan['instances']['4537-2024020600-gfsforecast']['geoserver_dirs']) == 2
+    assert plan['instances']['4537-2024020600-gfsforecast']['stores']['coverageStores'] == ['4537-2024020600-gfsforecast_maxele63']
+
+    # execute the saved plan twice, the replay should find nothing left to do but not fail
+    for _ in range(2):
+        success, stats = planner.process_plan_rule({'moved': 0, 'copied': 0, 'removed': 0, 'swept': 0, 'failed': 0},
+                                                   RuleUtils().validate_and_convert_to_rule(dict(test_rule, options={'plan': 'execute',
+                                                                                                                     'plan_path': plan_path})))
+
+        # 3 DB steps + directories + TDS per instance and one store
+        assert success and stats['failed'] == 0 and stats['removed'] == 11 and stats['swept'] == 2
+
+    # the DB removals should have been done in bulk
+    assert ('obs', ['4537-2024020600-gfsforecast', '4538-2024020600-gfsforecast']) in removed
+
+    # the directories should be gone
+    assert not os.listdir(os.path.join(tmp_path, 'ADCIRC_2024')) and not os.listdir(os.path.join(tmp_path, 'obsmod'))
+
+
+def test_execute_plan_async(monkeypatch, tmp_path):
+    """
+    tests removing the DB records of a plan with the asyncio DB backend
+
+    :return:
+    """
+    # point the geoserver, obs/mod and state paths at the test directory
+    monkeypatch.setenv('GEOSERVER_PROJ_PATH', str(tmp_path))
+    monkeypatch.setenv('FILESERVER_OBS_PATH', os.path.join(tmp_path, 'obsmod'))
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path))
+
+    # no TDS server in this test, and the DB records are removed with the asyncio DB backend
+    monkeypatch.setenv('TDS_URL', '')
+    monkeypatch.setenv('DB_BACKEND', 'async')
+
+    # the statements executed, the ones for the bad instance fail
+    statements: list = []
+
+    class StandInPool:
+        """
+        stand-in for an asyncpg pool
+        """
+        async def fetchval(self, sql: str, *params):
+            """
+            records the statement
+            """
+            statements.append((sql, params))
+
+            if params[0].startswith('bad'):
+                raise RuntimeError('Stand-in DB error')
+
+            return 1
+
+        async def close(self):
+            """
+            closes the pool
+            """
+
+    async def connect(self):
+        # use the stand-in pools
+        self.pools = {'apsviz': StandInPool(), 'adcirc_obs': StandInPool()}
+
+    monkeypatch.setattr(PGImplementationAsync, 'connect', connect)
+
+    # get a planner, the bulk SPs should not be used
+    planner: GeoServerPlanner = GeoServerPlanner()
+
+    monkeypatch.setattr(planner.db_info, 'remove_obs_mod_db_records_bulk', lambda run_names: pytest.fail('The bulk SPs were used.'))
+
+    # create a rule and a plan without any directories or stores
+    rule: RuleUtils.Rule = RuleUtils().validate_and_convert_to_rule({
+        'name': 'Test - Execute geoserver plan', 'description': 'Test the geoserver plan.', 'query_criteria_type': 'BY_AGE',
+        'query_data_type': 'INTEGER', 'query_data_value': -1, 'predicate_type': 'GREATER_THAN', 'action_type': 'GEOSERVER_REMOVE',
+        'data_type': 'NONE', 'source': 'NA', 'destination': 'NA', 'debug': False})
+
+    plan: dict = {'version': GeoServerPlanner.PLAN_VERSION, 'action_type': 'GEOSERVER_REMOVE',
+                  'instances': {instance_id: {'geoserver_dirs': [], 'obs_mod_dir': '', 'tds_path': '',
+                                              'stores': {'coverageStores': [], 'dataStores': []}}
+                                for instance_id in ['4537-2024020600-gfsforecast', 'bad-2024020600-gfsforecast']}}
+
+    # execute the plan
+    _, stats = planner.execute_plan({'moved': 0, 'copied': 0, 'removed': 0, 'swept': 0, 'failed': 0}, rule, plan)
+
+    # the 3 DB steps of each instance were run, the bad instance failed
+    assert len(statements) == 6
+    assert stats['failed'] == 3 and stats['removed'] == 3 + 2 * 2
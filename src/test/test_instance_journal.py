@@ -0,0 +1,167 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Test the durable journal of the geoserver rule steps completed on each instance
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+
+from src.common.instance_journal import InstanceJournal
+from src.common.geoserver_utils import GeoServerUtils
+from src.common.rule_utils import RuleUtils
+
+
+def test_instance_journal(tmp_path):
+    """
+    tests that the completed steps survive a restart
+
+    :return:
+    """
+    # get a journal
+    journal: InstanceJournal = InstanceJournal(journal_path=os.path.join(tmp_path, 'journal.sqlite'))
+
+    # complete a couple of steps
+    journal.mark_step_completed('GEOSERVER_REMOVE', '4537-2024020600-gfsforecast', 'perform_obs_mod_db_ops')
+    journal.mark_step_completed('GEOSERVER_REMOVE', '4537-2024020600-gfsforecast', 'perform_apsviz_db_ops')
+
+    # reopen the journal, as a restarted run would
+    journal = InstanceJournal(journal_path=os.path.join(tmp_path, 'journal.sqlite'))
+
+    # check the result
+    assert journal.get_completed_steps('GEOSERVER_REMOVE', '4537-2024020600-gfsforecast') == {'perform_obs_mod_db_ops', 'perform_apsviz_db_ops'}
+    assert journal.get_pending_instances('GEOSERVER_REMOVE') == {'4537-2024020600-gfsforecast'}
+    assert not journal.get_pending_instances('GEOSERVER_COPY')
+
+    # the instance is done
+    journal.clear_instance('GEOSERVER_REMOVE', '4537-2024020600-gfsforecast')
+
+    assert not journal.get_pending_instances('GEOSERVER_REMOVE')
+
+
+def test_resume_geoserver_rule(monkeypatch, tmp_path):
+    """
+    tests that a rerun of an interrupted geoserver rule only runs the remaining steps
+
+    :return:
+    """
+    # point the geoserver, obs/mod and state paths at the test directory
+    monkeypatch.setenv('GEOSERVER_PROJ_PATH', str(tmp_path))
+    monkeypatch.setenv('FILESERVER_OBS_PATH', os.path.join(tmp_path, 'obsmod'))
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path))
+
+    # keep the TDS server out of the way
+    monkeypatch.setenv('TDS_URL', '')
+
+    # create the geoserver and obs/mod data directories
+    for name in ['ADCIRC_2024/4537-2024020600-gfsforecast_maxele63', 'obsmod/4537-2024020600-gfsforecast']:
+        os.makedirs(os.path.join(tmp_path, name))
+
+    # get a handle to the geoserver utils and point it at the test data
+    geo_svr: GeoServerUtils = GeoServerUtils()
+    geo_svr.full_geoserver_data_path = os.path.join(tmp_path, 'ADCIRC_2024')
+    geo_svr.fileserver_obs_path = os.path.join(tmp_path, 'obsmod')
+
+    # no runs are tropical and there are no stores
+    monkeypatch.setattr(geo_svr.db_info, 'is_tropical_run', lambda run_name: False)
+    monkeypatch.setattr(geo_svr, 'get_geoserver_stores_like_instance_id', lambda store_type, instance_id=None: [])
+
+    # save the steps that were run. the TDS step fails the first time, like a pod that was killed
+    calls: list = []
+
+    def perform_obs_mod_db_ops(_rule, _instance_id):
+        calls.append('perform_obs_mod_db_ops')
+        return True
+
+    def perform_tds_dir_ops(_rule, _instance_id):
+        calls.append('perform_tds_dir_ops')
+        return calls.count('perform_tds_dir_ops') > 1
+
+    monkeypatch.setattr(geo_svr, 'perform_obs_mod_db_ops', perform_obs_mod_db_ops)
+    monkeypatch.setattr(geo_svr, 'perform_apsviz_db_ops', lambda rule, instance_id: True)
+    monkeypatch.setattr(geo_svr, 'perform_catalog_db_ops', lambda rule, instance_id: True)
+    monkeypatch.setattr(geo_svr, 'perform_tds_dir_ops', perform_tds_dir_ops)
+
+    # create a test rule
+    rule: RuleUtils.Rule = RuleUtils().validate_and_convert_to_rule({
+        'name': 'Test - Remove geoserver entries BY_AGE', 'description': 'Remove geoserver entries BY_AGE.', 'query_criteria_type': 'BY_AGE',
+        'query_data_type': 'INTEGER', 'query_data_value': -1, 'predicate_type': 'GREATER_THAN', 'action_type': 'GEOSERVER_REMOVE',
+        'data_type': 'NONE', 'source': 'NA', 'destination': 'NA', 'debug': False})
+
+    # run the rule, the TDS step fails
+    _, stats = geo_svr.process_geoserver_rule({'moved': 0, 'copied': 0, 'removed': 0, 'swept': 0, 'failed': 0}, rule)
+
+    assert stats['failed'] == 1 and not os.path.exists(os.path.join(tmp_path, 'obsmod/4537-2024020600-gfsforecast'))
+
+    # run it again. the geoserver directory is gone but the instance is picked up from the journal
+    _, stats = geo_svr.process_geoserver_rule({'moved': 0, 'copied': 0, 'removed': 0, 'swept': 0, 'failed': 0}, rule)
+
+    # only the TDS step should have been rerun
+    assert stats['failed'] == 0 and stats['removed'] == 1
+    assert calls == ['perform_obs_mod_db_ops', 'perform_tds_dir_ops', 'perform_tds_dir_ops']
+
+    # the instance is done
+    assert geo_svr.journal_key(rule) == 'GEOSERVER_REMOVE/ADCIRC_2024' and not geo_svr.journal.get_pending_instances(geo_svr.journal_key(rule))
+
+
+def test_resume_removed_instances(monkeypatch, tmp_path):
+    """
+    tests that the directories of resumed instances that are already gone are treated as removed, without rescanning for each instance
+
+    :return:
+    """
+    # point the geoserver, obs/mod and state paths at the test directory
+    monkeypatch.setenv('GEOSERVER_PROJ_PATH', str(tmp_path))
+    monkeypatch.setenv('FILESERVER_OBS_PATH', os.path.join(tmp_path, 'obsmod'))
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path))
+
+    # keep the TDS server out of the way
+    monkeypatch.setenv('TDS_URL', '')
+
+    # create the geoserver data directory, the directories of the instances are already gone
+    os.makedirs(os.path.join(tmp_path, 'ADCIRC_2024'))
+
+    # get a handle to the geoserver utils and point it at the test data
+    geo_svr: GeoServerUtils = GeoServerUtils()
+    geo_svr.full_geoserver_data_path = os.path.join(tmp_path, 'ADCIRC_2024')
+    geo_svr.fileserver_obs_path = os.path.join(tmp_path, 'obsmod')
+
+    # there are no stores and the DB steps succeed
+    monkeypatch.setattr(geo_svr, 'get_geoserver_stores_like_instance_id', lambda store_type, instance_id=None: [])
+
+    for step in ['perform_obs_mod_db_ops', 'perform_apsviz_db_ops', 'perform_catalog_db_ops', 'perform_tds_dir_ops']:
+        monkeypatch.setattr(geo_svr, step, lambda rule, instance_id: True)
+
+    # count the scans of the data directory
+    scans: list = []
+    scan_geoserver_data_dir = geo_svr.scan_geoserver_data_dir
+
+    def count_scans(instance_ids=None):
+        scans.append(instance_ids)
+        return scan_geoserver_data_dir(instance_ids)
+
+    monkeypatch.setattr(geo_svr, 'scan_geoserver_data_dir', count_scans)
+
+    # create a test rule, limited to an instance that is not there
+    rule: RuleUtils.Rule = RuleUtils().validate_and_convert_to_rule({
+        'name': 'Test - Remove geoserver entries BY_AGE', 'description': 'Remove geoserver entries BY_AGE.', 'query_criteria_type': 'BY_AGE',
+        'query_data_type': 'INTEGER', 'query_data_value': -1, 'predicate_type': 'GREATER_THAN', 'action_type': 'GEOSERVER_REMOVE',
+        'data_type': 'NONE', 'source': 'NA', 'destination': 'NA', 'debug': False, 'options': {'instance_ids': ['9999-2024020600-gfsforecast']}})
+
+    # an interrupted run completed the DB steps of two instances, and removed their directories before it could record that
+    for instance_id in ['4537-2024020600-gfsforecast', '4538-2024020600-gfsforecast']:
+        for step in ['perform_obs_mod_db_ops', 'perform_apsviz_db_ops', 'perform_catalog_db_ops']:
+            geo_svr.journal.mark_step_completed(geo_svr.journal_key(rule), instance_id, step)
+
+    # run the rule
+    _, stats = geo_svr.process_geoserver_rule({'moved': 0, 'copied': 0, 'removed': 0, 'swept': 0, 'failed': 0}, rule)
+
+    # the instances are done, with one scan for the targeted instance and one for the pending ones
+    assert stats['failed'] == 0 and not geo_svr.journal.get_pending_instances(geo_svr.journal_key(rule))
+    assert len(scans) == 2 and scans[1] == {'4537-2024020600-gfsforecast', '4538-2024020600-gfsforecast'}
@@ -0,0 +1,81 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Test the logging queue and aggregation modes
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import logging
+from logging.handlers import QueueHandler
+
+from src.common.logger import LoggingUtil, LogCounters
+from src.common.rule_utils import RuleUtils
+
+
+def test_queue_logging(tmp_path, monkeypatch):
+    """
+    tests that in queue mode the records are written by a listener and flushed when the listeners are stopped
+
+    :return:
+    """
+    # turn on queue mode
+    monkeypatch.setenv('LOG_QUEUE', 'true')
+
+    # create a logger
+    logger = LoggingUtil.init_logging('APSVIZ.Test.QueueLogging', level=logging.DEBUG, line_format='medium', log_file_path=str(tmp_path))
+
+    # the logger only has the queue handler
+    assert [type(handler) for handler in logger.handlers] == [QueueHandler]
+
+    # log some records
+    for index in range(100):
+        logger.debug('entity %s', index)
+
+    # stopping the listeners writes the queued records
+    LoggingUtil.stop_listeners()
+
+    with open(os.path.join(tmp_path, 'APSVIZ.Test.QueueLogging.log'), encoding='utf-8') as log_fh:
+        lines: list = log_fh.readlines()
+
+    assert len(lines) == 100 and lines[-1].endswith('test_queue_logging(): entity 99\n')
+
+
+def test_log_counters(caplog):
+    """
+    tests that the per-entity events are counted instead of logged
+
+    :return:
+    """
+    # get a logger that is captured
+    logger = logging.getLogger('APSVIZ.Test.LogCounters')
+
+    # create the rule utils with counters that log the progress on every event
+    rule_utils: RuleUtils = RuleUtils(logger)
+    rule_utils.counters = LogCounters(logger, 'test rule', interval=0)
+
+    with caplog.at_level(logging.DEBUG, logger='APSVIZ.Test.LogCounters'):
+        # log some events
+        rule_utils.log_entity('remove file', 'Remove file. Source %s', 'a')
+        rule_utils.log_entity('remove file', 'Remove file. Source %s', 'b')
+        rule_utils.log_entity('failed criteria', 'Entity %s failed', 'c')
+
+        # log the totals
+        rule_utils.counters.close()
+
+        # without counters the events are logged
+        rule_utils.counters = None
+        rule_utils.log_entity('remove file', 'Remove file. Source %s', 'd')
+
+    # check the output
+    messages: list = [record.getMessage() for record in caplog.records]
+
+    assert messages == ['Rule "test rule" progress: remove file: 1', 'Rule "test rule" progress: remove file: 2',
+                        'Rule "test rule" progress: failed criteria: 1, remove file: 2',
+                        'Rule "test rule" totals: failed criteria: 1, remove file: 2', 'Remove file. Source d']
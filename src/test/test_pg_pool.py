@@ -0,0 +1,123 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Test the DB connection pool
+
+    Author: Phil Owen, RENCI.org
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.common.pg_pool import PGConnectionPool
+
+
+class StandInConnection:
+    """
+    connection stand-in
+    """
+    def __init__(self):
+        self.closed: int = 0
+
+    def close(self):
+        """
+        closes the connection
+        """
+        self.closed = 1
+
+
+def test_pool_limits_and_metrics():
+    """
+    tests that worker threads never have more connections checked out than the pool max size
+
+    :return:
+    """
+    # create a pool of at most 2 connections
+    pool: PGConnectionPool = PGConnectionPool('test', StandInConnection, 1, 2)
+
+    # the minimum number of connections should have been made
+    assert pool.get_metrics()['size'] == 1
+
+    def work(_):
+        # get a connection
+        conn = pool.getconn(5)
+
+        assert conn is not None
+
+        # hold on to it for a bit
+        time.sleep(0.1)
+
+        # return it
+        pool.putconn(conn)
+
+    # run more workers than there are connections
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        list(executor.map(work, range(6)))
+
+    # get the pool metrics
+    metrics: dict = pool.get_metrics()
+
+    # check the results
+    assert metrics['checkouts'] == 6
+    assert metrics['peak_in_use'] == 2
+    assert metrics['peak_utilization'] == 1.0
+    assert metrics['in_use'] == 0
+    assert metrics['size'] == 2
+    assert metrics['max_wait'] > 0
+
+
+def test_pool_timeout_and_discard():
+    """
+    tests waiting for a connection that never comes back, and the removal of lost connections
+
+    :return:
+    """
+    # create a pool with a single connection
+    pool: PGConnectionPool = PGConnectionPool('test', StandInConnection, 0, 1)
+
+    # check out the only connection
+    conn = pool.getconn(1)
+
+    # there is nothing left to check out
+    assert pool.getconn(0.1) is None
+    assert pool.get_metrics()['timeouts'] == 1
+
+    # return the connection as lost
+    conn.close()
+    pool.putconn(conn)
+
+    # the lost connection should have been dropped and a new one made
+    new_conn = pool.getconn(1)
+
+    assert new_conn is not None and new_conn is not conn
+
+
+def test_pool_connect_metrics():
+    """
+    tests that the time spent making a new connection is not counted as waiting for the pool
+
+    :return:
+    """
+    def slow_connect():
+        # take a while to connect
+        time.sleep(0.2)
+
+        return StandInConnection()
+
+    # create an empty pool
+    pool: PGConnectionPool = PGConnectionPool('test', slow_connect, 0, 1)
+
+    # check out a connection, which is made on demand
+    pool.putconn(pool.getconn(1))
+
+    # get the pool metrics
+    metrics: dict = pool.get_metrics()
+
+    # the connect time is tracked on its own
+    assert metrics['connects'] == 1 and metrics['avg_connect'] >= 0.2
+    assert metrics['max_wait'] < 0.1
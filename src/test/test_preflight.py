@@ -0,0 +1,122 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Test the pre-flight dependency checks
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import time
+
+from src.archiver.preflight import PreflightChecker
+from src.common.general_utils import GeneralUtils
+
+
+def test_preflight_check_selection():
+    """
+    tests that only the subsystems the rules use are checked
+
+    :return:
+    """
+    # create the checker in debug mode so Slack is not checked
+    checker: PreflightChecker = PreflightChecker(debug=True)
+
+    # get the checks for a geoserver rule file
+    checks: dict = checker.get_checks(GeneralUtils.load_rule_definition_file(os.path.join(os.path.dirname(__file__),
+                                                                                          'test_files/test_geoserver_remove_rule.json')))
+
+    assert {'apsviz DB', 'adcirc_obs DB', 'GeoServer REST', 'GeoServer data path', 'obs/mod data path'} <= set(checks)
+    assert 'Slack' not in checks
+
+    # a file rule only needs its mount points
+    rule_defs: dict = {'rule_sets': [{'rules': [{'action_type': 'COPY', 'data_type': 'FILE', 'source': '/src_mount/a.txt',
+                                                 'destination': '/dest_mount/a.txt'}]}]}
+
+    assert set(checker.get_checks(rule_defs)) == {'path /src_mount', 'path /dest_mount'}
+
+
+def test_preflight_file_rules(tmp_path):
+    """
+    tests running the checks of file rules on real paths, including paths that don't exist yet or anymore
+
+    :return:
+    """
+    # create a file to copy
+    source: str = os.path.join(tmp_path, 'source.txt')
+
+    with open(source, 'w', encoding='utf-8') as source_fh:
+        source_fh.write('test')
+
+    # copy the file to a directory an earlier rule would create, then remove a file that is already gone
+    rule_defs: dict = {'rule_sets': [{'rules': [{'action_type': 'COPY', 'data_type': 'FILE', 'source': source,
+                                                 'destination': os.path.join(tmp_path, 'new_dir', 'dest.txt')},
+                                                {'action_type': 'MOVE', 'data_type': 'DIRECTORY', 'source': os.path.join(tmp_path, 'new_dir'),
+                                                 'destination': os.path.join(tmp_path, 'moved_dir')},
+                                                {'action_type': 'REMOVE', 'data_type': 'FILE', 'source': os.path.join(tmp_path, 'gone.txt')}]}]}
+
+    # run the checks
+    passed, report = PreflightChecker(debug=True).run_checks(rule_defs)
+
+    assert passed and all(': ok (ok' in line for line in report)
+
+    # the mount point is the nearest existing directory
+    assert PreflightChecker.get_mount_point(os.path.join(tmp_path, 'new_dir', 'sub_dir')) == str(tmp_path)
+
+
+
+def test_preflight_missing_mount(tmp_path, monkeypatch):
+    """
+    tests that a file rule on a mount that is not there fails its check instead of passing on a parent directory
+
+    :return:
+    """
+    # a rule that points at a top-level mount that doesn't exist
+    rule_defs: dict = {'rule_sets': [{'rules': [{'action_type': 'REMOVE', 'data_type': 'FILE', 'source': '/nonexistent_mount/data/a.txt'}]}]}
+
+    passed, report = PreflightChecker(debug=True).run_checks(rule_defs)
+
+    assert not passed and any('/nonexistent_mount not found' in line for line in report)
+
+    # a mount below the configured mount root that doesn't exist fails as well
+    monkeypatch.setenv('PREFLIGHT_MOUNT_ROOT', str(tmp_path))
+
+    assert PreflightChecker.get_mount_point(os.path.join(tmp_path, 'missing_mount', 'sub_dir')) == os.path.join(tmp_path, 'missing_mount')
+
+    passed, _ = PreflightChecker(debug=True).run_checks({'rule_sets': [{'rules': [{'action_type': 'REMOVE', 'data_type': 'DIRECTORY',
+                                                                                    'source': os.path.join(tmp_path, 'missing_mount', 'sub_dir')}]}]})
+
+    assert not passed
+
+def test_preflight_timeout(tmp_path, monkeypatch):
+    """
+    tests that the checks run in parallel and a check that hangs fails once its timeout is reached
+
+    :return:
+    """
+    # use a short timeout
+    monkeypatch.setenv('PREFLIGHT_TIMEOUT', '1')
+
+    # create the checker
+    checker: PreflightChecker = PreflightChecker(debug=True)
+
+    # one good path, one missing path and a check that hangs
+    monkeypatch.setattr(checker, 'get_checks', lambda rule_defs: {'good': (checker.check_path, (str(tmp_path),)),
+                                                                  'missing': (checker.check_path, (os.path.join(tmp_path, 'missing'),)),
+                                                                  'hung': (time.sleep, (30,))})
+
+    # run the checks
+    start: float = time.monotonic()
+
+    passed, report = checker.run_checks({})
+
+    # the run fails quickly with a line per check
+    assert not passed and time.monotonic() - start < 5
+    assert report[0].startswith('good: ok')
+    assert report[1].startswith('missing: FAILED')
+    assert report[2] == 'hung: FAILED (timed out after 1s)'
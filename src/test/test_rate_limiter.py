@@ -0,0 +1,74 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Test the adaptive rate limiter
+
+    Author: Phil Owen, RENCI.org
+"""
+import time
+
+from src.common.rate_limiter import AdaptiveRateLimiter
+
+
+def test_rate_adjustments():
+    """
+    tests that the rate goes up with fast responses, down with slow ones or errors and stays within its limits
+
+    :return:
+    """
+    # create a limiter
+    limiter: AdaptiveRateLimiter = AdaptiveRateLimiter(1.0, 8.0, min_rps=0.5, initial_rps=2.0)
+
+    # fast responses raise the rate up to the ceiling
+    for _ in range(200):
+        limiter.record(0.1, True)
+
+    assert limiter.rps == 8.0
+
+    # a slow response halves it
+    limiter.record(1.5, True)
+
+    assert limiter.rps == 4.0
+
+    # the responses to requests that were already in flight don't cut it again
+    limiter.record(1.5, True)
+    limiter.record(1.5, False)
+
+    assert limiter.rps == 4.0
+
+    # once the round trip has passed, an error cuts it again
+    limiter.last_decrease -= 2
+    limiter.record(1.5, False)
+
+    assert limiter.rps == 2.0
+
+    # check the metrics
+    metrics: dict = limiter.get_metrics()
+
+    assert metrics['requests'] == 204 and metrics['errors'] == 2 and metrics['slow'] == 2 and metrics['lowest_rps'] == 2.0
+
+
+def test_rate_pacing():
+    """
+    tests that the requests are spaced out at the current rate
+
+    :return:
+    """
+    # create a limiter at 20 requests per second
+    limiter: AdaptiveRateLimiter = AdaptiveRateLimiter(1.0, 20.0, initial_rps=20.0)
+
+    # get the start time
+    start: float = time.monotonic()
+
+    # make some requests
+    for _ in range(6):
+        limiter.acquire()
+
+    # 5 intervals of 1/20th of a second should have passed
+    assert time.monotonic() - start >= 0.24
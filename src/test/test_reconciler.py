@@ -0,0 +1,99 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Test the reconciliation of run artifacts across the archiver's systems
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+
+from src.common.reconciler import Reconciler
+from src.common.rule_utils import RuleUtils
+
+
+def test_reconcile(monkeypatch, tmp_path):
+    """
+    tests finding and cleaning up the orphaned run artifacts
+
+    :return:
+    """
+    # point the geoserver, obs/mod and state paths at the test directory
+    monkeypatch.setenv('GEOSERVER_PROJ_PATH', str(tmp_path))
+    monkeypatch.setenv('FILESERVER_OBS_PATH', os.path.join(tmp_path, 'obsmod'))
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path))
+
+    # no TDS server in this test
+    monkeypatch.setenv('TDS_URL', '')
+
+    # create the geoserver and obs/mod data directories
+    for name in ['ADCIRC_2024/4540-2024020600-gfsforecast_maxele63', 'obsmod/4540-2024020600-gfsforecast', 'obsmod/4537-2024020600-gfsforecast',
+                 'obsmod/4541-2024020600-gfsforecast']:
+        os.makedirs(os.path.join(tmp_path, name))
+
+    # get a reconciler
+    reconciler: Reconciler = Reconciler()
+
+    # point it at the test data
+    reconciler.geoserver_utils.full_geoserver_data_path = os.path.join(tmp_path, 'ADCIRC_2024')
+    reconciler.geoserver_utils.fileserver_obs_path = os.path.join(tmp_path, 'obsmod')
+
+    # the DB listings. 4538 is a tropical run
+    monkeypatch.setattr(reconciler.db_info, 'get_run_instance_names', lambda: {'4540-2024020600-gfsforecast': False,
+                                                                               '4538-031-gfsforecast': True,
+                                                                               '4539-2024020600-gfsforecast': False})
+    monkeypatch.setattr(reconciler.db_info, 'get_obs_mod_instance_names', lambda: {'4539-2024020600-gfsforecast'})
+
+    # the geoserver stores
+    monkeypatch.setattr(reconciler.geoserver_utils, 'get_geoserver_stores_like_instance_id',
+                        lambda store_type: [{'name': '4539-2024020600-gfsforecast_maxele63'}] if store_type == 'coverageStores' else [])
+
+    # save the bulk DB removals and store removals
+    removed: list = []
+
+    monkeypatch.setattr(reconciler.db_info, 'remove_obs_mod_db_records_bulk', lambda run_names: removed.append(('obs', run_names)) or [])
+    monkeypatch.setattr(reconciler.db_info, 'remove_run_props_db_image_records_bulk', lambda run_names: removed.append(('props', run_names)) or [])
+    monkeypatch.setattr(reconciler.db_info, 'remove_catalog_db_records_bulk', lambda run_names: removed.append(('catalog', run_names)) or [])
+    monkeypatch.setattr(reconciler.geoserver_utils, 'perform_geoserver_store_ops',
+                        lambda rule, store_type, name: removed.append((store_type, name)) or True)
+
+    # create a test rule dict
+    test_rule: dict = {'name': 'Test - Reconcile', 'description': 'Test the reconciliation.', 'query_criteria_type': None, 'query_data_type': None,
+                       'query_data_value': None, 'predicate_type': None, 'action_type': 'GEOSERVER_RECONCILE', 'data_type': None, 'source': 'NA',
+                       'destination': 'NA', 'debug': False}
+
+    # validate and convert the dict into a rule, this one only reports
+    rule: RuleUtils.Rule = RuleUtils().validate_and_convert_to_rule(dict(test_rule))
+
+    assert rule.options is None
+
+    # find the orphans
+    orphans: dict = reconciler.find_orphans(reconciler.get_listings())
+
+    # check the result
+    assert orphans == {'4537-2024020600-gfsforecast': ['obs_mod_dir'], '4538-031-gfsforecast': ['apsviz_db'],
+                       '4539-2024020600-gfsforecast': ['adcirc_obs_db', 'apsviz_db', 'geoserver_stores'],
+                       '4541-2024020600-gfsforecast': ['obs_mod_dir']}
+
+    # run the report only reconciliation
+    success, stats = reconciler.reconcile({'moved': 0, 'copied': 0, 'removed': 0, 'swept': 0, 'failed': 0}, rule)
+
+    # nothing should have been removed
+    assert success and stats['removed'] == 0 and not removed
+
+    # now clean up the orphans
+    rule = RuleUtils().validate_and_convert_to_rule(dict(test_rule, options={'cleanup': True}))
+
+    success, stats = reconciler.reconcile({'moved': 0, 'copied': 0, 'removed': 0, 'swept': 0, 'failed': 0}, rule)
+
+    # the tropical run and the run newer than the data directory should not be touched
+    assert success and stats['failed'] == 0 and stats['removed'] == 5
+    assert sorted(removed) == [('catalog', ['4539-2024020600-gfsforecast']), ('coverageStores', '4539-2024020600-gfsforecast_maxele63'),
+                               ('obs', ['4539-2024020600-gfsforecast']), ('props', ['4539-2024020600-gfsforecast'])]
+    assert not os.path.exists(os.path.join(tmp_path, 'obsmod/4537-2024020600-gfsforecast'))
+    assert os.path.exists(os.path.join(tmp_path, 'obsmod/4541-2024020600-gfsforecast'))
@@ -0,0 +1,123 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Test the cron schedules and the archiver daemon
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import json
+import logging
+import datetime as dt
+
+import pytest
+
+from src.archiver.scheduler import CronSchedule, ArchiverDaemon
+
+
+class FakeArchiver:
+    """
+    Records the rule files it is asked to run.
+    """
+    def __init__(self):
+        """
+        Initializes this class
+        """
+        self.logger = logging.getLogger('APSVIZ.Test.Scheduler')
+        self.runs: list = []
+
+    def run_rule_file(self, infile: str) -> bool:
+        """
+        Records a run.
+        """
+        self.runs.append(infile)
+
+        return True
+
+
+def test_cron_schedule():
+    """
+    tests the cron expression parsing and next run times
+
+    :return:
+    """
+    # every hour on the hour
+    assert CronSchedule('0 * * * *').next_run(dt.datetime(2024, 5, 1, 10, 0, 30)) == dt.datetime(2024, 5, 1, 11, 0)
+
+    # every 15 minutes in a range of hours
+    schedule: CronSchedule = CronSchedule('*/15 8-17 * * *')
+
+    assert schedule.next_run(dt.datetime(2024, 5, 1, 8, 20)) == dt.datetime(2024, 5, 1, 8, 30)
+    assert schedule.next_run(dt.datetime(2024, 5, 1, 17, 45)) == dt.datetime(2024, 5, 2, 8, 0)
+
+    # 02:30 on sundays (7 is also sunday), 2024-05-05 is a sunday
+    assert CronSchedule('30 2 * * 7').next_run(dt.datetime(2024, 5, 1)) == dt.datetime(2024, 5, 5, 2, 30)
+
+    # the day of month or the day of week when both are restricted
+    assert CronSchedule('0 0 10 * 0').next_run(dt.datetime(2024, 5, 6)) == dt.datetime(2024, 5, 10)
+
+    # leap days
+    assert CronSchedule('0 0 29 2 *').next_run(dt.datetime(2024, 3, 1)) == dt.datetime(2028, 2, 29)
+
+    # bad expressions are rejected
+    for expression in ['* * * *', '60 * * * *', '*/0 * * * *', '5-1 * * * *']:
+        with pytest.raises(ValueError):
+            CronSchedule(expression)
+
+
+def test_archiver_daemon(tmp_path):
+    """
+    tests that the rule files are run on their schedules and reloaded when they change
+
+    :return:
+    """
+    # create a rule file with a schedule
+    rule_file: str = os.path.join(tmp_path, 'rules.json')
+
+    with open(rule_file, 'w', encoding='utf-8') as rules_fh:
+        json.dump({'schedule': '0 * * * *', 'rule_sets': []}, rules_fh)
+
+    # create the daemon
+    archiver: FakeArchiver = FakeArchiver()
+    daemon: ArchiverDaemon = ArchiverDaemon(rule_file, archiver)
+
+    # load the schedule
+    now: dt.datetime = dt.datetime(2024, 5, 1, 10, 5)
+
+    daemon.load_schedules(now)
+
+    assert daemon.next_runs[rule_file] == dt.datetime(2024, 5, 1, 11, 0)
+
+    # nothing is due yet
+    assert not daemon.run_due(now)
+
+    # the rule file is run when it is due
+    assert daemon.run_due(dt.datetime(2024, 5, 1, 11, 0)) == [rule_file] and archiver.runs == [rule_file]
+    assert daemon.next_runs[rule_file] > dt.datetime(2024, 5, 1, 11, 0)
+
+    # change the schedule
+    with open(rule_file, 'w', encoding='utf-8') as rules_fh:
+        json.dump({'schedule': '30 * * * *', 'rule_sets': []}, rules_fh)
+
+    os.utime(rule_file, (0, 1000))
+
+    # the new schedule is picked up
+    daemon.load_schedules(now)
+
+    assert daemon.next_runs[rule_file] == dt.datetime(2024, 5, 1, 10, 30)
+
+    # a broken rule file keeps the previous schedule
+    with open(rule_file, 'w', encoding='utf-8') as rules_fh:
+        rules_fh.write('{')
+
+    os.utime(rule_file, (0, 2000))
+
+    daemon.load_schedules(now)
+
+    assert daemon.schedules[rule_file].expression == '30 * * * *'
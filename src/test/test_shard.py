@@ -0,0 +1,111 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Test the shard selection
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+
+import pytest
+
+from src.common.shard import ShardSelector
+from src.archiver.rule_handler import RuleHandler
+
+
+def test_shard_partition(monkeypatch):
+    """
+    tests that every entity is owned by exactly one shard
+
+    :return:
+    """
+    # some instance ids
+    instance_ids: list = [f'{4000 + index}-2024010{index % 9 + 1}00-namforecast' for index in range(200)]
+
+    # get the entities owned by each of 3 shards
+    monkeypatch.setenv('SHARD_COUNT', '3')
+
+    owned: list = []
+
+    for index in range(3):
+        monkeypatch.setenv('SHARD_INDEX', str(index))
+
+        owned.append({instance_id for instance_id in instance_ids if ShardSelector().owns(instance_id)})
+
+    # each entity is owned once and every shard gets some work
+    assert sum(len(shard_ids) for shard_ids in owned) == len(instance_ids)
+    assert set().union(*owned) == set(instance_ids) and all(owned)
+
+    # the indexed Job completion index is used when there is no shard index
+    monkeypatch.delenv('SHARD_INDEX')
+    monkeypatch.setenv('JOB_COMPLETION_INDEX', '2')
+
+    assert {instance_id for instance_id in instance_ids if ShardSelector().owns(instance_id)} == owned[2]
+
+    # the index must be valid
+    monkeypatch.setenv('JOB_COMPLETION_INDEX', '3')
+
+    with pytest.raises(ValueError):
+        ShardSelector()
+
+    # a single shard owns everything
+    monkeypatch.setenv('SHARD_COUNT', '1')
+    monkeypatch.setenv('SHARD_INDEX', '0')
+
+    assert not ShardSelector().enabled and all(ShardSelector().owns(instance_id) for instance_id in instance_ids)
+
+
+def test_shard_stats(tmp_path, monkeypatch):
+    """
+    tests that the stats of the shards are saved and merged
+
+    :return:
+    """
+    # keep the state in the test directory
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path))
+    monkeypatch.setenv('SHARD_COUNT', '2')
+
+    # save the stats of each shard
+    for index, stats in enumerate([{'removed': 3, 'failed': 1}, {'removed': 4, 'swept': 2}]):
+        monkeypatch.setenv('SHARD_INDEX', str(index))
+
+        ShardSelector().save_stats('rules.json', stats)
+
+    # merge them
+    assert ShardSelector().load_merged_stats('rules.json') == ({'removed': 7, 'failed': 1, 'swept': 2}, 2)
+
+
+def test_shard_sweep(tmp_path, monkeypatch, tmp_path_factory):
+    """
+    tests that a sweep only processes the entities of its shard
+
+    :return:
+    """
+    # keep the archiver state out of the source tree
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path_factory.mktemp('state')))
+
+    # create some entities
+    for index in range(20):
+        os.makedirs(os.path.join(tmp_path, f'dir_{index}'))
+
+    # remove the entities of shard 1 of 2
+    monkeypatch.setenv('SHARD_COUNT', '2')
+    monkeypatch.setenv('SHARD_INDEX', '1')
+
+    rule_handler: RuleHandler = RuleHandler()
+
+    stats: dict = rule_handler.process_rule_set({'rule_set_name': 'sweep', 'rules': [
+        {'name': 'Sweep', 'description': 'Sweep.', 'query_criteria_type': 'BY_AGE', 'query_data_type': 'INTEGER', 'query_data_value': 0,
+         'predicate_type': 'GREATER_THAN_OR_EQUAL_TO', 'action_type': 'SWEEP_REMOVE', 'data_type': 'DIRECTORY', 'source': str(tmp_path),
+         'destination': 'N/A', 'debug': False}]})
+
+    # only the entities of shard 0 are left
+    assert stats['swept'] == 1
+    assert sorted(os.listdir(tmp_path)) == sorted(f'dir_{index}' for index in range(20) if rule_handler.shard.get_shard(f'dir_{index}') == 0)
+    assert 0 < len(os.listdir(tmp_path)) < 20
@@ -0,0 +1,82 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Test the background Slack notifier
+
+    Author: Phil Owen, RENCI.org
+"""
+import time
+
+from src.common.slack_notifier import SlackNotifier
+from src.common.circuit_breaker import CircuitBreaker
+
+
+class FakeClient:
+    """
+    Records the messages posted to it, slowly.
+    """
+    def __init__(self):
+        """
+        Initializes this class
+        """
+        self.posted: list = []
+
+    def chat_postMessage(self, channel: str, text: str):  # pylint: disable=invalid-name
+        """
+        Records a message after a delay.
+        """
+        time.sleep(0.2)
+        self.posted.append((channel, text))
+
+
+def test_slack_notifier(monkeypatch):
+    """
+    tests that queueing a message does not wait on Slack and that a flush waits for the messages to be sent
+
+    :return:
+    """
+    # start with a closed Slack circuit
+    CircuitBreaker.reset_all()
+
+    # create a notifier with a fake client
+    notifier: SlackNotifier = SlackNotifier()
+    client: FakeClient = FakeClient()
+
+    monkeypatch.setattr(notifier, 'get_client', lambda token: client)
+
+    # queue some messages
+    start: float = time.monotonic()
+
+    for index in range(3):
+        notifier.enqueue('channel', 'token', f'message {index}')
+
+    # queueing does not wait on the posts
+    assert time.monotonic() - start < 0.2
+
+    # a short flush gives up
+    assert not notifier.flush(0.05)
+
+    # a full flush sends them all, in order
+    assert notifier.flush(5)
+    assert client.posted == [('channel', f'message {index}') for index in range(3)]
+
+
+def test_slack_client_reuse():
+    """
+    tests that one client is kept per token
+
+    :return:
+    """
+    # create a notifier
+    notifier: SlackNotifier = SlackNotifier()
+
+    # the same token gets the same client, with the send timeout
+    assert notifier.get_client('token-1') is notifier.get_client('token-1')
+    assert notifier.get_client('token-1') is not notifier.get_client('token-2')
+    assert notifier.get_client('token-1').timeout == notifier.send_timeout
@@ -0,0 +1,82 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Test the streaming parse of the GeoServer store listings
+
+    Author: Phil Owen, RENCI.org
+"""
+import json
+
+import pytest
+
+from src.common.store_name_parser import StoreNameParser
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 65536])
+def test_store_name_parser(chunk_size):
+    """
+    tests that the store names are found no matter how the listing is split up
+
+    :return:
+    """
+    # create a listing, including names with escapes and members that look like names
+    names: list = [f'{4000 + x}-2024020600-gfsforecast_maxele63' for x in range(50)] + ['4999-quote"d\\name_é']
+
+    listing: str = json.dumps({'coverageStores': {'coverageStore': [{'name': name, 'href': f'https://geoserver/{name}.json'} for name in names]},
+                               'name': 'not a store'})
+
+    # create a parser
+    parser: StoreNameParser = StoreNameParser()
+
+    # feed it the listing in chunks
+    found: list = []
+
+    for index in range(0, len(listing), chunk_size):
+        found.extend(parser.feed(listing[index: index + chunk_size]))
+
+    # check the result
+    assert found == names
+
+
+def test_store_name_parser_empty():
+    """
+    tests the listing of an empty workspace
+
+    :return:
+    """
+    # geoserver returns an empty string when there are no stores
+    assert not StoreNameParser().feed('{"dataStores": ""}')
+
+
+def test_iter_store_names():
+    """
+    tests streaming the names from a response
+
+    :return:
+    """
+    class StandInResponse:
+        """
+        stand-in for a streamed requests response
+        """
+        encoding = 'utf-8'
+        raw = None
+
+        @staticmethod
+        def iter_content(chunk_size):
+            """
+            returns the body in small chunks, splitting a multibyte character
+            """
+            # get the body
+            body: bytes = json.dumps({'dataStores': {'dataStore': [{'name': 'café_1'}, {'name': 'b_2'}]}}, ensure_ascii=False).encode()
+
+            # return it in chunks
+            return [body[index: index + min(chunk_size, 3)] for index in range(0, len(body), min(chunk_size, 3))]
+
+    # check the result
+    assert list(StoreNameParser.iter_store_names(StandInResponse(), 'dataStores')) == ['café_1', 'b_2']
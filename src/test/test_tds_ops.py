@@ -88,3 +88,136 @@ def test_remove_dirs():
     ret_val: bool = tds.remove_dirs('4537-2024020600')
 
     assert ret_val
+
+
+def test_get_tds_data_paths(monkeypatch, tmp_path_factory):
+    """
+    tests resolving the TDS data paths for a list of instances with one lookup
+
+    :return:
+    """
+    # keep the archiver state out of the source tree
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path_factory.mktemp('state')))
+
+    # set the TDS URL
+    monkeypatch.setenv('TDS_URL', 'https://tds.renci.org/thredds/fileServer/')
+
+    # get a TDS utils object
+    tds: TDSUtils = TDSUtils()
+
+    # storage for the lookups made
+    lookups: list = []
+
+    def get_run_download_urls(instance_names: list) -> dict:
+        # save the lookup
+        lookups.append(instance_names)
+
+        # return the URLs, one is on another TDS server and one is not found
+        return {'4537-2024020600-gfsforecast': 'https://tds.renci.org/thredds/fileServer/2024/gfs/2024020600/ec95d/hatteras/gfsforecast/fort.63.nc',
+                '4538-2024020600-gfsforecast': 'https://tds.other.org/thredds/fileServer/2024/gfs/2024020600/fort.63.nc'}
+
+    # intercept the DB lookup
+    monkeypatch.setattr(tds.db_info, 'get_run_download_urls', get_run_download_urls)
+
+    # get the paths
+    paths: dict = tds.get_tds_data_paths(['4537-2024020600-gfsforecast', '4538-2024020600-gfsforecast', '4539-2024020600-gfsforecast'])
+
+    # there should have been one lookup
+    assert len(lookups) == 1
+
+    # check the paths
+    assert paths['4537-2024020600-gfsforecast'] == os.path.join(tds.tds_base_directory, '2024/gfs/2024020600/ec95d/hatteras/gfsforecast/fort.63.nc')
+    assert paths['4538-2024020600-gfsforecast'] == ''
+    assert paths['4539-2024020600-gfsforecast'] == ''
+
+    # the single path lookup should use the resolved path
+    assert tds.get_tds_data_path('4537-2024020600-gfsforecast', ['4537', '2024020600', 'gfsforecast']) == paths['4537-2024020600-gfsforecast']
+    assert len(lookups) == 1
+
+
+def test_failed_tds_lookup(tmp_path, monkeypatch, tmp_path_factory):
+    """
+    tests that a failed TDS path lookup is not saved and that the data is not reported as removed
+
+    :return:
+    """
+    # keep the archiver state out of the source tree
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path_factory.mktemp('state')))
+
+    # set the TDS URL
+    monkeypatch.setenv('TDS_URL', 'https://tds.renci.org/thredds/fileServer/')
+
+    # get a TDS utils object with its data in the test directory
+    tds: TDSUtils = TDSUtils()
+    tds.tds_base_directory = str(tmp_path)
+
+    # create the data directory of a run
+    os.makedirs(os.path.join(tmp_path, '2024', 'gfs', '2024020600', 'ec95d'))
+
+    # the DB lookup of the first batch fails
+    monkeypatch.setattr(tds.db_info, 'exec_prepared', lambda db_name, sql, params=None: -1)
+
+    # the lookup failure is not the same as a run without a URL
+    assert tds.get_tds_data_paths(['4537-2024020600-gfsforecast']) == {'4537-2024020600-gfsforecast': None}
+
+    # the data should not be reported as removed and the failure should not be saved
+    assert not tds.remove_dirs('4537-2024020600-gfsforecast') and not tds.tds_data_paths
+    assert os.path.exists(os.path.join(tmp_path, '2024', 'gfs', '2024020600', 'ec95d'))
+
+    # the DB is back
+    monkeypatch.setattr(tds.db_info, 'exec_prepared', lambda db_name, sql, params=None: {
+        '4537-2024020600-gfsforecast': 'https://tds.renci.org/thredds/fileServer/2024/gfs/2024020600/ec95d'})
+
+    # the path is looked up again and the data is removed
+    assert tds.remove_dirs('4537-2024020600-gfsforecast')
+    assert not os.path.exists(os.path.join(tmp_path, '2024', 'gfs', '2024020600', 'ec95d'))
+
+
+def test_prune_empty_dirs(tmp_path, monkeypatch, tmp_path_factory):
+    """
+    tests the upward pruning of empty directories left behind after run data is removed
+
+    :return:
+    """
+    # keep the archiver state out of the source tree
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path_factory.mktemp('state')))
+
+    # get a TDS utils object
+    tds: TDSUtils = TDSUtils()
+
+    # stop pruning at the test directory
+    tds.prune_boundary = str(tmp_path)
+
+    # create the directories for 3 runs of an advisory, one of which still has data
+    advisory_dir: str = os.path.join(tmp_path, '2024', 'gfs', '2024020600')
+
+    for run_dir in ['ec95d/hatteras/gfsforecast', 'ec95d/ncsc/gfsforecast', 'nc_inundation/hatteras/gfsforecast']:
+        os.makedirs(os.path.join(advisory_dir, run_dir))
+
+    # add some data to the run that is kept
+    with open(os.path.join(advisory_dir, 'nc_inundation', 'hatteras', 'gfsforecast', 'fort.63.nc'), 'w', encoding='UTF-8') as fh:
+        fh.write('test')
+
+    # remove the run directories that have been archived and queue up their parents for pruning
+    for run_dir in ['ec95d/hatteras/gfsforecast', 'ec95d/ncsc/gfsforecast']:
+        os.rmdir(os.path.join(advisory_dir, run_dir))
+
+        tds.pending_prune_dirs.add(os.path.dirname(os.path.join(advisory_dir, run_dir)))
+
+    # prune the empty directories
+    assert tds.prune_pending_dirs()
+
+    # the empty grid directory should be gone, the advisory directory still has data in it
+    assert not os.path.exists(os.path.join(advisory_dir, 'ec95d'))
+    assert os.path.exists(os.path.join(advisory_dir, 'nc_inundation', 'hatteras', 'gfsforecast', 'fort.63.nc'))
+
+    # remove the last run
+    os.remove(os.path.join(advisory_dir, 'nc_inundation', 'hatteras', 'gfsforecast', 'fort.63.nc'))
+    os.rmdir(os.path.join(advisory_dir, 'nc_inundation', 'hatteras', 'gfsforecast'))
+
+    # prune right away
+    assert tds.prune_empty_dirs([os.path.join(advisory_dir, 'nc_inundation', 'hatteras')])
+
+    # everything below the boundary should be gone, but not the boundary itself
+    assert not os.path.exists(os.path.join(tmp_path, '2024'))
+    assert os.path.exists(tmp_path)
@@ -0,0 +1,139 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Test the time budgets and entity priorities
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import copy
+import time
+
+from src.archiver.rule_handler import RuleHandler
+from src.common.time_budget import TimeBudget, EntityPriority
+
+
+def test_time_budget():
+    """
+    tests that the budgets run out and record the deferred work in the run budget
+
+    :return:
+    """
+    # an unlimited run budget with a rule budget that is already used up
+    run_budget: TimeBudget = TimeBudget()
+    rule_budget: TimeBudget = run_budget.child(0.000001)
+
+    time.sleep(0.001)
+
+    assert not run_budget.expired and rule_budget.expired
+
+    # none of the entities are taken, they are deferred in the run budget
+    assert not list(rule_budget.take('rule 1', ['1111', '2222']))
+
+    # a child of a run budget that is used up is too
+    run_budget.deadline = time.monotonic()
+
+    assert run_budget.child(0).expired
+
+    run_budget.defer('rule 2')
+
+    assert run_budget.deferred == {'rule 1': ['1111', '2222'], 'rule 2': None}
+    assert run_budget.get_report() == 'Time budget used up, work deferred to the next run: rule 1: 2 entity(ies) not reached (1111, 2222); ' \
+                                      'rule 2: not started.'
+
+    # an unlimited budget takes everything
+    assert list(TimeBudget().child(0).take('rule 3', ['1111', '2222'])) == ['1111', '2222']
+
+
+def test_entity_priority(tmp_path, monkeypatch):
+    """
+    tests ordering the entities
+
+    :return:
+    """
+    # create entities with different ages, sizes and file counts
+    entities: dict = {}
+
+    for name, file_sizes in [('small', [10]), ('many_files', [100] * 10), ('big', [800, 800])]:
+        os.makedirs(os.path.join(tmp_path, name))
+
+        for index, file_size in enumerate(file_sizes):
+            with open(os.path.join(tmp_path, name, f'{index}.dat'), 'wb') as data_fh:
+                data_fh.write(b'0' * file_size)
+
+        entities[name] = [os.path.join(tmp_path, name)]
+
+        # give each entity its own change time
+        time.sleep(0.01)
+
+    # an entity whose data is gone
+    entities['gone'] = [os.path.join(tmp_path, 'gone')]
+
+    assert EntityPriority.get_usage(entities['many_files']) == (1000, 10)
+
+    # check each priority
+    assert EntityPriority.order(entities, 'none') == ['small', 'many_files', 'big', 'gone']
+    assert EntityPriority.order(entities, 'oldest') == ['gone', 'small', 'many_files', 'big']
+    assert EntityPriority.order(entities, 'largest') == ['gone', 'big', 'many_files', 'small']
+    assert EntityPriority.order(entities, 'reclaim_rate') == ['gone', 'big', 'many_files', 'small']
+
+    # the rule option wins over the default, unknown priorities are none
+    monkeypatch.setenv('ENTITY_PRIORITY', 'largest')
+
+    assert EntityPriority.get_priority(None) == 'largest'
+    assert EntityPriority.get_priority({'priority': 'Oldest'}) == 'oldest'
+    assert EntityPriority.get_priority({'priority': 'newest'}) == 'none'
+
+
+def test_budgeted_sweep(tmp_path, monkeypatch, tmp_path_factory):
+    """
+    tests a sweep that runs out of time and a rule that is not started
+
+    :return:
+    """
+    # keep the archiver state out of the source tree
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path_factory.mktemp('state')))
+
+    # create some directories to sweep
+    for entity in ['1111', '2222']:
+        os.makedirs(os.path.join(tmp_path, entity))
+
+        # give each entity its own change time
+        time.sleep(0.01)
+
+    # a sweep rule with a tiny time budget
+    rule: dict = {'name': 'Budgeted sweep', 'description': 'Sweep.', 'query_criteria_type': 'BY_AGE', 'query_data_type': 'INTEGER',
+                  'query_data_value': 0, 'predicate_type': 'GREATER_THAN_OR_EQUAL_TO', 'action_type': 'SWEEP_REMOVE', 'data_type': 'DIRECTORY',
+                  'source': str(tmp_path), 'destination': 'N/A', 'debug': False, 'options': {'time_budget': 0.000001, 'priority': 'oldest'}}
+
+    # run the rule, it is out of time before the first entity
+    rule_handler: RuleHandler = RuleHandler()
+
+    stats: dict = rule_handler.process_rule_set({'rule_set_name': 'budget', 'rules': [copy.deepcopy(rule)]})
+
+    assert stats['failed'] == 0 and sorted(os.listdir(tmp_path)) == ['1111', '2222']
+    assert rule_handler.budget.deferred == {'Budgeted sweep': ['1111', '2222']}
+
+    # with the run out of time the rule is not started
+    rule_handler.budget = TimeBudget(0.000001)
+
+    time.sleep(0.001)
+
+    del rule['options']
+
+    rule_handler.process_rule_set({'rule_set_name': 'budget', 'rules': [copy.deepcopy(rule)]})
+
+    assert rule_handler.budget.deferred == {'Budgeted sweep': None} and len(os.listdir(tmp_path)) == 2
+
+    # with the time, the sweep is run
+    rule_handler.budget = TimeBudget()
+
+    stats = rule_handler.process_rule_set({'rule_set_name': 'budget', 'rules': [copy.deepcopy(rule)]})
+
+    assert stats['swept'] == 1 and not os.listdir(tmp_path)
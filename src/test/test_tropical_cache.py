@@ -0,0 +1,67 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Test the persistent tropical run cache
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import time
+
+from src.common.tropical_cache import TropicalRunCache
+
+
+def test_tropical_cache(tmp_path):
+    """
+    tests the storage and retrieval of tropical run classifications
+
+    :return:
+    """
+    # get the path to a test cache file
+    cache_path: str = os.path.join(tmp_path, 'test_cache.sqlite')
+
+    # create a cache that never expires
+    cache: TropicalRunCache = TropicalRunCache(cache_path=cache_path, ttl=0)
+
+    # nothing should be found in a new cache
+    assert cache.get('4397-031-nowcast') is None
+
+    # add a tropical and a synoptic run
+    cache.put('4397-031-nowcast', True)
+    cache.put('4356-2023042018-nowcast', False)
+
+    # check the values
+    assert cache.get('4397-031-nowcast') is True
+    assert cache.get('4356-2023042018-nowcast') is False
+
+    # the cache should survive being reopened
+    cache = TropicalRunCache(cache_path=cache_path, ttl=0)
+
+    assert cache.get('4397-031-nowcast') is True
+
+
+def test_tropical_cache_ttl(tmp_path):
+    """
+    tests the expiration of tropical run classifications
+
+    :return:
+    """
+    # create a cache with a short time to live
+    cache: TropicalRunCache = TropicalRunCache(cache_path=os.path.join(tmp_path, 'test_cache.sqlite'), ttl=1)
+
+    # add a run
+    cache.put('4397-031-nowcast', True)
+
+    assert cache.get('4397-031-nowcast') is True
+
+    # let the entry expire
+    time.sleep(1.1)
+
+    # the entry should no longer be returned
+    assert cache.get('4397-031-nowcast') is None
@@ -0,0 +1,228 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Test the work locks
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+
+import pytest
+import psycopg2
+
+from src.common.work_lock import WorkLock
+from src.common.pg_impl import PGImplementation
+from src.archiver.rule_handler import RuleHandler
+
+
+class FakeDBInfo:
+    """
+    Grants or refuses the advisory locks.
+    """
+    def __init__(self, lock_result):
+        """
+        Initializes this class
+        """
+        self.lock_result = lock_result
+        self.unlocked: list = []
+
+    def try_advisory_lock(self, lock_id: int):
+        """
+        Returns the configured result.
+        """
+        assert isinstance(lock_id, int)
+
+        return self.lock_result
+
+    def advisory_unlock(self, lock_id: int) -> bool:
+        """
+        Records the release.
+        """
+        self.unlocked.append(lock_id)
+
+        return True
+
+
+def test_file_lock(tmp_path, monkeypatch):
+    """
+    tests the file locks used when there is no DB
+
+    :return:
+    """
+    # keep the lock files in the test directory
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path))
+
+    # create the lock
+    work_lock: WorkLock = WorkLock()
+
+    with work_lock.hold('rule_set/test') as acquired:
+        # the lock is obtained
+        assert acquired
+
+        # another thread of this process can't get it
+        assert not WorkLock().acquire('rule_set/test')
+
+        # another runner can't lock the file
+        assert work_lock.lock_file('rule_set/test') is None
+
+    # the lock was released. take it again, as a runner running the rule set in the default shard would
+    lock_fd = work_lock.lock_file('rule_set/0-of-1/test')
+
+    assert lock_fd is not None
+
+    # record the rule sets that are run
+    run_rules: list = []
+
+    monkeypatch.setattr(RuleHandler, 'process_rules', lambda self, rules: run_rules.append(rules) or {})
+
+    # a runner holding the lock file blocks the rule set, which is skipped
+    RuleHandler().process_rule_set({'rule_set_name': 'test', 'rules': [{'name': 'test rule'}]})
+
+    assert not run_rules
+
+    os.close(lock_fd)
+
+    # with the lock free, the rule set is run
+    RuleHandler().process_rule_set({'rule_set_name': 'test', 'rules': [{'name': 'test rule'}]})
+
+    assert run_rules == [[{'name': 'test rule'}]]
+
+    # locking can be turned off
+    monkeypatch.setenv('WORK_LOCKS', 'false')
+
+    with WorkLock().hold('rule_set/test') as acquired, WorkLock().hold('rule_set/test') as acquired_again:
+        assert acquired and acquired_again
+
+
+def test_db_lock(tmp_path, monkeypatch):
+    """
+    tests the DB advisory locks and the fall back to file locks
+
+    :return:
+    """
+    # keep the lock files in the test directory
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path))
+
+    # the DB lock is held by another runner
+    assert not WorkLock(_db_info=FakeDBInfo(False)).acquire('geoserver/1234')
+
+    # the DB lock is obtained and released
+    db_info: FakeDBInfo = FakeDBInfo(True)
+
+    with WorkLock(_db_info=db_info).hold('geoserver/1234') as acquired:
+        assert acquired
+
+    assert db_info.unlocked == [WorkLock.get_lock_id('geoserver/1234')]
+
+    # the DB can't be used so a file lock is used
+    work_lock: WorkLock = WorkLock(_db_info=FakeDBInfo(None))
+
+    with work_lock.hold('geoserver/1234') as acquired:
+        assert acquired and work_lock.lock_file('geoserver/1234') is None
+
+
+
+class FakeLockConn:
+    """
+    A DB connection that can be lost.
+    """
+    def __init__(self):
+        """
+        Initializes this class
+        """
+        self.closed: int = 0
+        self.autocommit: bool = False
+
+    def close(self):
+        """
+        Closes the connection.
+        """
+        self.closed = 1
+
+
+def test_lock_connection(monkeypatch, tmp_path_factory):
+    """
+    tests that the advisory locks are held on a dedicated connection and taken again when it is lost
+
+    :return:
+    """
+    # keep the archiver state out of the source tree
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path_factory.mktemp('state')))
+
+    # create a DB object with an apsviz DB that is not connected
+    db_info = PGImplementation(())
+    db_info.dbs['apsviz'] = db_info.db_info_tpl('apsviz', 'conn str', None)
+
+    # the connections made, and the connection holding each lock on the server
+    conns: list = []
+    server_locks: dict = {}
+
+    monkeypatch.setattr(db_info, 'connect', lambda db_name, conn_str: conns.append(FakeLockConn()) or conns[-1])
+
+    def execute_stmt(conn, sql_stmt, params, **_kwargs):
+        # a lost connection fails
+        if conn.closed:
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+
+        # the DB releases the locks of closed sessions
+        if params[0] in server_locks and server_locks[params[0]].closed:
+            del server_locks[params[0]]
+
+        # take or release the lock
+        if sql_stmt == PGImplementation.SQL_TRY_ADVISORY_LOCK:
+            return server_locks.setdefault(params[0], conn) is conn
+
+        return server_locks.pop(params[0], None) is conn
+
+    monkeypatch.setattr(db_info, 'execute_stmt', execute_stmt)
+
+    # the shared connection is not used for locks
+    monkeypatch.setattr(db_info, 'run_sql', lambda *args, **kwargs: pytest.fail('The shared connection was used.'))
+
+    # the lock is taken on a connection of its own
+    assert db_info.try_advisory_lock(1) is True and len(conns) == 1 and conns[0].autocommit
+
+    # a lock held by another runner is refused
+    server_locks[2] = FakeLockConn()
+
+    assert db_info.try_advisory_lock(2) is False
+
+    # the lock connection is lost. the next lock reconnects and the held lock is taken again
+    conns[0].close()
+
+    assert db_info.try_advisory_lock(3) is True and len(conns) == 2
+    assert server_locks[1] is conns[1] and server_locks[3] is conns[1]
+
+    # the locks are released on the connection that holds them, once
+    assert db_info.advisory_unlock(1) and 1 not in server_locks
+    assert not db_info.advisory_unlock(1)
+
+
+@pytest.mark.skip(reason="Local test only")
+def test_advisory_locks():
+    """
+    tests that a DB advisory lock held by one connection can't be taken by another
+
+    :return:
+    """
+    # create two DB connection objects, each is a runner
+    runner_1 = PGImplementation(('apsviz',))
+    runner_2 = PGImplementation(('apsviz',))
+
+    # get the lock id
+    lock_id: int = WorkLock.get_lock_id('geoserver/test')
+
+    # the first runner gets the lock, the second does not
+    assert runner_1.try_advisory_lock(lock_id) is True
+    assert runner_2.try_advisory_lock(lock_id) is False
+
+    # once released, the second runner gets it
+    assert runner_1.advisory_unlock(lock_id)
+    assert runner_2.try_advisory_lock(lock_id) is True
+    assert runner_2.advisory_unlock(lock_id)
@@ -0,0 +1,187 @@
+# SPDX-FileCopyrightText: 2022 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2023 Renaissance Computing Institute. All rights reserved.
+# SPDX-FileCopyrightText: 2024 Renaissance Computing Institute. All rights reserved.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-License-Identifier: LicenseRef-RENCI
+# SPDX-License-Identifier: MIT
+
+"""
+    Test the work queue
+
+    Author: Phil Owen, RENCI.org
+"""
+import os
+import copy
+
+import pytest
+
+from src.archiver.queue_worker import QueueWorker
+from src.archiver.rule_handler import RuleHandler
+from src.common.pg_impl import PGImplementation
+from src.common.work_queue import WorkQueue
+
+
+class FakeQueueDB:
+    """
+    Keeps the work queue table in memory.
+    """
+    def __init__(self):
+        """
+        Initializes this class
+        """
+        self.tasks: list = []
+
+    def enqueue_work_tasks(self, rule: dict, entities: list) -> int:
+        """
+        Adds the tasks that are not already queued.
+        """
+        # get the unfinished tasks of the rule
+        queued: set = {task['entity'] for task in self.tasks if task['rule']['name'] == rule['name'] and task['status'] in ('pending', 'claimed')}
+
+        # get the entities to add
+        added: list = [entity for entity in entities if entity not in queued]
+
+        for entity in added:
+            self.tasks.append({'id': len(self.tasks) + 1, 'rule': copy.deepcopy(rule), 'entity': entity, 'attempts': 0, 'status': 'pending',
+                               'worker': None, 'result': None})
+
+        return len(added)
+
+    def claim_work_task(self, worker: str, lease: int, max_attempts: int):
+        """
+        Claims the first pending task.
+        """
+        assert lease > 0 and max_attempts > 0
+
+        for task in self.tasks:
+            if task['status'] == 'pending':
+                task.update(status='claimed', worker=worker, attempts=task['attempts'] + 1)
+
+                return {key: task[key] for key in ('id', 'rule', 'entity', 'attempts')}
+
+        return None
+
+    def complete_work_task(self, task_id: int, worker: str, success: bool, result: dict, *, max_attempts: int) -> bool:
+        """
+        Records the result of a task.
+        """
+        task: dict = self.tasks[task_id - 1]
+
+        if task['worker'] != worker or task['status'] != 'claimed':
+            return False
+
+        task.update(status='done' if success else 'pending' if task['attempts'] < max_attempts else 'failed', result=result)
+
+        return True
+
+
+def test_work_queue(tmp_path, monkeypatch, tmp_path_factory):
+    """
+    tests queueing the entities of a sweep rule and running them with several workers
+
+    :return:
+    """
+    # keep the archiver state out of the source tree
+    monkeypatch.setenv('ARCHIVER_STATE_PATH', str(tmp_path_factory.mktemp('state')))
+
+    # create some directories to sweep
+    source: str = os.path.join(tmp_path, 'source')
+
+    for entity in ['1111', '2222', '3333', '4444']:
+        os.makedirs(os.path.join(source, entity))
+
+    # a rule set with a sweep rule
+    rule: dict = {'name': 'Queued sweep', 'description': 'Sweep.', 'query_criteria_type': 'BY_AGE', 'query_data_type': 'INTEGER',
+                  'query_data_value': 0, 'predicate_type': 'GREATER_THAN_OR_EQUAL_TO', 'action_type': 'SWEEP_REMOVE', 'data_type': 'DIRECTORY',
+                  'source': source, 'destination': 'N/A', 'debug': False}
+
+    # create the queue
+    queue_db: FakeQueueDB = FakeQueueDB()
+
+    monkeypatch.setattr(RuleHandler, 'work_queue', WorkQueue(_db_info=queue_db))
+
+    # in enqueue mode the entities are queued instead of removed
+    monkeypatch.setenv('WORK_QUEUE', 'enqueue')
+
+    stats: dict = RuleHandler().process_rule_set({'rule_set_name': 'queue', 'rules': [copy.deepcopy(rule)]})
+
+    assert stats['failed'] == 0 and stats['swept'] == 0
+    assert sorted(task['entity'] for task in queue_db.tasks) == ['1111', '2222', '3333', '4444']
+    assert len(os.listdir(source)) == 4
+
+    # queueing again does not add the entities already queued
+    RuleHandler().process_rule_set({'rule_set_name': 'queue', 'rules': [copy.deepcopy(rule)]})
+
+    assert len(queue_db.tasks) == 4
+
+    # the workers run the rules
+    monkeypatch.delenv('WORK_QUEUE')
+
+    # the first worker gets stopped after a task
+    first_worker: QueueWorker = QueueWorker()
+
+    monkeypatch.setattr(first_worker.rule_handler, 'process_rule', lambda the_rule, process_rule=first_worker.rule_handler.process_rule:
+                        (first_worker.stop(), process_rule(the_rule))[1])
+
+    assert first_worker.run()['tasks'] == 1
+
+    # the second worker runs the rest
+    worker_stats: dict = QueueWorker().run()
+
+    assert worker_stats['tasks'] == 3 and worker_stats['swept'] == 3 and worker_stats['failed'] == 0
+
+    # all the entities were removed and the tasks are done
+    assert not os.listdir(source)
+    assert all(task['status'] == 'done' and task['rule']['action_type'] == 'SWEEP_REMOVE' for task in queue_db.tasks)
+
+
+def test_failed_task(tmp_path):
+    """
+    tests that a task that fails is retried until it used up its attempts
+
+    :return:
+    """
+    # create the queue with a task whose rule is not valid
+    queue_db: FakeQueueDB = FakeQueueDB()
+
+    queue_db.enqueue_work_tasks({'name': 'bad rule', 'source': str(tmp_path)}, ['1111'])
+
+    # run the task
+    worker: QueueWorker = QueueWorker()
+
+    worker.rule_handler.work_queue = WorkQueue(_db_info=queue_db)
+
+    stats: dict = worker.run()
+
+    # it was tried 3 times
+    assert stats['tasks'] == 3 and stats['failed'] == 3
+    assert queue_db.tasks[0]['status'] == 'failed' and queue_db.tasks[0]['attempts'] == 3
+
+
+@pytest.mark.skip(reason="Local test only")
+def test_db_work_queue():
+    """
+    tests queueing, claiming and completing tasks in the apsviz DB. src/sql/apsviz_work_queue.sql must be installed.
+
+    :return:
+    """
+    # create a DB connection object for each worker
+    db_info_1 = PGImplementation(('apsviz',))
+    db_info_2 = PGImplementation(('apsviz',))
+
+    # queue two tasks
+    rule: dict = {'name': 'test work queue rule', 'action_type': 'SWEEP_REMOVE'}
+
+    assert db_info_1.enqueue_work_tasks(rule, ['test-1', 'test-2']) == 2
+
+    # the workers each claim a different task
+    task_1 = db_info_1.claim_work_task('worker-1', 60, 3)
+    task_2 = db_info_2.claim_work_task('worker-2', 60, 3)
+
+    assert task_1['entity'] != task_2['entity']
+
+    # a worker can only complete its own task
+    assert not db_info_2.complete_work_task(task_1['id'], 'worker-2', True, {}, max_attempts=3)
+    assert db_info_1.complete_work_task(task_1['id'], 'worker-1', True, {}, max_attempts=3)
+    assert db_info_2.complete_work_task(task_2['id'], 'worker-2', True, {}, max_attempts=3)